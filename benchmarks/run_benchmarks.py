@@ -0,0 +1,241 @@
+"""
+Benchmark de vazão do pipeline de geração (etapas 1 → 2a → 2b → 3 → 4) e da avaliação Z3.
+
+Para cada tamanho de entrada as etapas rodam em sequência, cada uma em um processo próprio
+(para medir o pico de RSS isoladamente), usando a saída da etapa anterior como entrada e o
+backend simulado (`mock_backend.MockBackend`) no lugar da API. O resultado é gravado em JSON
+em `benchmarks/results/`, para comparar execuções entre commits.
+
+Uso:
+    python benchmarks/run_benchmarks.py --sizes 100 10000
+    python benchmarks/run_benchmarks.py --sizes 1000000 --stages stage_2a stage_3
+    python benchmarks/run_benchmarks.py --sizes 100 --baseline benchmarks/results/<arquivo>.json
+"""
+import argparse
+import contextlib
+import importlib
+import json
+import logging
+import math
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).parent.parent
+for path in (PROJECT_ROOT / "dataset_generation" / "src",
+             PROJECT_ROOT / "dataset_generation" / "src" / "pipeline",
+             PROJECT_ROOT / "model_evaluation"):
+    sys.path.append(str(path))
+
+# --- CONFIGURAÇÃO DO BENCHMARK ---
+DEFAULT_SIZES = [100, 10000]
+STAGES = ["stage_1", "stage_2a", "stage_2b", "stage_3", "stage_4", "streaming", "z3_collect", "z3_consolidate"]
+RESULTS_DIR = PROJECT_ROOT / "benchmarks" / "results"
+Z3_MODEL_NAME = 'gemini-2.5-flash'
+# ------------------------------------
+
+def _count_lines(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return sum(1 for _ in f)
+
+def _stage_1(size, workdir, key_manager):
+    stage_1 = importlib.import_module("1_generate_sentence_banks")
+    num_rules = len(stage_1.LOGIC_RULES_CONFIG['PL'])
+    stage_1.run_stage_1(workdir / "stage_1.jsonl", key_manager, num_instances=math.ceil(size / num_rules))
+    return _count_lines(workdir / "stage_1.jsonl")
+
+def _stage_2a(size, workdir, key_manager):
+    stage_2 = importlib.import_module("2_naturalize_contexts")
+    stage_2.run_stage_2a(workdir / "stage_1.jsonl", workdir / "stage_2a.jsonl", workdir / "stage_2a_banks.arrow")
+    return _count_lines(workdir / "stage_2a.jsonl")
+
+def _stage_2b(size, workdir, key_manager):
+    stage_2 = importlib.import_module("2_naturalize_contexts")
+    stage_2.run_stage_2b(workdir / "stage_2a.jsonl", workdir / "stage_2b.jsonl", key_manager)
+    return _count_lines(workdir / "stage_2b.jsonl")
+
+def _stage_3(size, workdir, key_manager):
+    stage_3 = importlib.import_module("3_finalize_bqa")
+    stage_3.run_stage_3(workdir / "stage_2b.jsonl", workdir / "output" / "BQA", workdir / "stage_2a_banks.arrow")
+    return sum(len(json.load(open(path, encoding='utf-8'))["samples"])
+               for path in (workdir / "output" / "BQA").rglob("data_instances.json"))
+
+def _stage_4(size, workdir, key_manager):
+    stage_4 = importlib.import_module("4_finalize_mcqa")
+    stage_4.run_stage_4(workdir / "stage_2b.jsonl", workdir / "output" / "MCQA", workdir / "stage_4.jsonl", key_manager,
+                        banks_path=workdir / "stage_2a_banks.arrow")
+    return _count_lines(workdir / "stage_4.jsonl")
+
+def _streaming(size, workdir, key_manager):
+    # Etapas 1 a 4 sobrepostas, em pastas próprias para não misturar com os artefatos das etapas isoladas.
+    streaming = importlib.import_module("run_streaming_pipeline")
+    num_rules = len(importlib.import_module("config").LOGIC_RULES_CONFIG['PL'])
+    pipeline = streaming.run_streaming_pipeline(key_manager, workdir / "streaming", workdir / "streaming" / "BQA",
+                                                workdir / "streaming" / "MCQA", num_instances=math.ceil(size / num_rules))
+    return pipeline.num_samples()[1]
+
+def _z3_tasks(workdir):
+    import pandas as pd
+    evaluator = importlib.import_module("1_evaluate_z3")
+    rows = []
+    with open(workdir / "stage_2b.jsonl", 'r', encoding='utf-8') as f:
+        for sample_id, line in enumerate(f):
+            data = json.loads(line)
+            rows.append({"sample_id": sample_id, "rule": data["rule"],
+                         "full_prompt": evaluator.build_formalization_prompt(data["natural_context"])})
+    return evaluator, pd.DataFrame(rows)
+
+def _z3_collect(size, workdir, key_manager):
+    evaluator, df_tasks = _z3_tasks(workdir)
+    os.makedirs(workdir / "z3_raw_results", exist_ok=True)
+    evaluator.collect_model_results(df_tasks, Z3_MODEL_NAME, key_manager, workdir / "z3_raw_results")
+    return len(df_tasks)
+
+def _z3_consolidate(size, workdir, key_manager):
+    evaluator, df_tasks = _z3_tasks(workdir)
+    df_final = evaluator.consolidate_results(df_tasks, [Z3_MODEL_NAME], workdir / "z3_raw_results")
+    return len(df_final)
+
+STAGE_RUNNERS = {
+    "stage_1": _stage_1, "stage_2a": _stage_2a, "stage_2b": _stage_2b, "stage_3": _stage_3,
+    "stage_4": _stage_4, "streaming": _streaming, "z3_collect": _z3_collect, "z3_consolidate": _z3_consolidate,
+}
+
+STAGE_MODULES = {
+    "stage_1": "1_generate_sentence_banks", "stage_2a": "2_naturalize_contexts", "stage_2b": "2_naturalize_contexts",
+    "stage_3": "3_finalize_bqa", "stage_4": "4_finalize_mcqa", "streaming": "run_streaming_pipeline", "z3_collect": "1_evaluate_z3", "z3_consolidate": "1_evaluate_z3",
+}
+
+def _run_stage_in_child(stage, size, workdir, options, queue):
+    logging.disable(logging.WARNING)
+    os.environ['TQDM_DISABLE'] = '1'
+    import engine
+    from mock_backend import MockBackend
+
+    backend = MockBackend(latency=options["latency"], seed=options["seed"])
+    engine.set_backend(backend)
+    quota = {'rpm': options["rpm"], 'tpm': options["tpm"]}
+    key_manager = engine.ApiKeyManager(keys=[f"bench-key-{i}" for i in range(options["keys"])],
+                                       quotas={model_name: quota for model_name in engine.DEFAULT_MODEL_QUOTAS},
+                                       fallback_quota=quota)
+
+    result = {"stage": stage, "size": size}
+    try:
+        # O import fica fora da medição; as chamadas seguintes a import_module vêm do cache de módulos.
+        importlib.import_module(STAGE_MODULES[stage])
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+        queue.put(result)
+        return
+
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+            items = STAGE_RUNNERS[stage](size, Path(workdir), key_manager)
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+        queue.put(result)
+        return
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    calls = backend.stats["calls"]
+    result.update({
+        "wall_seconds": round(wall, 4),
+        "cpu_seconds": round(cpu, 4),
+        # Tempo fora da CPU: espera pela API simulada, pelo rate limiter e por I/O.
+        "api_wait_seconds": round(max(0.0, wall - cpu), 4),
+        "calls": calls,
+        "calls_per_second": round(calls / wall, 2) if wall else None,
+        "items": items,
+        "items_per_second": round(items / wall, 2) if wall else None,
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    })
+    queue.put(result)
+
+def run_benchmarks(sizes, stages, options):
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for size in sizes:
+        with tempfile.TemporaryDirectory(prefix=f"bench_{size}_") as workdir:
+            for stage in stages:
+                queue = context.Queue()
+                process = context.Process(target=_run_stage_in_child, args=(stage, size, workdir, options, queue))
+                process.start()
+                process.join()
+                # Um processo morto (ex.: falta de memória em 1M instâncias) não deixa resultado na fila.
+                if queue.empty():
+                    result = {"stage": stage, "size": size, "error": f"processo terminou com código {process.exitcode}"}
+                else:
+                    result = queue.get()
+                results.append(result)
+                if "error" in result:
+                    print(f"[{size:>9}] {stage:<15} ERRO: {result['error']}")
+                else:
+                    print(f"[{size:>9}] {stage:<15} {result['wall_seconds']:>9.2f}s  "
+                          f"{result['items_per_second'] or 0:>10.1f} itens/s  {result['calls_per_second'] or 0:>8.1f} chamadas/s  "
+                          f"CPU {result['cpu_seconds']:.2f}s  espera {result['api_wait_seconds']:.2f}s  RSS {result['peak_rss_mb']} MB")
+    return results
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def compare_with_baseline(results, baseline_path):
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {(r["stage"], r["size"]): r for r in json.load(f)["results"] if "error" not in r}
+    print(f"\nComparação com {baseline_path} (tempo atual / tempo de referência):")
+    for result in results:
+        reference = baseline.get((result["stage"], result["size"]))
+        if reference is None or "error" in result or not reference["wall_seconds"]:
+            continue
+        ratio = result["wall_seconds"] / reference["wall_seconds"]
+        flag = "  <-- REGRESSÃO" if ratio > 1.2 else ""
+        print(f"[{result['size']:>9}] {result['stage']:<15} {ratio:>6.2f}x{flag}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de vazão do pipeline com LLM simulada.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Números de instâncias (ex.: 100 10000 1000000).")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES, help="Etapas a medir, na ordem do pipeline.")
+    parser.add_argument("--latency", type=float, default=0.05, help="Latência média da LLM simulada, em segundos.")
+    parser.add_argument("--keys", type=int, default=10, help="Número de chaves fictícias.")
+    parser.add_argument("--rpm", type=int, default=100000, help="Quota de RPM de cada chave fictícia.")
+    parser.add_argument("--tpm", type=int, default=10 ** 9, help="Quota de TPM de cada chave fictícia.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, default=None, help="Arquivo JSON de saída.")
+    parser.add_argument("--baseline", type=Path, default=None, help="JSON de uma execução anterior para comparação.")
+    args = parser.parse_args()
+
+    options = {"latency": args.latency, "keys": args.keys, "rpm": args.rpm, "tpm": args.tpm, "seed": args.seed}
+    commit = _git_commit()
+    results = run_benchmarks(args.sizes, args.stages, options)
+
+    report = {
+        "commit": commit,
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "options": options,
+        "results": results,
+    }
+    output_path = args.output or RESULTS_DIR / f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{commit}.json"
+    os.makedirs(output_path.parent, exist_ok=True)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\nResultados salvos em: {output_path}")
+
+    if args.baseline:
+        compare_with_baseline(results, args.baseline)
+
+if __name__ == '__main__':
+    main()
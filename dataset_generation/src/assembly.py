@@ -0,0 +1,215 @@
+"""
+Montagem paralela e em fluxo dos arquivos finais (BQA e MCQA).
+
+As instâncias de cada regra são divididas em fatias de `SHARD_SIZE`, montadas num pool de
+processos e gravadas, na ordem, por um `SamplesWriter`, que escreve um sample de cada vez.
+`map_shards` mantém no máximo `MAX_SHARDS_IN_FLIGHT_PER_WORKER` fatias por processo em trânsito
+e só pede a próxima tarefa quando a mais antiga termina: a memória fica limitada a essa janela,
+não ao tamanho do dataset.
+Cada instância tem o seu próprio gerador aleatório (`instance_rng`), semeado pela regra e
+pelo id do sample, então `choice`/`shuffle` dão o mesmo resultado com qualquer número de
+processos e em qualquer ordem de execução.
+"""
+import json
+import os
+import random
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+# --- CONFIGURAÇÃO DA MONTAGEM ---
+DEFAULT_SEED = 0
+SHARD_SIZE = 2000
+ASSEMBLY_WORKERS = os.cpu_count() or 1
+# Fatias submetidas ao pool por processo: uma rodando e outra esperando, para nenhum processo ficar ocioso.
+MAX_SHARDS_IN_FLIGHT_PER_WORKER = 2
+OUTPUT_FORMATS = ("json", "jsonl")
+LOGIC_TYPE_FOLDERS = {"PL": "propositional_logic", "FOL": "first_order_logic", "NM": "nm_logic"}
+# ------------------------------------
+
+def instance_rng(seed, rule_key, sample_id):
+    """Gerador próprio de uma instância; sementes em texto não dependem do PYTHONHASHSEED."""
+    return random.Random(f"{seed}/{rule_key}/{sample_id}")
+
+def rule_output_path(base_output_dir, rule_key, output_format="json"):
+    logic_type, rule_name = rule_key.split('/')
+    return Path(base_output_dir) / LOGIC_TYPE_FOLDERS.get(logic_type, logic_type) / rule_name / f"data_instances.{output_format}"
+
+def rule_key_from_path(path, base_dir):
+    """Inverso de `rule_output_path`: a chave da regra (ex.: "PL/Modus_Tollens") de um arquivo em `base_dir`."""
+    type_folder, rule_name = Path(path).relative_to(base_dir).parts[-3:-1]
+    logic_type = {folder: key for key, folder in LOGIC_TYPE_FOLDERS.items()}.get(type_folder, type_folder)
+    return f"{logic_type}/{rule_name}"
+
+def read_samples(path):
+    """Samples de um arquivo final, em JSON (lista em "samples") ou JSONL (um sample por linha)."""
+    if Path(path).suffix == ".jsonl":
+        with open(path, 'r', encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)["samples"]
+
+_SAMPLES_PREFIX, _SAMPLES_SUFFIX = '{\n    "samples": [\n', '\n    ]\n}'
+
+def serialize_samples(samples, output_format="json"):
+    """Trecho de texto com vários samples no formato de saída: itens indentados de "samples" ou linhas JSONL.
+
+    No JSON, os samples são codificados numa única chamada (dentro de um `{"samples": [...]}` de
+    mentira, cujo cabeçalho e rodapé são cortados), com o mesmo layout de `json.dump(..., indent=4)`.
+    """
+    if not samples:
+        return ""
+    if output_format == "jsonl":
+        return "\n".join([json.dumps(sample, ensure_ascii=False) for sample in samples])
+    text = json.dumps({"samples": samples}, ensure_ascii=False, indent=4)
+    return text[len(_SAMPLES_PREFIX):-len(_SAMPLES_SUFFIX)]
+
+class SamplesWriter:
+    """Grava os samples de uma regra um a um, no mesmo layout de `json.dump(..., indent=4)` ou em JSONL.
+
+    O arquivo é escrito num temporário e só substitui o final no `close`; uma regra sem
+    samples não gera arquivo.
+    """
+
+    def __init__(self, base_output_dir, rule_key, output_format="json"):
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Formato de saída desconhecido: '{output_format}'.")
+        logic_type, rule_name = rule_key.split('/')
+        self.rule_key = rule_key
+        self.header = {"type": LOGIC_TYPE_FOLDERS.get(logic_type, logic_type), "axiom": rule_name.lower()}
+        self.output_format = output_format
+        self.path = rule_output_path(base_output_dir, rule_key, output_format)
+        self.tmp_path = self.path.with_name(self.path.name + ".tmp")
+        self.count = 0
+        self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        self.close(discard=exc_type is not None)
+
+    def write(self, sample):
+        self.write_serialized(serialize_samples([sample], self.output_format), 1)
+
+    def write_serialized(self, fragment, count):
+        """Grava `count` samples já passados por `serialize_samples` (como devolvem os workers do pool)."""
+        if not count:
+            return
+        if self.file is None:
+            os.makedirs(self.path.parent, exist_ok=True)
+            self.file = open(self.tmp_path, 'w', encoding='utf-8')
+            if self.output_format == "json":
+                self.file.write("{\n" + "".join(f"    {json.dumps(k)}: {json.dumps(v, ensure_ascii=False)},\n"
+                                                for k, v in self.header.items()) + '    "samples": [\n')
+        elif self.output_format == "json":
+            self.file.write(",\n")
+        self.file.write(fragment)
+        if self.output_format == "jsonl":
+            self.file.write("\n")
+        self.count += count
+
+    def close(self, discard=False):
+        if self.file is None:
+            return
+        if self.output_format == "json":
+            self.file.write("\n    ]\n}")
+        self.file.close()
+        self.file = None
+        if discard:
+            os.remove(self.tmp_path)
+        else:
+            os.replace(self.tmp_path, self.path)
+
+_RULE_PREFIX = b'{"rule": "'
+
+def _line_rule(line):
+    # As etapas gravam "rule" como primeira chave: na maioria das linhas basta ler o prefixo, sem decodificar o JSON.
+    # Uma linha cortada (sem o "}" final) passa pelo json.loads e é descartada como malformada.
+    if line.startswith(_RULE_PREFIX) and line.rstrip().endswith(b'}'):
+        end = line.find(b'"', len(_RULE_PREFIX))
+        if end > 0 and b'\\' not in line[len(_RULE_PREFIX):end]:
+            return line[len(_RULE_PREFIX):end].decode('utf-8')
+    try:
+        rule_key = json.loads(line)["rule"]
+    except (json.JSONDecodeError, UnicodeDecodeError, KeyError, TypeError):
+        return None
+    return rule_key if isinstance(rule_key, str) else None
+
+def index_lines_by_rule(log_path):
+    """`{regra: array de offsets}` das linhas de um log JSONL, na ordem do arquivo; linhas malformadas ficam de fora."""
+    offsets = {}
+    with open(log_path, 'rb') as f:
+        position = 0
+        for line in f:
+            rule_key = _line_rule(line)
+            if rule_key is not None:
+                offsets.setdefault(rule_key, array('q')).append(position)
+            position += len(line)
+    return offsets
+
+def read_lines_at(log_path, offsets):
+    """Registros JSON das linhas que começam em `offsets`."""
+    with open(log_path, 'rb') as f:
+        for offset in offsets:
+            f.seek(offset)
+            yield json.loads(f.readline())
+
+def shards(items, shard_size=SHARD_SIZE):
+    """Fatias `(posição inicial, fatia)` de uma sequência."""
+    return [(start, items[start:start + shard_size]) for start in range(0, len(items), shard_size)]
+
+def map_shards(function, tasks, workers=ASSEMBLY_WORKERS):
+    """`function` aplicada a cada tarefa, com os resultados na ordem das tarefas; `workers=1` roda no próprio processo.
+
+    `tasks` pode ser um gerador: as tarefas são consumidas aos poucos, com no máximo
+    `workers * MAX_SHARDS_IN_FLIGHT_PER_WORKER` submetidas e ainda não devolvidas.
+    """
+    if workers <= 1 or (isinstance(tasks, list) and len(tasks) <= 1):
+        return map(function, tasks)
+
+    def results():
+        executor = ProcessPoolExecutor(max_workers=workers)
+        in_flight = deque()
+        try:
+            for task in tasks:
+                in_flight.append(executor.submit(function, task))
+                if len(in_flight) >= workers * MAX_SHARDS_IN_FLIGHT_PER_WORKER:
+                    yield in_flight.popleft().result()
+            while in_flight:
+                yield in_flight.popleft().result()
+        finally:
+            executor.shutdown(cancel_futures=True)
+    return results()
+
+def write_sharded_samples(base_output_dir, shard_rules, results, output_format="json", on_rule_done=None):
+    """Grava, na ordem, os samples serializados de cada fatia; `shard_rules[i]` é a regra da fatia `i`.
+
+    Cada resultado é um par `(trecho, número de samples)`. As fatias de uma mesma regra vêm em
+    sequência. `on_rule_done()` é chamado a cada arquivo fechado.
+    """
+    writer = None
+    try:
+        for rule_key, (fragment, count) in zip(shard_rules, results):
+            if writer is None or writer.rule_key != rule_key:
+                if writer is not None:
+                    writer.close()
+                    if on_rule_done:
+                        on_rule_done()
+                writer = SamplesWriter(base_output_dir, rule_key, output_format)
+            writer.write_serialized(fragment, count)
+    except BaseException:
+        if writer is not None:
+            writer.close(discard=True)
+        raise
+    if writer is not None:
+        writer.close()
+        if on_rule_done:
+            on_rule_done()
+
+def add_assembly_arguments(parser):
+    parser.add_argument("--workers", type=int, default=ASSEMBLY_WORKERS, help="Processos na montagem dos arquivos finais.")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="Semente base dos sorteios por instância.")
+    parser.add_argument("--output-format", choices=OUTPUT_FORMATS, default="json",
+                        help="'json' (mesmo layout de antes) ou 'jsonl' (um sample por linha, sem cabeçalho).")
@@ -0,0 +1,138 @@
+"""
+Cache persistente das respostas da LLM, endereçado pelo conteúdo da chamada.
+
+A chave é o hash de (modelo, prompt, parâmetros de geração) e o valor é o texto da
+resposta. Reexecutar uma etapa com os mesmos prompts passa a ler do disco em vez de
+pagar a latência (e a quota) da API novamente.
+
+Backends que não falam com o modelo de verdade (o simulado) passam um `namespace`, que
+entra na chave: as respostas deles nunca atendem uma chamada real.
+"""
+import hashlib
+import json
+import logging
+import sqlite3
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).parent.parent.parent
+DEFAULT_CACHE_PATH = PROJECT_ROOT / ".llm_cache" / "responses.sqlite"
+# A poda por tamanho/idade roda na abertura e a cada N gravações.
+EVICTION_INTERVAL = 500
+# Os horários de último uso (que só orientam a poda) vão ao disco a cada N acertos, não a cada um.
+TOUCH_FLUSH_INTERVAL = 500
+
+class CacheMissError(RuntimeError):
+    """Levantada no modo replay quando a resposta não está no cache."""
+
+def cache_key(model_name, prompt, generation_config=None, namespace=None):
+    fields = [model_name, prompt, generation_config or {}]
+    # Sem namespace a chave fica como antes, e o cache já gravado com o Gemini continua válido.
+    if namespace is not None:
+        fields.append(namespace)
+    payload = json.dumps(fields, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class ResponseCache:
+    def __init__(self, path=DEFAULT_CACHE_PATH, replay_only=False, max_age_days=None, max_size_mb=None):
+        self.path = Path(path)
+        self.replay_only = replay_only
+        self.max_age_seconds = max_age_days * 86400 if max_age_days else None
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024) if max_size_mb else None
+        self.hits = 0
+        self.misses = 0
+        self._writes_since_eviction = 0
+        self._pending_touches = {}
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model_name TEXT NOT NULL,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL
+            )""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses(last_used_at)")
+        self.conn.commit()
+        self.evict()
+
+    def get(self, model_name, prompt, generation_config=None, namespace=None):
+        key = cache_key(model_name, prompt, generation_config, namespace)
+        row = self.conn.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+        now = time.time()
+        if row is not None and self.max_age_seconds and now - row[1] > self.max_age_seconds:
+            row = None
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        # Um replay só lê: o horário de uso fica em memória e é gravado em lote.
+        self._pending_touches[key] = now
+        if len(self._pending_touches) >= TOUCH_FLUSH_INTERVAL:
+            self._flush_touches()
+        return row[0]
+
+    def _flush_touches(self):
+        if self._pending_touches:
+            self.conn.executemany("UPDATE responses SET last_used_at = ? WHERE key = ?",
+                                  [(used_at, key) for key, used_at in self._pending_touches.items()])
+            self.conn.commit()
+            self._pending_touches.clear()
+
+    def put(self, model_name, prompt, response, generation_config=None, namespace=None):
+        key = cache_key(model_name, prompt, generation_config, namespace)
+        now = time.time()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+            (key, model_name, response, len(response.encode('utf-8')), now, now))
+        self.conn.commit()
+        self._writes_since_eviction += 1
+        if self._writes_since_eviction >= EVICTION_INTERVAL:
+            self.evict()
+
+    def discard(self, model_name, prompt, generation_config=None, namespace=None):
+        """Remove a resposta de uma chamada (ex.: uma resposta que o chamador não conseguiu interpretar)."""
+        key = cache_key(model_name, prompt, generation_config, namespace)
+        self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+        self.conn.commit()
+
+    def evict(self):
+        """Remove entradas mais antigas que `max_age_days` e, acima de `max_size_mb`, as menos usadas."""
+        self._writes_since_eviction = 0
+        self._flush_touches()
+        removed = 0
+        if self.max_age_seconds:
+            cursor = self.conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.max_age_seconds,))
+            removed += cursor.rowcount
+        if self.max_size_bytes:
+            total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total > self.max_size_bytes:
+                excess = total - self.max_size_bytes
+                stale_keys, freed = [], 0
+                for key, size in self.conn.execute("SELECT key, size FROM responses ORDER BY last_used_at"):
+                    if freed >= excess:
+                        break
+                    stale_keys.append((key,))
+                    freed += size
+                self.conn.executemany("DELETE FROM responses WHERE key = ?", stale_keys)
+                removed += len(stale_keys)
+        self.conn.commit()
+        if removed:
+            logging.info(f"Cache de respostas: {removed} entradas removidas na poda.")
+
+    def close(self):
+        self._flush_touches()
+        self.conn.close()
+
+def add_cache_arguments(parser):
+    group = parser.add_argument_group("cache de respostas da LLM")
+    group.add_argument("--no-cache", action="store_true", help="Não lê nem grava o cache de respostas.")
+    group.add_argument("--replay-only", action="store_true", help="Usa apenas respostas em cache; falha se alguma faltar.")
+    group.add_argument("--cache-path", type=Path, default=DEFAULT_CACHE_PATH, help="Arquivo SQLite do cache.")
+    group.add_argument("--cache-max-age-days", type=float, default=None, help="Descarta respostas mais antigas que isso.")
+    group.add_argument("--cache-max-size-mb", type=float, default=None, help="Tamanho máximo do cache em disco.")
+    return parser
@@ -0,0 +1,108 @@
+"""
+Checkpoints em JSONL para retomar as etapas que chamam a LLM depois de uma queda.
+
+Cada item de trabalho recebe um hash estável do seu conteúdo, gravado no campo `item_hash`
+de cada linha de saída. O arquivo é aberto em modo append; ao reiniciar, as linhas já
+gravadas são lidas de volta e os itens correspondentes são pulados, sem nova chamada à API.
+
+Um registro provisório (ex.: o contexto templatizado usado quando a LLM falhou) vai para a
+saída sem `item_hash`: ao reiniciar ele é removido do arquivo e o item é tentado de novo.
+"""
+import hashlib
+import json
+import logging
+import os
+from collections import defaultdict
+
+ITEM_HASH_FIELD = "item_hash"
+
+def item_hash(*parts):
+    """Hash estável de um item de trabalho, a partir das partes que definem o seu prompt."""
+    payload = json.dumps(parts, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+def _truncate_partial_line(path):
+    # Uma queda no meio de uma gravação deixa a última linha incompleta; ela é descartada.
+    with open(path, 'rb+') as f:
+        data = f.read()
+        if data and not data.endswith(b'\n'):
+            f.truncate(data.rfind(b'\n') + 1)
+            logging.warning(f"Checkpoint '{path.name}': linha incompleta no final do arquivo descartada.")
+
+class JsonlCheckpoint:
+    """Saída JSONL de uma etapa que também serve de checkpoint.
+
+    Com `resume=True` as linhas existentes são carregadas em `completed` (hash -> registros) e
+    as novas são acrescentadas; com `resume=False` o arquivo é recriado do zero. Linhas sem hash
+    (provisórias ou malformadas) são retiradas do arquivo na retomada.
+    """
+
+    def __init__(self, path, resume=True):
+        self.path = path
+        self.completed = defaultdict(list)
+        os.makedirs(path.parent, exist_ok=True)
+        if resume and path.exists():
+            _truncate_partial_line(path)
+            kept_lines, dropped = [], 0
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        logging.warning(f"Checkpoint '{path.name}': pulando linha malformada.")
+                        dropped += 1
+                        continue
+                    if isinstance(record, dict) and ITEM_HASH_FIELD in record:
+                        self.completed[record[ITEM_HASH_FIELD]].append(record)
+                        kept_lines.append(line)
+                    else:
+                        dropped += 1
+            if dropped:
+                # Sem isso o item refeito apareceria duas vezes na saída: o provisório e o novo.
+                tmp_path = path.with_name(path.name + '.tmp')
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.writelines(kept_lines)
+                os.replace(tmp_path, path)
+                logging.info(f"Checkpoint '{path.name}': {dropped} linhas sem hash removidas; esses itens serão refeitos.")
+        self.file = open(path, 'a' if resume else 'w', encoding='utf-8')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def num_completed(self):
+        return sum(len(records) for records in self.completed.values())
+
+    def is_completed(self, hash_value):
+        return hash_value in self.completed
+
+    def take(self, hash_value):
+        """Consome um registro já gravado para `hash_value` (itens repetidos consomem um cada); None se não houver."""
+        records = self.completed.get(hash_value)
+        if not records:
+            return None
+        record = records.pop(0)
+        if not records:
+            del self.completed[hash_value]
+        return record
+
+    def write(self, hash_value, records):
+        """Grava de uma vez todos os registros de um item, com o seu hash, e força a ida ao disco."""
+        lines = [json.dumps({**record, ITEM_HASH_FIELD: hash_value}, ensure_ascii=False) + '\n' for record in records]
+        self.file.write(''.join(lines))
+        self.file.flush()
+
+    def write_provisional(self, records):
+        """Grava registros sem hash: aparecem na saída, mas o item não conta como concluído numa retomada."""
+        self.file.write(''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records))
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+def add_resume_arguments(parser):
+    parser.add_argument("--restart", action="store_true",
+                        help="Ignora o checkpoint e recria a saída do zero (por padrão a execução é retomada).")
+    return parser
@@ -2,6 +2,8 @@
 Este arquivo contém os templates lógicos para todas as 9 regras de inferência em 
 PL (Lógica Proposicional).
 """
+from templates import compile_rules
+
 LOGIC_RULES_CONFIG = {
     # ==============================================================================
     # 9 Regras para Lógica Proposicional (PL)
@@ -97,4 +99,7 @@ LOGIC_RULES_CONFIG = {
             "mcqa_correct_conclusion": "{not p} ou {q}"
         }
     }
-}
\ No newline at end of file
+}
+
+# Templates compilados uma única vez, na importação; as etapas renderizam a partir daqui.
+COMPILED_RULES = compile_rules(LOGIC_RULES_CONFIG)
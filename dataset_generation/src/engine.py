@@ -1,56 +1,467 @@
 import google.generativeai as genai
+from google.ai import generativelanguage as glm
 from google.api_core import exceptions
+import asyncio
+import atexit
 import json
+import random
 import time
 import logging
+import weakref
+from collections import deque
 from pathlib import Path
 
+from cache import ResponseCache, CacheMissError
+
 PROJECT_ROOT = Path(__file__).parent.parent.parent
 
-class ApiKeyManager:
+# Quotas por chave e por modelo (nível gratuito da API Gemini).
+# Podem ser sobrescritas pela seção opcional "QUOTAS" do api_keys.json, ex.:
+# {"API_KEYS": {...}, "QUOTAS": {"gemini-2.5-pro": {"rpm": 150, "tpm": 2000000}}}
+DEFAULT_MODEL_QUOTAS = {
+    'gemini-2.5-pro': {'rpm': 5, 'tpm': 250000},
+    'gemini-2.5-flash': {'rpm': 10, 'tpm': 250000},
+}
+FALLBACK_QUOTA = {'rpm': 5, 'tpm': 250000}
+MAX_CONCURRENT_CALLS = 32
+USAGE_WINDOW_SECONDS = 60
+# Com chaves estacionadas o agendador espera a janela expirar, então insistir é barato.
+MIN_ATTEMPTS_PER_CALL = 3
+# Erros que não são de quota (queda do serviço, 500, rede) esperam antes da próxima tentativa:
+# base * 2^(falhas - 1), até o teto, com sorteio entre metade e o valor cheio para não sincronizar as chamadas.
+RETRY_BASE_DELAY_SECONDS = 1.0
+RETRY_MAX_DELAY_SECONDS = 30.0
+
+_response_cache = None
+
+def configure_cache(args):
+    """Ativa o cache de respostas a partir dos argumentos de `cache.add_cache_arguments`."""
+    global _response_cache
+    if args.no_cache:
+        if args.replay_only:
+            raise ValueError("--replay-only exige o cache; não use junto com --no-cache.")
+        _response_cache = None
+        return None
+    _response_cache = ResponseCache(args.cache_path, replay_only=args.replay_only,
+                                    max_age_days=args.cache_max_age_days, max_size_mb=args.cache_max_size_mb)
+    # Grava os horários de uso ainda pendentes na saída do processo.
+    atexit.register(_response_cache.close)
+    return _response_cache
+
+def _cached_response(model_name, prompt, generation_config, call_purpose):
+    if _response_cache is None:
+        return None
+    cached = _response_cache.get(model_name, prompt, generation_config, _backend.cache_namespace)
+    if cached is not None:
+        logging.info(f"Chamada [{call_purpose}] respondida pelo cache.")
+    elif _response_cache.replay_only:
+        raise CacheMissError(f"Resposta ausente no cache para a chamada [{call_purpose}] (modo replay).")
+    return cached
+
+def _store_response(model_name, prompt, generation_config, text):
+    if _response_cache is not None and text:
+        _response_cache.put(model_name, prompt, text, generation_config, _backend.cache_namespace)
+
+def discard_response(model_name, prompt, generation_config=None):
+    """Tira do cache uma resposta que o chamador não conseguiu usar (JSON inválido, itens faltando...).
+
+    Sem isso, a nova tentativa do mesmo prompt (numa rodada seguinte ou numa retomada) receberia
+    do cache a mesma resposta ruim, sem chamar a API.
+    """
+    if _response_cache is not None and not _response_cache.replay_only:
+        _response_cache.discard(model_name, prompt, generation_config, _backend.cache_namespace)
+
+class LLMResponse:
+    def __init__(self, text, total_tokens=None):
+        self.text = text
+        self.total_tokens = total_tokens
+
+class LLMBackend:
+    """Interface dos backends de LLM usados pelo engine.
+
+    Um backend só executa a chamada; escolha de chave, quotas, cache e novas tentativas ficam
+    no engine. Quota esgotada deve ser sinalizada com `exceptions.ResourceExhausted`.
+    `cache_namespace` separa no cache as respostas de backends que não são o modelo real.
+    """
+
+    cache_namespace = None
+
+    def generate(self, key, model_name, prompt, generation_config=None):
+        raise NotImplementedError
+
+    async def generate_async(self, key, model_name, prompt, generation_config=None):
+        raise NotImplementedError
+
+class GeminiBackend(LLMBackend):
     def __init__(self):
-      
-        key_path = PROJECT_ROOT / "api_keys.json"
-        try:
-            with open(key_path, 'r') as f:
-                data = json.load(f)
-            self.keys = list(data['API_KEYS'].values())
-        except Exception as e:
-            raise ValueError(f"Não foi possível carregar as chaves de API de {key_path}: {e}")
-        self.current_index = 0
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    def generate(self, key, model_name, prompt, generation_config=None):
+        genai.configure(api_key=key)
+        model = genai.GenerativeModel(model_name, generation_config=generation_config)
+        response = model.generate_content(prompt)
+        return LLMResponse(response.text.strip(), _total_tokens(response))
+
+    def _get_async_client(self, key):
+        # genai.configure() é global; cada chave recebe seu próprio cliente assíncrono,
+        # criado por event loop porque os canais gRPC ficam presos ao loop em que nasceram.
+        clients = self._async_clients.setdefault(asyncio.get_running_loop(), {})
+        client = clients.get(key)
+        if client is None:
+            client = glm.GenerativeServiceAsyncClient(client_options={"api_key": key})
+            clients[key] = client
+        return client
+
+    async def generate_async(self, key, model_name, prompt, generation_config=None):
+        # Pedido montado com os tipos públicos do cliente gRPC: o GenerativeModel só conhece a chave do configure global.
+        request = glm.GenerateContentRequest(
+            model=model_name if model_name.startswith("models/") else f"models/{model_name}",
+            contents=[glm.Content(role="user", parts=[glm.Part(text=prompt)])],
+            generation_config=glm.GenerationConfig(**(generation_config or {})))
+        response = await self._get_async_client(key).generate_content(request)
+        return LLMResponse(_response_text(response), _total_tokens(response) or None)
+
+def _response_text(response):
+    """Texto do primeiro candidato, como o `response.text` do SDK; erro se a resposta veio bloqueada."""
+    if not response.candidates:
+        raise ValueError(f"Resposta sem candidatos (prompt_feedback: {response.prompt_feedback}).")
+    return "".join(part.text for part in response.candidates[0].content.parts).strip()
+
+def _total_tokens(response):
+    usage = getattr(response, 'usage_metadata', None)
+    return getattr(usage, 'total_token_count', None)
+
+_backend = GeminiBackend()
+
+def configure_backend(args):
+    """Escolhe o backend a partir dos argumentos de `mock_backend.add_backend_arguments`."""
+    global _backend
+    if args.backend == 'mock':
+        from mock_backend import MockBackend
+        _backend = MockBackend(latency=args.mock_latency, error_rate=args.mock_error_rate,
+                               quota_error_rate=args.mock_quota_error_rate, server_rpm=args.mock_server_rpm,
+                               seed=args.mock_seed)
+    else:
+        _backend = GeminiBackend()
+    return _backend
+
+def set_backend(backend):
+    global _backend
+    _backend = backend
+
+def create_key_manager(args):
+    """`ApiKeyManager` real ou, com o backend simulado, um conjunto de chaves fictícias."""
+    if args.backend == 'mock':
+        quota = {'rpm': args.mock_rpm, 'tpm': args.mock_tpm}
+        return ApiKeyManager(keys=[f"mock-key-{i}" for i in range(args.mock_keys)],
+                             quotas={model_name: quota for model_name in DEFAULT_MODEL_QUOTAS}, fallback_quota=quota)
+    return ApiKeyManager()
+
+def estimate_tokens(prompt):
+    # Aproximação grosseira (~4 caracteres por token); corrigida após a resposta.
+    return len(prompt) // 4 + 1
+
+class TokenBucket:
+    """Balde de fichas reabastecido continuamente a `capacity_per_minute` fichas por minuto."""
+
+    def __init__(self, capacity_per_minute):
+        self.capacity = float(capacity_per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, amount):
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount):
+        # O saldo pode ficar negativo: o excesso é pago com espera nas próximas chamadas.
+        self._refill()
+        self.tokens -= amount
+
+    def drain(self):
+        self._refill()
+        self.tokens = min(self.tokens, 0.0)
+
+class KeyRateLimiter:
+    """Estado de uma chave (para um modelo): quotas de RPM/TPM, uso recente e pausa.
+
+    Os baldes de fichas cadenciam as chamadas; a janela deslizante de 60 s registra
+    quantas requisições e tokens foram realmente gastos, o que dá a folga da chave.
+    """
+
+    def __init__(self, rpm, tpm):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.request_window = deque()
+        self.token_window = deque()
+        self.window_tokens = 0
+        self.cooldown_until = 0.0
+
+    def _trim_window(self, now):
+        while self.request_window and now - self.request_window[0] >= USAGE_WINDOW_SECONDS:
+            self.request_window.popleft()
+        while self.token_window and now - self.token_window[0][0] >= USAGE_WINDOW_SECONDS:
+            _, tokens = self.token_window.popleft()
+            self.window_tokens -= tokens
+
+    def headroom(self, estimated_tokens):
+        """Fração da quota ainda livre na janela atual, considerando o recurso mais escasso."""
+        self._trim_window(time.monotonic())
+        free_requests = 1 - (len(self.request_window) + 1) / self.rpm
+        free_tokens = 1 - (self.window_tokens + estimated_tokens) / self.tpm
+        return min(free_requests, free_tokens)
+
+    def wait_time(self, estimated_tokens):
+        parked = self.cooldown_until - time.monotonic()
+        return max(parked, self.requests.wait_time(1), self.tokens.wait_time(estimated_tokens))
+
+    def _record_tokens(self, tokens):
+        self.tokens.consume(tokens)
+        self.token_window.append((time.monotonic(), tokens))
+        self.window_tokens += tokens
+
+    def consume(self, estimated_tokens):
+        self.requests.consume(1)
+        self.request_window.append(time.monotonic())
+        self._record_tokens(estimated_tokens)
+
+    def reconcile(self, estimated_tokens, actual_tokens):
+        # A diferença entra como um lançamento próprio: outras chamadas podem ter sido registradas no meio.
+        self._record_tokens(actual_tokens - estimated_tokens)
+
+    def park(self):
+        """Quota excedida no servidor: pausa a chave até a janela atual expirar."""
+        now = time.monotonic()
+        self._trim_window(now)
+        oldest = self.request_window[0] if self.request_window else now
+        self.cooldown_until = max(self.cooldown_until, oldest + USAGE_WINDOW_SECONDS)
+        self.requests.drain()
+        return self.cooldown_until - now
+
+class ApiKeyManager:
+    """Carrega as chaves e decide qual delas atende cada chamada.
+
+    Em vez de girar as chaves só depois de um `ResourceExhausted`, cada chamada vai para
+    a chave com mais folga na janela de uso; chaves esgotadas ficam estacionadas até
+    a janela expirar.
+    """
+
+    def __init__(self, keys=None, quotas=None, fallback_quota=FALLBACK_QUOTA):
+        self.fallback_quota = fallback_quota
+        if keys is not None:
+            self.keys = list(keys)
+            self.quotas = {**DEFAULT_MODEL_QUOTAS, **(quotas or {})}
+        else:
+            key_path = PROJECT_ROOT / "api_keys.json"
+            try:
+                with open(key_path, 'r') as f:
+                    data = json.load(f)
+                self.keys = list(data['API_KEYS'].values())
+                self.quotas = {**DEFAULT_MODEL_QUOTAS, **data.get('QUOTAS', {})}
+            except Exception as e:
+                raise ValueError(f"Não foi possível carregar as chaves de API de {key_path}: {e}")
+        self.limiters = {}
         if not self.keys:
             raise ValueError("Nenhuma chave de API do Gemini foi encontrada.")
 
-    def get_current_key(self):
-        return self.keys[self.current_index]
+    def get_limiter(self, key_index, model_name):
+        limiter = self.limiters.get((key_index, model_name))
+        if limiter is None:
+            quota = self.quotas.get(model_name, self.fallback_quota)
+            limiter = KeyRateLimiter(quota['rpm'], quota['tpm'])
+            self.limiters[(key_index, model_name)] = limiter
+        return limiter
+
+    def reserve_key(self, model_name, estimated_tokens):
+        """Reserva a chave disponível com mais folga para `model_name`.
 
-    def rotate_key(self):
-        self.current_index = (self.current_index + 1) % len(self.keys)
-        logging.warning(f"Rotacionando para a chave de API índice #{self.current_index}...")
-        return self.keys[self.current_index]
+        Retorna `(key_index, 0.0)` ou, se todas estiverem sem quota ou estacionadas,
+        `(None, espera)` com o tempo até a primeira ficar livre.
+        """
+        best_index, best_headroom, soonest = None, None, float('inf')
+        for key_index in range(len(self.keys)):
+            limiter = self.get_limiter(key_index, model_name)
+            wait = limiter.wait_time(estimated_tokens)
+            if wait > 0:
+                soonest = min(soonest, wait)
+                continue
+            headroom = limiter.headroom(estimated_tokens)
+            if best_headroom is None or headroom > best_headroom:
+                best_index, best_headroom = key_index, headroom
+        if best_index is None:
+            return None, soonest
+        self.get_limiter(best_index, model_name).consume(estimated_tokens)
+        return best_index, 0.0
+
+    def acquire_key_blocking(self, model_name, estimated_tokens):
+        while True:
+            key_index, wait = self.reserve_key(model_name, estimated_tokens)
+            if key_index is not None:
+                return key_index
+            time.sleep(wait)
+
+    async def acquire_key(self, model_name, estimated_tokens):
+        # Sem lock: o loop do asyncio é single-thread e reserve_key não tem await.
+        while True:
+            key_index, wait = self.reserve_key(model_name, estimated_tokens)
+            if key_index is not None:
+                return key_index
+            await asyncio.sleep(wait)
+
+    def park_key(self, key_index, model_name):
+        pause = self.get_limiter(key_index, model_name).park()
+        logging.warning(f"Chave de API índice #{key_index} estacionada por {pause:.0f}s para {model_name}.")
 
     def __len__(self):
         return len(self.keys)
 
-def make_api_call(key_manager, model_name, prompt, call_purpose="Geral"):
-    API_CALL_COOLDOWN = 35
-    for _ in range(len(key_manager)):
+def retry_delay(failures):
+    """Espera (s) depois da `failures`-ésima falha genérica seguida de uma chamada."""
+    ceiling = min(RETRY_MAX_DELAY_SECONDS, RETRY_BASE_DELAY_SECONDS * 2 ** (failures - 1))
+    return random.uniform(ceiling / 2, ceiling)
+
+def make_api_call(key_manager, model_name, prompt, call_purpose="Geral", generation_config=None):
+    cached = _cached_response(model_name, prompt, generation_config, call_purpose)
+    if cached is not None:
+        return cached
+    estimated = estimate_tokens(prompt)
+    attempts, failures = max(len(key_manager), MIN_ATTEMPTS_PER_CALL), 0
+    for attempt in range(attempts):
+        key_index = key_manager.acquire_key_blocking(model_name, estimated)
+        limiter = key_manager.get_limiter(key_index, model_name)
         try:
-            current_key = key_manager.get_current_key()
-            genai.configure(api_key=current_key)
-            model = genai.GenerativeModel(model_name)
-            response = model.generate_content(prompt)
-            logging.info(f"Chamada [{call_purpose}] bem-sucedida. Aguardando {API_CALL_COOLDOWN}s...")
-            time.sleep(API_CALL_COOLDOWN)
-            return response.text.strip()
+            response = _backend.generate(key_manager.keys[key_index], model_name, prompt, generation_config)
+            limiter.reconcile(estimated, response.total_tokens or estimated)
+            logging.info(f"Chamada [{call_purpose}] bem-sucedida (chave #{key_index}).")
+            _store_response(model_name, prompt, generation_config, response.text)
+            return response.text
         except exceptions.ResourceExhausted:
             logging.warning(f"Quota excedida na chamada [{call_purpose}].")
-            key_manager.rotate_key()
-            time.sleep(5)
-            continue
+            key_manager.park_key(key_index, model_name)
         except Exception as e:
             logging.error(f"A API retornou um erro inesperado na chamada [{call_purpose}]: {e}")
-            key_manager.rotate_key()
-            time.sleep(5)
+            failures += 1
+            if attempt + 1 < attempts:
+                time.sleep(retry_delay(failures))
     logging.critical(f"Todas as chaves falharam para a chamada [{call_purpose}].")
-    return None
\ No newline at end of file
+    return None
+
+class AsyncApiEngine:
+    """Dispara muitas chamadas simultâneas, distribuídas entre todas as chaves do `ApiKeyManager`.
+
+    Cada par (chave, modelo) é limitado pelo seu próprio `KeyRateLimiter`, de modo que a
+    vazão cresce com o número de chaves em vez de ser fixada por um `sleep`.
+    """
+
+    def __init__(self, key_manager, max_concurrency=MAX_CONCURRENT_CALLS):
+        self.key_manager = key_manager
+        self.max_concurrency = max_concurrency
+
+    async def call(self, model_name, prompt, call_purpose="Geral", generation_config=None):
+        cached = _cached_response(model_name, prompt, generation_config, call_purpose)
+        if cached is not None:
+            return cached
+        estimated = estimate_tokens(prompt)
+        attempts, failures = max(len(self.key_manager), MIN_ATTEMPTS_PER_CALL), 0
+        for attempt in range(attempts):
+            key_index = await self.key_manager.acquire_key(model_name, estimated)
+            limiter = self.key_manager.get_limiter(key_index, model_name)
+            try:
+                key = self.key_manager.keys[key_index]
+                response = await _backend.generate_async(key, model_name, prompt, generation_config)
+                limiter.reconcile(estimated, response.total_tokens or estimated)
+                logging.info(f"Chamada [{call_purpose}] bem-sucedida (chave #{key_index}).")
+                _store_response(model_name, prompt, generation_config, response.text)
+                return response.text
+            except exceptions.ResourceExhausted:
+                logging.warning(f"Quota excedida na chamada [{call_purpose}] (chave #{key_index}).")
+                self.key_manager.park_key(key_index, model_name)
+            except Exception as e:
+                logging.error(f"A API retornou um erro inesperado na chamada [{call_purpose}]: {e}")
+                failures += 1
+                if attempt + 1 < attempts:
+                    await asyncio.sleep(retry_delay(failures))
+        logging.critical(f"Todas as chaves falharam para a chamada [{call_purpose}].")
+        return None
+
+    async def run(self, requests, on_result=None, ordered=True):
+        """Executa `requests` (tuplas `(model_name, prompt, call_purpose)`) com concorrência limitada.
+
+        `on_result(index, text)` é chamado assim que cada resposta chega; com `ordered=True`
+        as respostas são entregues na ordem de entrada. Retorna a lista de respostas.
+        """
+        requests = list(requests)
+        results = [None] * len(requests)
+        pending = iter(range(len(requests)))
+        done, next_to_emit = set(), 0
+
+        def emit(index):
+            nonlocal next_to_emit
+            if on_result is None:
+                return
+            if not ordered:
+                on_result(index, results[index])
+                return
+            done.add(index)
+            while next_to_emit in done:
+                done.discard(next_to_emit)
+                on_result(next_to_emit, results[next_to_emit])
+                next_to_emit += 1
+
+        async def worker():
+            for index in pending:
+                model_name, prompt, call_purpose = requests[index]
+                results[index] = await self.call(model_name, prompt, call_purpose)
+                emit(index)
+
+        await asyncio.gather(*(worker() for _ in range(min(self.max_concurrency, len(requests)))))
+        return results
+
+def run_api_calls(key_manager, model_name, prompts, call_purposes=None, on_result=None,
+                  ordered=True, max_concurrency=MAX_CONCURRENT_CALLS):
+    """Versão síncrona do `AsyncApiEngine.run` para um único modelo, para uso nos scripts das etapas."""
+    if call_purposes is None:
+        call_purposes = ["Geral"] * len(prompts)
+    requests = [(model_name, prompt, purpose) for prompt, purpose in zip(prompts, call_purposes)]
+
+    async def _run():
+        engine = AsyncApiEngine(key_manager, max_concurrency)
+        return await engine.run(requests, on_result=on_result, ordered=ordered)
+
+    return asyncio.run(_run())
+
+def run_api_calls_by_model(key_manager, prompts_by_model, call_purposes_by_model=None, on_result=None,
+                           ordered=True, max_concurrency=MAX_CONCURRENT_CALLS):
+    """Como `run_api_calls`, mas para vários modelos ao mesmo tempo, num único loop de eventos.
+
+    Cada modelo tem o seu próprio conjunto de `max_concurrency` workers, de modo que um modelo
+    esperando a sua quota (os limites são por par chave/modelo) não segura os demais.
+    `on_result(model_name, index, text)` recebe o índice dentro da lista do modelo.
+    Retorna um dicionário modelo -> lista de respostas.
+    """
+    call_purposes_by_model = call_purposes_by_model or {}
+
+    async def _run_model(model_name, prompts):
+        purposes = call_purposes_by_model.get(model_name) or ["Geral"] * len(prompts)
+        requests = [(model_name, prompt, purpose) for prompt, purpose in zip(prompts, purposes)]
+        callback = None if on_result is None else (lambda index, text: on_result(model_name, index, text))
+        engine = AsyncApiEngine(key_manager, max_concurrency)
+        return await engine.run(requests, on_result=callback, ordered=ordered)
+
+    async def _run():
+        models = list(prompts_by_model)
+        results = await asyncio.gather(*(_run_model(model, prompts_by_model[model]) for model in models))
+        return dict(zip(models, results))
+
+    return asyncio.run(_run())
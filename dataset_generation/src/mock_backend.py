@@ -0,0 +1,181 @@
+"""
+Backend local que substitui a API do Gemini em execuções offline e determinísticas.
+
+Reconhece os prompts de cada etapa (bancos de sentenças, naturalização, distratores e
+formalização Z3, inclusive as versões em lote) e devolve respostas no mesmo formato que
+o código de parsing espera. Latência, erros genéricos e `ResourceExhausted` podem ser
+injetados para testar o agendador de chaves, as novas tentativas e a concorrência.
+"""
+import asyncio
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from collections import defaultdict, deque
+
+from google.api_core import exceptions
+
+from engine import LLMBackend, LLMResponse
+
+SUBJECTS = ["O alarme", "A equipe", "O trem", "A loja", "O servidor", "A ponte", "O jardineiro", "A professora",
+            "O ônibus", "A fábrica", "O estudante", "A cozinheira", "O motorista", "A biblioteca", "O time"]
+PLACES = ["do bairro", "da cidade", "do prédio", "da escola", "do porto", "da estação", "do mercado", "da vila"]
+PREDICATES = [("abriu cedo", "não abriu cedo"), ("chegou no horário", "não chegou no horário"),
+              ("funcionou bem", "não funcionou bem"), ("recebeu a encomenda", "não recebeu a encomenda"),
+              ("venceu a partida", "não venceu a partida"), ("terminou o trabalho", "não terminou o trabalho"),
+              ("ficou lotado", "não ficou lotado"), ("tocou à noite", "não tocou à noite")]
+DISTRACTOR_TEMPLATES = ["Não se pode afirmar que {c}", "É impossível que {c}", "O contrário ocorre: {c} é falso",
+                        "Nada pode ser concluído sobre {c}", "Apenas às vezes {c}", "{c}, mas só no dia seguinte"]
+
+FORMALIZATIONS = [
+    {"variables": ["p", "q"], "premises": ["Implies(p,q)", "Not(q)"], "conclusion": "Not(p)"},
+    {"variables": ["p", "q"], "premises": ["Implies(p,q)", "p"], "conclusion": "q"},
+    {"variables": ["p", "q", "r"], "premises": ["Implies(p,q)", "Implies(q,r)"], "conclusion": "Implies(p,r)"},
+    {"variables": ["p", "q"], "premises": ["Or(p,q)", "Not(p)"], "conclusion": "q"},
+    {"variables": ["p", "q", "r", "s"], "premises": ["Implies(p,q)", "Implies(r,s)", "Or(p,r)"], "conclusion": "Or(q,s)"},
+    {"variables": ["p", "q", "r", "s"], "premises": ["Implies(p,q)", "Implies(r,s)", "Or(Not(q),Not(s))"], "conclusion": "Or(Not(p),Not(r))"},
+    {"variables": ["p", "q", "r", "s"], "premises": ["Implies(p,q)", "Implies(r,s)", "Or(p,Not(s))"], "conclusion": "Or(q,Not(r))"},
+    {"variables": ["p", "q"], "premises": ["Or(p,q)"], "conclusion": "Or(q,p)"},
+    {"variables": ["p", "q"], "premises": ["Implies(p,q)"], "conclusion": "Or(Not(p),q)"},
+]
+
+def _prompt_rng(prompt):
+    # O conteúdo depende só do prompt, então respostas repetidas são idênticas entre execuções.
+    return random.Random(hashlib.sha256(prompt.encode('utf-8')).digest())
+
+def _lower_first(text):
+    return text[0].lower() + text[1:] if text else text
+
+def _json_after(prompt, marker):
+    start = prompt.index(marker) + len(marker)
+    value, _ = json.JSONDecoder().raw_decode(prompt[start:].lstrip())
+    return value
+
+def _sentence_pair(rng, tag):
+    affirmative, negative = rng.choice(PREDICATES)
+    subject = f"{rng.choice(SUBJECTS)} {rng.choice(PLACES)} {tag}"
+    return f"{subject} {affirmative}.", f"{subject} {negative}."
+
+def fake_sentence_banks(prompt, rng):
+    count = int(re.search(r'contendo (\d+) objetos', prompt).group(1))
+    keys_line = re.search(r'chaves: (.*)', prompt).group(1)
+    keys = re.findall(r'"([^"]+)"', keys_line) or [k.strip(' .') for k in keys_line.split(',')]
+    base_keys = sorted({k.removeprefix("not ") for k in keys})
+
+    banks = []
+    for _ in range(count):
+        bank = {}
+        for base in base_keys:
+            affirmative, negative = _sentence_pair(rng, rng.randint(1, 10 ** 6))
+            bank[base] = affirmative
+            bank[f"not {base}"] = negative
+        banks.append({k: bank[k] for k in keys if k in bank})
+    return json.dumps(banks, ensure_ascii=False)
+
+def fake_natural_context(condition, situation):
+    return f"{condition} Naquele dia, porém, {_lower_first(situation)}".strip()
+
+def fake_distractors(rng, correct_answer, quantity, avoid=()):
+    seen = {correct_answer.casefold(), *(a.casefold() for a in avoid)}
+    distractors = []
+    templates = DISTRACTOR_TEMPLATES[:]
+    rng.shuffle(templates)
+    for n, template in enumerate(templates * 2):
+        candidate = template.format(c=_lower_first(correct_answer.rstrip('.')))
+        candidate = candidate[0].upper() + candidate[1:]
+        if n >= len(templates):
+            candidate = f"{candidate} ({n})"
+        if candidate.casefold() not in seen:
+            seen.add(candidate.casefold())
+            distractors.append(candidate)
+        if len(distractors) == quantity:
+            break
+    return distractors
+
+def fake_response(prompt):
+    """Resposta sintética, no formato esperado pela etapa que gerou `prompt`."""
+    rng = _prompt_rng(prompt)
+    if "array JSON contendo" in prompt and "chaves:" in prompt:
+        return fake_sentence_banks(prompt, rng)
+    if '"condicao"' in prompt:
+        items = _json_after(prompt, "Itens:")
+        return json.dumps([{"id": item["id"], "contexto": fake_natural_context(item["condicao"], item["situacao"])}
+                           for item in items], ensure_ascii=False)
+    if "Regra: Condição:" in prompt:
+        condition, situation = re.findall(r'Regra: Condição: (.*?); Situação: (.*)', prompt)[-1]
+        return fake_natural_context(condition, situation.strip())
+    if '"resposta_correta"' in prompt:
+        items = _json_after(prompt, "Itens:")
+        return json.dumps({item["id"]: fake_distractors(rng, item["resposta_correta"], item["quantidade"], item["evitar"])
+                           for item in items}, ensure_ascii=False)
+    if "Resposta Correta:" in prompt:
+        correct_answer = re.search(r'Resposta Correta: "(.*)"', prompt).group(1)
+        return "\n".join(fake_distractors(rng, correct_answer, 3))
+    if "premises" in prompt and "Implies" in prompt:
+        return "```json\n" + json.dumps(rng.choice(FORMALIZATIONS)) + "\n```"
+    return "Resposta simulada."
+
+class MockBackend(LLMBackend):
+    """Backend simulado com latência, falhas e quota de servidor configuráveis.
+
+    `latency` é a média em segundos (variação de ±50%); `error_rate` e `quota_error_rate` são
+    probabilidades por chamada; `server_rpm`, se definido, faz o "servidor" recusar com
+    `ResourceExhausted` chamadas acima desse limite por chave em 60 s.
+    """
+
+    cache_namespace = "mock"
+
+    def __init__(self, latency=0.0, error_rate=0.0, quota_error_rate=0.0, server_rpm=None, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.quota_error_rate = quota_error_rate
+        self.server_rpm = server_rpm
+        self.rng = random.Random(seed)
+        self.calls_by_key = defaultdict(deque)
+        self.stats = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def _delay(self):
+        with self._lock:
+            return self.latency * self.rng.uniform(0.5, 1.5) if self.latency else 0.0
+
+    def _respond(self, key, prompt):
+        with self._lock:
+            self.stats["calls"] += 1
+            now = time.monotonic()
+            window = self.calls_by_key[key]
+            while window and now - window[0] >= 60:
+                window.popleft()
+            if (self.server_rpm is not None and len(window) >= self.server_rpm) or self.rng.random() < self.quota_error_rate:
+                self.stats["quota_errors"] += 1
+                raise exceptions.ResourceExhausted("Quota simulada excedida.")
+            window.append(now)
+            if self.rng.random() < self.error_rate:
+                self.stats["errors"] += 1
+                raise RuntimeError("Erro simulado do backend.")
+        text = fake_response(prompt)
+        return LLMResponse(text, (len(prompt) + len(text)) // 4 + 1)
+
+    def generate(self, key, model_name, prompt, generation_config=None):
+        time.sleep(self._delay())
+        return self._respond(key, prompt)
+
+    async def generate_async(self, key, model_name, prompt, generation_config=None):
+        await asyncio.sleep(self._delay())
+        return self._respond(key, prompt)
+
+def add_backend_arguments(parser):
+    group = parser.add_argument_group("backend de LLM")
+    group.add_argument("--backend", choices=["gemini", "mock"], default="gemini",
+                       help="'mock' usa respostas sintéticas locais, sem rede nem quota.")
+    group.add_argument("--mock-latency", type=float, default=0.5, help="Latência média simulada, em segundos.")
+    group.add_argument("--mock-error-rate", type=float, default=0.0, help="Probabilidade de erro genérico por chamada.")
+    group.add_argument("--mock-quota-error-rate", type=float, default=0.0, help="Probabilidade de ResourceExhausted por chamada.")
+    group.add_argument("--mock-server-rpm", type=int, default=None, help="Limite de RPM imposto pelo servidor simulado.")
+    group.add_argument("--mock-keys", type=int, default=10, help="Número de chaves fictícias.")
+    group.add_argument("--mock-rpm", type=int, default=60, help="Quota de RPM declarada para cada chave fictícia.")
+    group.add_argument("--mock-tpm", type=int, default=1000000, help="Quota de TPM declarada para cada chave fictícia.")
+    group.add_argument("--mock-seed", type=int, default=0, help="Semente das falhas e latências simuladas.")
+    return parser
@@ -0,0 +1,114 @@
+"""
+Detecção de quase-duplicatas por MinHash sobre shingles de caracteres, com um índice LSH incremental.
+
+O texto é normalizado (minúsculas, sem pontuação, espaços simples) e quebrado em shingles de
+`SHINGLE_SIZE` caracteres. A assinatura MinHash estima a similaridade de Jaccard entre os
+conjuntos de shingles de dois textos. O índice divide a assinatura em `BANDS` faixas e só compara
+um texto novo com os já indexados que coincidem com ele em alguma faixa, então uma consulta não
+fica mais cara à medida que o índice cresce. Os hashes usam `crc32` e uma semente fixa, não o
+`hash()` do Python, então as assinaturas são as mesmas entre processos e execuções.
+"""
+import re
+import zlib
+
+import numpy as np
+
+# --- CONFIGURAÇÃO DA DETECÇÃO DE QUASE-DUPLICATAS ---
+NUM_PERMUTATIONS = 128
+# 8 linhas por faixa: pares com Jaccard 0.8 viram candidatos em ~95% dos casos, e trechos comuns a
+# muitos textos (aberturas de frase, conectivos) raramente bastam para encher uma faixa inteira.
+BANDS = 16
+SHINGLE_SIZE = 5
+DEFAULT_THRESHOLD = 0.8
+MINHASH_SEED = 1
+# ------------------------------------
+
+def normalize_text(text):
+    return re.sub(r'[\W_]+', ' ', text.casefold()).strip()
+
+def shingles(text, size=SHINGLE_SIZE):
+    """Conjunto de shingles de `size` caracteres do texto normalizado (o texto inteiro, se for mais curto)."""
+    text = normalize_text(text)
+    if len(text) <= size:
+        return {text}
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+def jaccard(text_a, text_b):
+    """Similaridade de Jaccard exata entre os shingles de dois textos (para poucas comparações, sem assinatura)."""
+    shingles_a, shingles_b = shingles(text_a), shingles(text_b)
+    return len(shingles_a & shingles_b) / len(shingles_a | shingles_b)
+
+def similarity(signature_a, signature_b):
+    """Similaridade de Jaccard estimada: a fração de posições iguais nas duas assinaturas."""
+    return float(np.count_nonzero(signature_a == signature_b)) / len(signature_a)
+
+class MinHashIndex:
+    """Índice incremental de textos; `add_if_new` indexa um texto só se não houver quase-duplicata dele.
+
+    Dois textos são quase-duplicatas quando a similaridade estimada é de pelo menos `threshold`.
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, num_permutations=NUM_PERMUTATIONS, bands=BANDS, seed=MINHASH_SEED):
+        if num_permutations % bands:
+            raise ValueError(f"NUM_PERMUTATIONS ({num_permutations}) deve ser múltiplo de BANDS ({bands}).")
+        rng = np.random.default_rng(seed)
+        # Hash multiply-shift: os 32 bits altos de (a*x + b) mod 2^64, com `a` ímpar.
+        self.a = rng.integers(0, 1 << 63, size=num_permutations, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self.b = rng.integers(0, 1 << 63, size=num_permutations, dtype=np.uint64)
+        self.threshold = threshold
+        self.rows = num_permutations // bands
+        self.buckets = [{} for _ in range(bands)]
+        # As assinaturas ficam numa matriz (uma linha por texto), comparadas de uma vez com os candidatos.
+        self.keys = []
+        self.rows_by_key = {}
+        self.matrix = np.empty((64, num_permutations), dtype=np.uint32)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self.rows_by_key
+
+    def signature(self, text):
+        values = shingles(text)
+        hashes = np.fromiter((zlib.crc32(value.encode('utf-8')) for value in values), dtype=np.uint64, count=len(values))
+        permuted = (np.outer(hashes, self.a) + self.b) >> np.uint64(32)
+        return permuted.min(axis=0).astype(np.uint32)
+
+    def _bands(self, signature):
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(len(self.buckets))]
+
+    def query(self, text=None, signature=None):
+        """Pares `(chave, similaridade)` dos textos indexados com similaridade >= `threshold`, do mais parecido ao menos."""
+        if signature is None:
+            signature = self.signature(text)
+        candidates = sorted({row for bucket, band in zip(self.buckets, self._bands(signature)) for row in bucket.get(band, ())})
+        if not candidates:
+            return []
+        similarities = np.count_nonzero(self.matrix[candidates] == signature, axis=1) / len(signature)
+        matches = [(self.keys[row], float(value)) for row, value in zip(candidates, similarities) if value >= self.threshold]
+        return sorted(matches, key=lambda match: -match[1])
+
+    def add(self, key, text=None, signature=None):
+        if signature is None:
+            signature = self.signature(text)
+        if key in self.rows_by_key:
+            raise KeyError(f"Chave '{key}' já está no índice.")
+        row = len(self.keys)
+        if row == len(self.matrix):
+            self.matrix = np.concatenate([self.matrix, np.empty_like(self.matrix)])
+        self.matrix[row] = signature
+        self.keys.append(key)
+        self.rows_by_key[key] = row
+        for bucket, band in zip(self.buckets, self._bands(signature)):
+            bucket.setdefault(band, []).append(row)
+        return signature
+
+    def add_if_new(self, key, text):
+        """Indexa `text` e devolve None, ou devolve o par `(chave, similaridade)` da quase-duplicata já indexada."""
+        signature = self.signature(text)
+        matches = self.query(signature=signature)
+        if matches:
+            return matches[0]
+        self.add(key, signature=signature)
+        return None
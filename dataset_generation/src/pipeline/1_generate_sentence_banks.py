@@ -1,4 +1,5 @@
 import os
+import argparse
 import json
 import re
 import logging
@@ -12,62 +13,235 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 
 from config import LOGIC_RULES_CONFIG
 from prompts import PROMPT_BANK, FALLBACK_PROMPT
-from engine import ApiKeyManager, make_api_call
+from engine import configure_backend, configure_cache, create_key_manager, discard_response, run_api_calls
+from cache import add_cache_arguments
+from checkpoint import JsonlCheckpoint, add_resume_arguments, item_hash
+from mock_backend import add_backend_arguments
+from near_duplicates import MinHashIndex
 
 PROJECT_ROOT = Path(__file__).parent.parent.parent.parent
 
 # --- CONFIGURAÇÃO DA ETAPA 1 ---
 NUM_INSTANCES_PER_RULE = 10
+BANKS_PER_REQUEST = 10
+MAX_GENERATION_ROUNDS = 5
+DUPLICATE_THRESHOLD = 0.8
 MODEL_NAME = 'gemini-2.5-pro'
 OUTPUT_FILE = PROJECT_ROOT / "dataset_generation" / "artifacts" / "stage_1_sentence_banks.jsonl"
+GENERATION_TOPICS = ["vida doméstica", "escola e estudos", "trabalho e escritório", "clima e natureza", "esportes",
+                     "transporte e trânsito", "saúde", "tecnologia", "culinária", "comércio e compras",
+                     "viagens", "agricultura", "música e arte", "animais de estimação", "obras e construção"]
 # ------------------------------------
 
-if __name__ == "__main__":
+# Pedidos além do primeiro ganham um tema e um número de variação: prompts (e hashes de checkpoint)
+# distintos, e exemplos menos parecidos com os dos outros pedidos.
+VARIATION_SUFFIX = """Variação {request_number}: situe os exemplos deste pedido no tema "{topic}"."""
+
+def parse_sentence_banks(response_text, rule_key):
+    """Extrai a lista de bancos de sentenças da resposta da LLM; lista vazia se a resposta for inválida."""
+    if not response_text:
+        return []
     try:
-        key_manager = ApiKeyManager()
-    except Exception as e:
-        print(f"CRÍTICO: Falha ao iniciar o gerenciador de chaves. Erro: {e}"); exit()
+        match = re.search(r'\[.*\]', response_text, re.DOTALL)
+        json_str = match.group(0) if match else response_text
+        sentence_banks_array = json.loads(json_str)
+    except json.JSONDecodeError:
+        logging.error(f"Falha ao decodificar a resposta JSON para {rule_key}. Resposta: {response_text}")
+        return []
+
+    if isinstance(sentence_banks_array, list) and len(sentence_banks_array) > 0:
+        return sentence_banks_array
+    logging.error(f"A resposta para {rule_key} não foi uma lista válida.")
+    return []
+
+def request_prompt(rule_key, num_banks, request_number):
+    """Prompt do pedido `request_number` de uma regra; o pedido 0 usa o prompt original, sem variação."""
+    prompt = PROMPT_BANK[rule_key].format(num_instances=num_banks)
+    if request_number == 0:
+        return prompt
+    topic = GENERATION_TOPICS[(request_number - 1) % len(GENERATION_TOPICS)]
+    return prompt + VARIATION_SUFFIX.format(request_number=request_number, topic=topic) + "\n"
+
+def bank_text(sentence_bank):
+    """Texto comparado na deduplicação: as sentenças afirmativas do banco, na ordem das chaves."""
+    return " ".join(str(sentence_bank[key]) for key in sorted(sentence_bank) if not key.startswith("not "))
+
+class RuleBankCollector:
+    """Junta os bancos de uma regra vindos de vários pedidos até ter `target` bancos únicos.
+
+    Cada banco recebido é comparado (MinHash, ver `near_duplicates`) com os já aceitos da regra,
+    inclusive os retomados do checkpoint; quase-duplicatas e bancos que passam do alvo são descartados.
+    """
+
+    def __init__(self, rule_key, target, banks_per_request=BANKS_PER_REQUEST, threshold=DUPLICATE_THRESHOLD):
+        self.rule_key = rule_key
+        self.target = target
+        self.banks_per_request = banks_per_request
+        self.index = MinHashIndex(threshold)
+        self.accepted = 0
+        self.requests = 0
+        self.received = 0
+        self.duplicates = 0
+        self.invalid = 0
+
+    @property
+    def done(self):
+        return self.accepted >= self.target
+
+    @property
+    def duplicate_rate(self):
+        return self.duplicates / self.received if self.received else 0.0
+
+    def next_requests(self):
+        """`(prompt, hash)` dos pedidos da próxima rodada, que juntos cobrem os bancos que ainda faltam."""
+        missing = max(self.target - self.accepted, 0)
+        requests = []
+        while missing > 0:
+            num_banks = min(missing, self.banks_per_request)
+            prompt = request_prompt(self.rule_key, num_banks, self.requests)
+            requests.append((prompt, item_hash(self.rule_key, prompt)))
+            self.requests += 1
+            missing -= num_banks
+        return requests
+
+    def add_stored(self, sentence_banks):
+        """Indexa bancos já aceitos numa execução anterior (lidos do checkpoint)."""
+        for sentence_bank in sentence_banks:
+            self.index.add(len(self.index), bank_text(sentence_bank))
+            self.accepted += 1
+
+    def add_response(self, sentence_banks):
+        """Bancos novos de uma resposta que entram na regra (sem quase-duplicatas e sem passar do alvo)."""
+        accepted = []
+        for sentence_bank in sentence_banks:
+            if not isinstance(sentence_bank, dict):
+                self.invalid += 1
+                continue
+            self.received += 1
+            if self.index.add_if_new(len(self.index), bank_text(sentence_bank)) is not None:
+                self.duplicates += 1
+            elif self.accepted + len(accepted) < self.target:
+                accepted.append(sentence_bank)
+        self.accepted += len(accepted)
+        return accepted
 
+def report_duplicates(collectors):
+    """Imprime, por regra, os bancos recebidos, as quase-duplicatas descartadas e a taxa de duplicação."""
+    print("\nDeduplicação dos bancos de sentenças:")
+    for collector in collectors:
+        status = "" if collector.done else f"  (INCOMPLETA: {collector.accepted}/{collector.target})"
+        print(f"  {collector.rule_key}: {collector.requests} pedidos, {collector.received} recebidos, "
+              f"{collector.duplicates} duplicatas ({collector.duplicate_rate:.1%}), {collector.accepted} únicos{status}")
+    received = sum(collector.received for collector in collectors)
+    duplicates = sum(collector.duplicates for collector in collectors)
+    print(f"  Total: {duplicates}/{received} bancos duplicados ({duplicates / received if received else 0:.1%}).")
+
+def run_stage_1(output_path, key_manager, num_instances=NUM_INSTANCES_PER_RULE, resume=True,
+                banks_per_request=BANKS_PER_REQUEST, threshold=DUPLICATE_THRESHOLD, max_rounds=MAX_GENERATION_ROUNDS):
+    """Etapa 1: gera `num_instances` bancos de sentenças únicos por regra de PL e grava em JSONL.
+
+    O alvo de cada regra é dividido em pedidos de até `banks_per_request` bancos, com temas
+    variados, feitos em paralelo. Quase-duplicatas (similaridade >= `threshold`) são descartadas e
+    novas rodadas de pedidos cobrem o que faltar, por até `max_rounds` rodadas. Com `resume=True`
+    os pedidos que já têm bancos gravados em `output_path` não são refeitos. Devolve os coletores
+    de cada regra, com as contagens de duplicatas.
+    """
     pl_rules = LOGIC_RULES_CONFIG.get('PL', {})
     if not pl_rules:
         print("ERRO: Nenhuma regra de Lógica Proposicional ('PL') encontrada em config.py.")
-        exit()
+        return
 
     print(f"INICIANDO ETAPA 1: Geração de Bancos de Sentenças (Foco: Lógica Proposicional)")
-    print(f"O resultado será salvo em: {OUTPUT_FILE}\n")
-    os.makedirs(OUTPUT_FILE.parent, exist_ok=True)
-
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-        for rule_name, rule_template in tqdm(pl_rules.items(), desc="Processando Regras de PL"):
-            
-            logic_type = 'PL'
-            rule_key = f"{logic_type}/{rule_name}"
-            
-            if rule_key not in PROMPT_BANK:
-                logging.warning(f"Nenhum prompt especializado encontrado para {rule_key}. Pulando esta regra.")
-                continue
-            
-            prompt_template = PROMPT_BANK[rule_key]
-            
-            prompt = prompt_template.format(num_instances=NUM_INSTANCES_PER_RULE)
-            
-            response_text = make_api_call(key_manager, MODEL_NAME, prompt, call_purpose=rule_key)
-            
-            if response_text:
-                try:
-                    match = re.search(r'\[.*\]', response_text, re.DOTALL)
-                    json_str = match.group(0) if match else response_text
-                    sentence_banks_array = json.loads(json_str)
-                    
-                    if isinstance(sentence_banks_array, list) and len(sentence_banks_array) > 0:
-                        for bank in sentence_banks_array:
-                            line_data = {"rule": rule_key, "sentence_bank": bank}
-                            f.write(json.dumps(line_data, ensure_ascii=False) + '\n')
-                    else:
-                        logging.error(f"A resposta para {rule_key} não foi uma lista válida.")
-
-                except json.JSONDecodeError:
-                    logging.error(f"Falha ao decodificar a resposta JSON para {rule_key}. Resposta: {response_text}")
+    print(f"O resultado será salvo em: {output_path}\n")
+    os.makedirs(output_path.parent, exist_ok=True)
+
+    collectors = []
+    for rule_name in pl_rules:
+        rule_key = f"PL/{rule_name}"
+        if rule_key not in PROMPT_BANK:
+            logging.warning(f"Nenhum prompt especializado encontrado para {rule_key}. Pulando esta regra.")
+            continue
+        collectors.append(RuleBankCollector(rule_key, num_instances, banks_per_request, threshold))
+
+    with JsonlCheckpoint(output_path, resume=resume) as checkpoint:
+        if checkpoint.completed:
+            print(f"Retomando: {len(checkpoint.completed)} pedidos já concluídos no checkpoint.")
+        progress = tqdm(total=len(collectors), desc="Processando Regras de PL")
+
+        for round_number in range(max_rounds):
+            pending = [collector for collector in collectors if not collector.done]
+            if not pending:
+                break
+            # Pedidos da rodada na ordem das regras; os já gravados vêm do checkpoint, sem chamada.
+            requests = [(collector, prompt, hash_value)
+                        for collector in pending for prompt, hash_value in collector.next_requests()]
+            stored = [[record["sentence_bank"] for record in checkpoint.completed.pop(hash_value)]
+                      if checkpoint.is_completed(hash_value) else None
+                      for _, _, hash_value in requests]
+            to_call = [i for i, banks in enumerate(stored) if banks is None]
+            next_request = 0
+
+            def consume_until(end):
+                # Processa os pedidos na ordem da rodada, então o resultado não depende da ordem das respostas.
+                nonlocal next_request
+                while next_request < end:
+                    collector = requests[next_request][0]
+                    was_done = collector.done
+                    collector.add_stored(stored[next_request])
+                    if collector.done and not was_done:
+                        progress.update(1)
+                    next_request += 1
+
+            def write_sentence_banks(index, response_text):
+                nonlocal next_request
+                request_index = to_call[index]
+                consume_until(request_index)
+                collector, prompt, hash_value = requests[request_index]
+                was_done = collector.done
+                sentence_banks = parse_sentence_banks(response_text, collector.rule_key)
+                if not sentence_banks:
+                    discard_response(MODEL_NAME, prompt)
+                accepted = collector.add_response(sentence_banks)
+                # Um pedido sem bancos novos fica fora do checkpoint e é refeito numa próxima execução.
+                if accepted:
+                    checkpoint.write(hash_value, [{"rule": collector.rule_key, "sentence_bank": bank} for bank in accepted])
+                if collector.done and not was_done:
+                    progress.update(1)
+                next_request = request_index + 1
 
+            run_api_calls(key_manager, MODEL_NAME, [requests[i][1] for i in to_call],
+                          call_purposes=[requests[i][0].rule_key for i in to_call], on_result=write_sentence_banks)
+            consume_until(len(requests))
+        progress.close()
+
+    report_duplicates(collectors)
+    for collector in collectors:
+        if not collector.done:
+            logging.warning(f"{collector.rule_key}: só {collector.accepted} de {collector.target} bancos únicos "
+                            f"após {max_rounds} rodadas.")
     print(f"\nETAPA 1 CONCLUÍDA.")
+    return collectors
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Etapa 1: geração dos bancos de sentenças.")
+    add_cache_arguments(parser)
+    add_backend_arguments(parser)
+    add_resume_arguments(parser)
+    parser.add_argument("--num-instances", type=int, default=NUM_INSTANCES_PER_RULE, help="Bancos únicos por regra.")
+    parser.add_argument("--banks-per-request", type=int, default=BANKS_PER_REQUEST, help="Bancos pedidos por chamada.")
+    parser.add_argument("--duplicate-threshold", type=float, default=DUPLICATE_THRESHOLD,
+                        help="Similaridade (Jaccard estimado) a partir da qual um banco é considerado duplicado.")
+    parser.add_argument("--max-rounds", type=int, default=MAX_GENERATION_ROUNDS,
+                        help="Rodadas de novos pedidos para repor as duplicatas descartadas.")
+    args = parser.parse_args()
+    configure_cache(args)
+    configure_backend(args)
+
+    try:
+        key_manager = create_key_manager(args)
+    except Exception as e:
+        print(f"CRÍTICO: Falha ao iniciar o gerenciador de chaves. Erro: {e}"); exit()
+
+    run_stage_1(OUTPUT_FILE, key_manager, args.num_instances, resume=not args.restart,
+                banks_per_request=args.banks_per_request, threshold=args.duplicate_threshold, max_rounds=args.max_rounds)
     print(f"Por favor, analise o arquivo '{OUTPUT_FILE}' antes de prosseguir para a Etapa 2.")
\ No newline at end of file
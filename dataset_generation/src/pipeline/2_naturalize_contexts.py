@@ -1,4 +1,5 @@
 import os
+import argparse
 import json
 import re
 import logging
@@ -10,39 +11,143 @@ sys.path.append(str(Path(__file__).parent.parent))
 os.environ['GRPC_VERBOSITY'] = 'ERROR'
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-from config import LOGIC_RULES_CONFIG
-from engine import ApiKeyManager, make_api_call
+from config import COMPILED_RULES
+from templates import capitalize_first
+from engine import configure_backend, configure_cache, create_key_manager, discard_response, make_api_call, run_api_calls
+from cache import add_cache_arguments
+from checkpoint import JsonlCheckpoint, add_resume_arguments, item_hash
+from mock_backend import add_backend_arguments
+from sentence_banks import BANK_KEY_FIELD, bank_key, normalize_bank, write_normalized_banks
 
 PROJECT_ROOT = Path(__file__).parent.parent.parent.parent
 
 # --- CONFIGURAÇÃO DA ETAPA 2 ---
 INPUT_FILE = PROJECT_ROOT / "dataset_generation" / "artifacts" / "stage_1_sentence_banks.jsonl"
 OUTPUT_STAGE_2A_FILE = PROJECT_ROOT / "dataset_generation" / "artifacts" / "stage_2a_templated_contexts.jsonl"
+NORMALIZED_BANKS_FILE = PROJECT_ROOT / "dataset_generation" / "artifacts" / "stage_2a_normalized_banks.arrow"
 OUTPUT_STAGE_2B_FILE = PROJECT_ROOT / "dataset_generation" / "artifacts" / "stage_2b_naturalized_contexts.jsonl"
 MODEL_NAME = 'gemini-2.5-pro'
+NATURALIZATION_BATCH_SIZE = 10
+MAX_BATCH_ROUNDS = 3
 # ------------------------------------
 
-def naturalize_context(key_manager, model_name, condition, situation, rule_key):
-    
-    example_context = """Regra: Condição: Se Liam terminar seu trabalho cedo, então ele pedirá pizza para o jantar.; Situação: Ele não vai pedir pizza para o jantar.
+NATURALIZATION_EXAMPLE = """Regra: Condição: Se Liam terminar seu trabalho cedo, então ele pedirá pizza para o jantar.; Situação: Ele não vai pedir pizza para o jantar.
 Contexto: Liam terminou seu trabalho mais cedo naquele dia, o que significava que ele normalmente pediria pizza para o jantar. No entanto, neste dia em particular, ele decidiu não pedir pizza e optou por outra coisa."""
 
-    prompt = f"""Melhore o contexto para uma linguagem humana e crie uma história com as sentenças reformuladas.
-Instruções para gerar uma boa história:
+NATURALIZATION_INSTRUCTIONS = """Instruções para gerar uma boa história:
 1. Ao gerar a história, use as sentenças reformuladas do contexto da história.
 2. Certifique-se de incluir sentenças correspondentes à condição e à situação da regra na história.
 3. Não adicione nenhuma outra informação extra.
 4. Para gerar a história, NÃO mude o nome do personagem principal do contexto, se houver.
 5. Gere apenas um parágrafo com as sentenças reformuladas.
-6. **NUNCA, EM HIPÓTESE ALGUMA, afirme ou descreva a CONCLUSÃO LÓGICA**. O objetivo é que a conclusão precise ser inferida.
+6. **NUNCA, EM HIPÓTESE ALGUMA, afirme ou descreva a CONCLUSÃO LÓGICA**. O objetivo é que a conclusão precise ser inferida."""
+
+def build_naturalization_prompt(condition, situation):
+
+    prompt = f"""Melhore o contexto para uma linguagem humana e crie uma história com as sentenças reformuladas.
+{NATURALIZATION_INSTRUCTIONS}
 
 ---
-{example_context}
+{NATURALIZATION_EXAMPLE}
 ---
 Regra: Condição: {condition}; Situação: {situation}
 Contexto:"""
+    return prompt
+
+def build_batched_naturalization_prompt(items, round_number=0):
+    """Empacota vários itens `(id, condição, situação)` em um único prompt que pede um array JSON.
+
+    A partir da segunda rodada o prompt traz o número da tentativa: um lote de um só item que
+    falhou não repete byte a byte o prompt anterior (nem a resposta guardada no cache).
+    """
+    items_json = json.dumps(
+        [{"id": item_id, "condicao": condition, "situacao": situation} for item_id, condition, situation in items],
+        ensure_ascii=False, indent=2)
+    retry_note = f"\nTentativa {round_number + 1}: a resposta anterior veio incompleta ou malformada.\n" if round_number else ""
+
+    prompt = f"""Para CADA item da lista abaixo, melhore o contexto para uma linguagem humana e crie uma história com as sentenças reformuladas.
+Cada item é independente: trate-o como uma regra separada, no mesmo formato do exemplo.
+{NATURALIZATION_INSTRUCTIONS}
+
+---
+{NATURALIZATION_EXAMPLE}
+---{retry_note}
+Itens:
+{items_json}
+
+Forneça APENAS um array JSON bruto, sem markdown, com exatamente um objeto por item no formato {{"id": <id do item>, "contexto": "<parágrafo>"}}."""
+    return prompt
+
+def parse_batched_naturalization(response_text, expected_ids):
+    """Devolve `{id: contexto}` apenas para os itens esperados que vieram bem formados (ids "3" e 3 valem o mesmo)."""
+    if not response_text:
+        return {}
+    try:
+        match = re.search(r'\[.*\]', response_text, re.DOTALL)
+        parsed = json.loads(match.group(0) if match else response_text)
+    except json.JSONDecodeError:
+        return {}
+    if not isinstance(parsed, list):
+        return {}
+
+    expected_ids = set(expected_ids)
+    contexts = {}
+    for entry in parsed:
+        if not isinstance(entry, dict):
+            continue
+        try:
+            item_id = int(entry.get("id"))
+        except (TypeError, ValueError):
+            continue
+        context = entry.get("contexto")
+        if item_id in expected_ids and isinstance(context, str) and context.strip():
+            contexts[item_id] = context.strip()
+    return contexts
+
+def naturalize_context(key_manager, model_name, condition, situation, rule_key):
+    prompt = build_naturalization_prompt(condition, situation)
     return make_api_call(key_manager, model_name, prompt, call_purpose=f"Naturalização ({rule_key})")
 
+def naturalize_in_batches(key_manager, model_name, items, batch_size, on_result):
+    """Naturaliza `items` (dicts com "condition" e "situation") em lotes de `batch_size` por chamada.
+
+    `on_result(index, contexto)` é chamado para cada item resolvido. Itens ausentes ou malformados
+    na resposta são reenviados em lotes menores; os que esgotarem as rodadas recebem `None`.
+    """
+    remaining = list(range(len(items)))
+    for round_number in range(MAX_BATCH_ROUNDS):
+        if not remaining:
+            break
+        batches = [remaining[i:i + batch_size] for i in range(0, len(remaining), batch_size)]
+        prompts = [
+            build_batched_naturalization_prompt([(idx, items[idx]["condition"], items[idx]["situation"]) for idx in batch],
+                                                round_number)
+            for batch in batches
+        ]
+        call_purposes = [f"Naturalização em lote ({len(batch)} itens, rodada {round_number + 1})" for batch in batches]
+        missing = []
+
+        def collect_batch(batch_index, response_text):
+            batch = batches[batch_index]
+            contexts = parse_batched_naturalization(response_text, batch)
+            if len(contexts) < len(batch):
+                discard_response(model_name, prompts[batch_index])
+            for idx in batch:
+                if idx in contexts:
+                    on_result(idx, contexts[idx])
+                else:
+                    missing.append(idx)
+
+        run_api_calls(key_manager, model_name, prompts, call_purposes=call_purposes, on_result=collect_batch, ordered=False)
+        remaining = sorted(missing)
+        if remaining:
+            logging.warning(f"{len(remaining)} itens ausentes ou malformados na rodada {round_number + 1}; reenviando.")
+        # Lotes menores na próxima rodada falham menos; o número da rodada no prompt evita repetir o prompt anterior.
+        batch_size = max(1, batch_size // 2)
+
+    for idx in remaining:
+        on_result(idx, None)
+
 def parse_audit_log(log_path):
     
     if not log_path.exists():
@@ -58,8 +163,36 @@ def parse_audit_log(log_path):
             logging.warning(f"Pulando linha malformada no log de entrada: {line.strip()}")
     return parsed_data
 
-def run_stage_2a(input_path, output_path):
-    """Etapa 2a: Lê os bancos de sentenças, limpa os dados e gera o arquivo com os contextos templatizados."""
+def build_templated_context(rule_key, sentence_bank, rule, bank=None):
+    """Preenche o `template_context` compilado da regra com o banco normalizado; None se faltar chave.
+
+    `bank` é o banco já normalizado (ver `sentence_banks.normalize_bank`); sem ele, a normalização é feita aqui.
+    """
+    cleaned_bank = bank if bank is not None else normalize_bank(rule, sentence_bank)
+
+    try:
+        filled_context = rule.context.render(cleaned_bank)
+    except KeyError as e:
+        logging.error(f"KeyError para a regra {rule_key}. Chave faltando: {e}.")
+        return None
+    # Garante que a frase final comece com letra maiúscula
+    filled_context = capitalize_first(filled_context)
+
+    parts = filled_context.split('. ')
+    condition = ('. '.join(parts[:-1]) + '.') if len(parts) > 1 else filled_context
+    situation = parts[-1] if len(parts) > 1 else ""
+
+    return {
+        "rule": rule_key,
+        "sentence_bank": sentence_bank, # Salva o original para referência
+        BANK_KEY_FIELD: bank_key(rule_key, sentence_bank), # Linha do banco normalizado no artefato Arrow
+        "templated_context": filled_context, # Salva o contexto limpo
+        "condition": condition,
+        "situation": situation
+    }
+
+def run_stage_2a(input_path, output_path, banks_path=NORMALIZED_BANKS_FILE):
+    """Etapa 2a: normaliza os bancos de sentenças, grava-os em `banks_path` e gera o arquivo com os contextos templatizados."""
     print(f"INICIANDO ETAPA 2a: Geração de Contextos Templatizados")
     print(f"Lendo bancos de sentenças de: {input_path}")
     print(f"O resultado será salvo em: {output_path}\n")
@@ -69,58 +202,28 @@ def run_stage_2a(input_path, output_path):
 
     all_banks_data = parse_audit_log(input_path)
 
+    normalized = {}
     with open(output_path, 'w', encoding='utf-8') as f_out:
         for data in tqdm(all_banks_data, desc="Etapa 2a - Gerando Templates"):
             try:
                 rule_key = data["rule"]
                 sentence_bank = data["sentence_bank"]
-                logic_type, rule_name = rule_key.split('/')
-                rule_template = LOGIC_RULES_CONFIG[logic_type][rule_name]
-            except (KeyError, ValueError):
+                rule = COMPILED_RULES[rule_key]
+            except KeyError:
                 continue
 
-            # Etapa de limpeza do banco de sentenças
-            cleaned_bank = {}
-            for key, value in sentence_bank.items():
-                # 1. Remove espaços em branco e o ponto final
-                cleaned_value = value.strip().removesuffix('.')
-                # 2. Converte a primeira letra para minúscula
-                if cleaned_value:
-                    cleaned_value = cleaned_value[0].lower() + cleaned_value[1:]
-                cleaned_bank[key] = cleaned_value
-            
-            all_props = set(re.findall(r'\{([a-zA-Z0-9_ ]+)\}', json.dumps(rule_template)))
-            for prop in all_props:
-                if prop not in cleaned_bank and prop.startswith("not "):
-                    base_key = prop.replace("not ", "")
-                    if base_key in cleaned_bank:
-                        cleaned_bank[prop] = "não " + cleaned_bank[base_key]
-            
-            try:
-                filled_context = rule_template["template_context"].format(**cleaned_bank)
-                # Garante que a frase final comece com letra maiúscula
-                if filled_context:
-                    filled_context = filled_context[0].upper() + filled_context[1:]
-                
-                parts = filled_context.split('. ')
-                condition = ('. '.join(parts[:-1]) + '.') if len(parts) > 1 else filled_context
-                situation = parts[-1] if len(parts) > 1 else ""
-
-                output_data = {
-                    "rule": rule_key,
-                    "sentence_bank": sentence_bank, # Salva o original para referência
-                    "templated_context": filled_context, # Salva o contexto limpo
-                    "condition": condition,
-                    "situation": situation
-                }
+            bank = normalize_bank(rule, sentence_bank)
+            output_data = build_templated_context(rule_key, sentence_bank, rule, bank)
+            if output_data:
+                normalized[output_data[BANK_KEY_FIELD]] = (rule_key, bank)
                 f_out.write(json.dumps(output_data, ensure_ascii=False) + '\n')
-            except KeyError as e:
-                logging.error(f"KeyError para a regra {rule_key}. Chave faltando: {e}.")
 
+    write_normalized_banks(banks_path, ((key, rule_key, bank) for key, (rule_key, bank) in normalized.items()))
+    print(f"{len(normalized)} bancos normalizados salvos em: {banks_path}")
     print(f"\nETAPA 2a CONCLUÍDA.")
 
-def run_stage_2b(input_path, output_path, key_manager):
-  
+def run_stage_2b(input_path, output_path, key_manager, batch_size=NATURALIZATION_BATCH_SIZE, resume=True):
+    """Etapa 2b: naturaliza os contextos da 2a via API; com `resume=True` pula os já gravados em `output_path`."""
     print(f"\nINICIANDO ETAPA 2b: Naturalização de Contextos")
     print(f"Lendo contextos templatizados de: {input_path}")
     print(f"O resultado será salvo em: {output_path}\n")
@@ -128,33 +231,75 @@ def run_stage_2b(input_path, output_path, key_manager):
     if not input_path.exists():
         raise FileNotFoundError(f"Arquivo de entrada da Etapa 2a '{input_path.name}' não encontrado.")
 
-    with open(input_path, 'r', encoding='utf-8') as f_in, open(output_path, 'w', encoding='utf-8') as f_out:
-        lines = f_in.readlines()
-        for line in tqdm(lines, desc="Etapa 2b - Naturalizando"):
-            try:
-                data = json.loads(line)
-                rule_key = data["rule"]
-                condition = data["condition"]
-                situation = data["situation"]
-            except (json.JSONDecodeError, KeyError):
-                continue
-            
-            natural_context = naturalize_context(key_manager, MODEL_NAME, condition, situation, rule_key)
-            if not natural_context:
-                natural_context = f"{condition} {situation}".strip()
-
-            output_data = {
-                "rule": rule_key,
-                "sentence_bank": data["sentence_bank"],
-                "natural_context": natural_context
-            }
-            f_out.write(json.dumps(output_data, ensure_ascii=False) + '\n')
+    with JsonlCheckpoint(output_path, resume=resume) as checkpoint:
+        pending, hashes, skipped = [], [], 0
+        with open(input_path, 'r', encoding='utf-8') as f_in:
+            for line in f_in:
+                try:
+                    data = json.loads(line)
+                    hash_value = item_hash(data["rule"], data["sentence_bank"], data["condition"], data["situation"])
+                except (json.JSONDecodeError, KeyError):
+                    continue
+                if checkpoint.take(hash_value) is not None:
+                    skipped += 1
+                    continue
+                pending.append(data)
+                hashes.append(hash_value)
 
+        if skipped:
+            print(f"Retomando: {skipped} contextos já naturalizados no checkpoint.")
+        progress = tqdm(total=len(pending), desc="Etapa 2b - Naturalizando")
+        resolved, next_to_write, fallbacks = {}, 0, 0
+
+        # Os lotes resolvem os itens fora de ordem; a gravação mantém a ordem da Etapa 2a.
+        def write_natural_context(index, natural_context):
+            nonlocal next_to_write, fallbacks
+            progress.update(1)
+            resolved[index] = natural_context
+
+            while next_to_write in resolved:
+                data = pending[next_to_write]
+                natural_context = resolved.pop(next_to_write)
+                output_data = {
+                    "rule": data["rule"],
+                    "sentence_bank": data["sentence_bank"],
+                    BANK_KEY_FIELD: bank_key(data["rule"], data["sentence_bank"]),
+                    "natural_context": natural_context or f"{data['condition']} {data['situation']}".strip()
+                }
+                # Só o texto da LLM entra no checkpoint; o templatizado vai sem hash e é refeito na retomada.
+                if natural_context:
+                    checkpoint.write(hashes[next_to_write], [output_data])
+                else:
+                    checkpoint.write_provisional([output_data])
+                    fallbacks += 1
+                next_to_write += 1
+
+        if batch_size > 1:
+            naturalize_in_batches(key_manager, MODEL_NAME, pending, batch_size, write_natural_context)
+        else:
+            prompts = [build_naturalization_prompt(data["condition"], data["situation"]) for data in pending]
+            call_purposes = [f"Naturalização ({data['rule']})" for data in pending]
+            run_api_calls(key_manager, MODEL_NAME, prompts, call_purposes=call_purposes, on_result=write_natural_context)
+        progress.close()
+
+    if fallbacks:
+        print(f"{fallbacks} contextos ficaram com o texto templatizado; rode de novo para tentar naturalizá-los.")
     print(f"\nETAPA 2b CONCLUÍDA.")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Etapa 2: contextos templatizados (2a) e naturalizados (2b).")
+    parser.add_argument("--batch-size", type=int, default=NATURALIZATION_BATCH_SIZE,
+                        help="Contextos por chamada na Etapa 2b (1 desativa o modo em lote).")
+    parser.add_argument("--yes", action="store_true", help="Segue para a Etapa 2b sem pedir confirmação.")
+    add_cache_arguments(parser)
+    add_backend_arguments(parser)
+    add_resume_arguments(parser)
+    args = parser.parse_args()
+    configure_cache(args)
+    configure_backend(args)
+
     try:
-        key_manager = ApiKeyManager()
+        key_manager = create_key_manager(args)
     except Exception as e:
         print(f"CRÍTICO: Falha ao iniciar o gerenciador de chaves. Erro: {e}"); exit()
 
@@ -162,11 +307,15 @@ if __name__ == "__main__":
 
     print("-" * 50)
     print(f"Artefato da Etapa 2a foi salvo em '{OUTPUT_STAGE_2A_FILE.name}'.")
-    user_input = input("Por favor, verifique o arquivo. Deseja continuar para a Etapa 2b (Naturalização)? (s/n): ")
+    if args.yes:
+        user_input = 's'
+    else:
+        user_input = input("Por favor, verifique o arquivo. Deseja continuar para a Etapa 2b (Naturalização)? (s/n): ")
     print("-" * 50)
 
     if user_input.lower() == 's':
-        run_stage_2b(OUTPUT_STAGE_2A_FILE, OUTPUT_STAGE_2B_FILE, key_manager)
+        run_stage_2b(OUTPUT_STAGE_2A_FILE, OUTPUT_STAGE_2B_FILE, key_manager, batch_size=args.batch_size,
+                     resume=not args.restart)
         print(f"Processo completo. O resultado final da Etapa 2 está em '{OUTPUT_STAGE_2B_FILE.name}'.")
     else:
         print("Execução da Etapa 2b cancelada pelo usuário.")
\ No newline at end of file
@@ -1,106 +1,114 @@
-import os
-import json
-import re
+import argparse
 import logging
 from pathlib import Path
 from tqdm import tqdm
 import random
-from collections import defaultdict
 
 import sys
 sys.path.append(str(Path(__file__).parent.parent))
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-from config import LOGIC_RULES_CONFIG
+from config import COMPILED_RULES
+from templates import capitalize_first
+from sentence_banks import NormalizedBanks, normalized_banks_for
+from assembly import (ASSEMBLY_WORKERS, DEFAULT_SEED, add_assembly_arguments, index_lines_by_rule, instance_rng,
+                      map_shards, read_lines_at, serialize_samples, shards, write_sharded_samples)
 
 PROJECT_ROOT = Path(__file__).parent.parent.parent.parent
 
 # --- CONFIGURAÇÃO DA ETAPA 3 (BQA) ---
 INPUT_FILE = PROJECT_ROOT / "dataset_generation" / "artifacts" / "stage_2b_naturalized_contexts.jsonl"
 BASE_OUTPUT_DIR = PROJECT_ROOT / "dataset_generation" / "output" / "LogicBench(Eval)" / "BQA"
+NORMALIZED_BANKS_FILE = PROJECT_ROOT / "dataset_generation" / "artifacts" / "stage_2a_normalized_banks.arrow"
 # ------------------------------------
 
-def parse_stage_2_log(log_path):
-    if not log_path.exists():
-        raise FileNotFoundError(f"Arquivo de log da Etapa 2 '{log_path}' não encontrado.")
-    
-    instances_by_rule = defaultdict(list)
-    
-    with open(log_path, 'r', encoding='utf-8') as f:
-        for line in f:
-            try:
-                data = json.loads(line)
-                rule_key = data["rule"]
-                instances_by_rule[rule_key].append(data)
-            except (json.JSONDecodeError, KeyError):
-                logging.warning(f"Pulando linha malformada no log de entrada: {line.strip()}")
-                
-    return instances_by_rule
+def build_bqa_sample(rule_key, rule, sample_id, instance_data, cleaned_bank, rng=random):
+    """Monta um sample BQA (contexto + perguntas Sim/Não) a partir do banco normalizado; None se não houver perguntas.
 
-if __name__ == "__main__":
-    input_log_path = INPUT_FILE
-    
+    `rng` sorteia a variante de cada pergunta (ver `assembly.instance_rng`).
+    """
+    natural_context = instance_data["natural_context"]
+
+    bqa_questions = []
+    for variants, answer in rule.bqa_questions:
+        try:
+            formatted_question = capitalize_first(rng.choice(variants).render(cleaned_bank))
+            bqa_questions.append({"question": formatted_question, "answer": answer})
+        except KeyError as e:
+            logging.error(f"KeyError na regra {rule_key}, instância {sample_id}: Chave '{e}'. Pulando pergunta.")
+
+    if not bqa_questions:
+        return None
+    return {"id": sample_id, "context": natural_context, "qa_pairs": bqa_questions}
+
+# Bancos normalizados abertos em cada processo do pool, reaproveitados entre as fatias.
+_open_banks = {}
+
+def _banks_in_process(banks_path):
+    if banks_path not in _open_banks:
+        _open_banks[banks_path] = NormalizedBanks.open(banks_path)
+    return _open_banks[banks_path]
+
+def _close_banks_in_process():
+    for banks in _open_banks.values():
+        if banks is not None:
+            banks.close()
+    _open_banks.clear()
+
+def assemble_bqa_shard(task):
+    """Lê uma fatia de instâncias de uma regra no log 2b e devolve os samples BQA já serializados (trecho, quantidade)."""
+    input_log_path, banks_path, rule_key, first_id, offsets, seed, output_format = task
+    rule = COMPILED_RULES[rule_key]
+    instances = list(read_lines_at(input_log_path, offsets))
+    cleaned_banks = normalized_banks_for(instances, [rule] * len(instances), _banks_in_process(banks_path))
+
+    samples = []
+    for sample_id, (instance_data, cleaned_bank) in enumerate(zip(instances, cleaned_banks), start=first_id):
+        sample = build_bqa_sample(rule_key, rule, sample_id, instance_data, cleaned_bank,
+                                  instance_rng(seed, rule_key, sample_id))
+        if sample:
+            samples.append(sample)
+    return serialize_samples(samples, output_format), len(samples)
+
+def run_stage_3(input_log_path, base_output_dir, banks_path=NORMALIZED_BANKS_FILE, workers=ASSEMBLY_WORKERS,
+                seed=DEFAULT_SEED, output_format="json"):
+    """Etapa 3.1: monta os arquivos BQA finais, por regra, a partir dos contextos naturalizados.
+
+    O log 2b é só indexado (offsets por regra); fatias de instâncias são montadas em `workers`
+    processos e gravadas em fluxo. Os bancos normalizados vêm do artefato `banks_path` da Etapa 2a.
+    """
     print(f"INICIANDO ETAPA 3.1: Finalização e Montagem do Dataset BQA")
     print(f"Lendo contextos naturalizados de: {input_log_path}")
-    all_instances_data = parse_stage_2_log(input_log_path)
+    if not input_log_path.exists():
+        raise FileNotFoundError(f"Arquivo de log da Etapa 2 '{input_log_path}' não encontrado.")
+    offsets_by_rule = index_lines_by_rule(input_log_path)
 
-    base_output_dir = BASE_OUTPUT_DIR
     print(f"Gerando arquivos finais em: {base_output_dir}\n")
 
-    for rule_key, instances in tqdm(all_instances_data.items(), desc="Finalizando Regras BQA"):
-        try:
-            logic_type, rule_name = rule_key.split('/')
-            rule_template = LOGIC_RULES_CONFIG[logic_type][rule_name]
-        except (KeyError, ValueError):
+    tasks, rules_to_build = [], []
+    for rule_key, offsets in offsets_by_rule.items():
+        if rule_key not in COMPILED_RULES:
             logging.error(f"Regra '{rule_key}' não encontrada no config.py. Pulando.")
             continue
-        
-        logic_type_folder_name = {"PL": "propositional_logic", "FOL": "first_order_logic", "NM": "nm_logic"}.get(logic_type, logic_type)
-        output_dir_for_rule = base_output_dir / logic_type_folder_name / rule_name
-        os.makedirs(output_dir_for_rule, exist_ok=True)
-        
-        file_path = output_dir_for_rule / "data_instances.json"
-        final_json_output = {"type": logic_type_folder_name, "axiom": rule_name.lower(), "samples": []}
-
-        for i, instance_data in enumerate(instances):
-            original_sentence_bank = instance_data["sentence_bank"]
-            natural_context = instance_data["natural_context"]
-
-            cleaned_bank = {}
-            for key, value in original_sentence_bank.items():
-                cleaned_value = value.strip().removesuffix('.')
-                if cleaned_value:
-                    cleaned_value = cleaned_value[0].lower() + cleaned_value[1:]
-                cleaned_bank[key] = cleaned_value
-
-            bqa_questions = []
-            for q_template in rule_template["bqa_templates"]:
-                try:
-                    question_text_template = random.choice(q_template["question"])
-                    
-                    formatted_question = ""
-                    if isinstance(question_text_template, dict):
-                        prefix = question_text_template["prefix"].format(**cleaned_bank)
-                        formatted_clauses = [c.format(**cleaned_bank) for c in question_text_template["clauses"]]
-                        formatted_question = prefix + " e ".join(formatted_clauses) + "?"
-                    else:
-                        formatted_question = question_text_template.format(**cleaned_bank)
-                    
-                    if formatted_question:
-                        formatted_question = formatted_question[0].upper() + formatted_question[1:]
-
-                    bqa_questions.append({"question": formatted_question, "answer": q_template["answer"]})
-                except KeyError as e:
-                    logging.error(f"KeyError na regra {rule_key}, instância {i+1}: Chave '{e}'. Pulando pergunta.")
-            
-            if bqa_questions:
-                sample = {"id": i + 1, "context": natural_context, "qa_pairs": bqa_questions}
-                final_json_output["samples"].append(sample)
-
-        if final_json_output["samples"]:
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(final_json_output, f, ensure_ascii=False, indent=4)
+        rules_to_build.append(rule_key)
+        tasks += [(input_log_path, banks_path, rule_key, start + 1, chunk, seed, output_format)
+                  for start, chunk in shards(offsets)]
+
+    results = map_shards(assemble_bqa_shard, tasks, workers)
+    try:
+        with tqdm(total=len(rules_to_build), desc="Finalizando Regras BQA") as progress:
+            write_sharded_samples(base_output_dir, [task[2] for task in tasks], results, output_format,
+                                  on_rule_done=lambda: progress.update(1))
+    finally:
+        # Com `workers=1` as fatias rodam neste processo; o artefato não fica aberto após a etapa.
+        _close_banks_in_process()
 
     print(f"\nETAPA 3.1 (BQA) CONCLUÍDA.")
-    print(f"Dataset BQA final gerado com sucesso na pasta '{base_output_dir}'.")
\ No newline at end of file
+    print(f"Dataset BQA final gerado com sucesso na pasta '{base_output_dir}'.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Etapa 3.1: montagem do dataset BQA.")
+    add_assembly_arguments(parser)
+    args = parser.parse_args()
+    run_stage_3(INPUT_FILE, BASE_OUTPUT_DIR, workers=args.workers, seed=args.seed, output_format=args.output_format)
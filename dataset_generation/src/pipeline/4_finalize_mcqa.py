@@ -1,11 +1,11 @@
 import os
+import argparse
 import json
 import re
 import logging
 from pathlib import Path
 from tqdm import tqdm
 import random
-from collections import defaultdict
 
 import sys
 sys.path.append(str(Path(__file__).parent.parent))
@@ -13,33 +13,32 @@ sys.path.append(str(Path(__file__).parent.parent))
 os.environ['GRPC_VERBOSITY'] = 'ERROR'
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-from config import LOGIC_RULES_CONFIG
-from engine import ApiKeyManager, make_api_call
+from config import COMPILED_RULES
+from templates import capitalize_first
+from engine import configure_backend, configure_cache, create_key_manager, discard_response, make_api_call, run_api_calls
+from cache import add_cache_arguments
+from checkpoint import JsonlCheckpoint, add_resume_arguments, item_hash
+from mock_backend import add_backend_arguments
+from sentence_banks import NormalizedBanks, normalized_banks_for
+from assembly import (ASSEMBLY_WORKERS, DEFAULT_SEED, SHARD_SIZE, add_assembly_arguments, index_lines_by_rule, instance_rng,
+                      map_shards, read_lines_at, serialize_samples, shards, write_sharded_samples)
 
 PROJECT_ROOT = Path(__file__).parent.parent.parent.parent
 
 # --- CONFIGURAÇÃO DA ETAPA 3.2 (MCQA) ---
 INPUT_FILE = PROJECT_ROOT / "dataset_generation" / "artifacts" / "stage_2b_naturalized_contexts.jsonl"
 BASE_OUTPUT_DIR = PROJECT_ROOT / "dataset_generation" / "output" / "LogicBench(Eval)" / "MCQA"
+DISTRACTORS_FILE = PROJECT_ROOT / "dataset_generation" / "artifacts" / "stage_4_distractors.jsonl"
+NORMALIZED_BANKS_FILE = PROJECT_ROOT / "dataset_generation" / "artifacts" / "stage_2a_normalized_banks.arrow"
 MODEL_NAME = 'gemini-2.5-pro'
+NUM_DISTRACTORS = 3
+DISTRACTORS_BATCH_SIZE = 10
+MAX_BATCH_ROUNDS = 3
+# Itens cujos distratores são pedidos numa mesma rodada de chamadas (limita o que fica em memória).
+DISTRACTORS_WINDOW = 2000
 # ------------------------------------
 
-def parse_stage_2_log(log_path):
-    if not log_path.exists():
-        raise FileNotFoundError(f"Arquivo de log da Etapa 2 '{log_path}' não encontrado.")
-    
-    instances_by_rule = defaultdict(list)
-    with open(log_path, 'r', encoding='utf-8') as f:
-        for line in f:
-            try:
-                data = json.loads(line)
-                rule_key = data["rule"]
-                instances_by_rule[rule_key].append(data)
-            except (json.JSONDecodeError, KeyError):
-                logging.warning(f"Pulando linha malformada no log de entrada: {line.strip()}")
-    return instances_by_rule
-
-def generate_distractors(key_manager, model_name, context, correct_answer, rule_key):
+def build_distractors_prompt(context, correct_answer):
     prompt = f"""Sua tarefa é gerar TRÊS opções incorretas (distratores) para uma pergunta de múltipla escolha.
 As opções devem ser plausíveis dado o contexto, mas logicamente incorretas ou irrelevantes.
 
@@ -47,97 +46,301 @@ Contexto: "{context}"
 Resposta Correta: "{correct_answer}"
 
 **IMPORTANTE:** Forneça APENAS os três distratores, cada um em uma nova linha. Não use marcadores, numeração ou qualquer texto introdutório."""
-    
-    response_text = make_api_call(key_manager, model_name, prompt, call_purpose=f"Distratores ({rule_key})")
-    
+    return prompt
+
+def parse_distractors(response_text):
     if response_text:
         distractors = [line.strip() for line in response_text.split('\n') if line.strip()]
-        return distractors[:3]
+        return distractors[:NUM_DISTRACTORS]
     return []
 
-if __name__ == "__main__":
-    try:
-        key_manager = ApiKeyManager()
-    except Exception as e:
-        print(f"CRÍTICO: Falha ao iniciar o gerenciador de chaves. Erro: {e}"); exit()
+def generate_distractors(key_manager, model_name, context, correct_answer, rule_key):
+    prompt = build_distractors_prompt(context, correct_answer)
+    response_text = make_api_call(key_manager, model_name, prompt, call_purpose=f"Distratores ({rule_key})")
+    return parse_distractors(response_text)
 
-    input_log_path = INPUT_FILE
-    
-    print(f"INICIANDO ETAPA 4: Geração do Dataset MCQA")
-    print(f"Lendo contextos naturalizados de: {input_log_path}")
-    all_instances_data = parse_stage_2_log(input_log_path)
+def build_batched_distractors_prompt(items):
+    """Pede distratores para vários itens `(id, contexto, resposta correta, quantidade, já existentes)` de uma vez."""
+    items_json = json.dumps(
+        [{"id": str(item_id), "contexto": context, "resposta_correta": correct_answer,
+          "quantidade": quantity, "evitar": existing}
+         for item_id, context, correct_answer, quantity, existing in items],
+        ensure_ascii=False, indent=2)
 
-    base_output_dir = BASE_OUTPUT_DIR
-    print(f"Gerando arquivos finais em: {base_output_dir}\n")
+    prompt = f"""Sua tarefa é gerar opções incorretas (distratores) para perguntas de múltipla escolha.
+Para CADA item da lista abaixo, gere exatamente "quantidade" distratores.
+As opções devem ser plausíveis dado o contexto, mas logicamente incorretas ou irrelevantes.
+Os distratores não podem repetir a resposta correta nem as frases listadas em "evitar".
 
-    for rule_key, instances in tqdm(all_instances_data.items(), desc="Processando Regras (MCQA)"):
-        try:
-            logic_type, rule_name = rule_key.split('/')
-            rule_template = LOGIC_RULES_CONFIG[logic_type][rule_name]
-        except (KeyError, ValueError):
-            logging.error(f"Regra '{rule_key}' não encontrada no config.py. Pulando.")
+Itens:
+{items_json}
+
+**IMPORTANTE:** Forneça APENAS um objeto JSON bruto, sem markdown, em que cada chave é o "id" do item e cada valor é a lista de distratores, ex.: {{"0": ["...", "...", "..."]}}."""
+    return prompt
+
+def parse_batched_distractors(response_text, items):
+    """Devolve `{id: [novos distratores]}` filtrando vazios, repetidos e cópias da resposta correta."""
+    if not response_text:
+        return {}
+    try:
+        match = re.search(r'\{.*\}', response_text, re.DOTALL)
+        parsed = json.loads(match.group(0) if match else response_text)
+    except json.JSONDecodeError:
+        return {}
+    if not isinstance(parsed, dict):
+        return {}
+
+    distractors_by_id = {}
+    for item_id, _, correct_answer, quantity, existing in items:
+        candidates = parsed.get(str(item_id))
+        if not isinstance(candidates, list):
             continue
-        
-        logic_type_folder_name = {"PL": "propositional_logic", "FOL": "first_order_logic", "NM": "nm_logic"}.get(logic_type, logic_type)
-        output_dir_for_rule = base_output_dir / logic_type_folder_name / rule_name
-        os.makedirs(output_dir_for_rule, exist_ok=True)
-        
-        file_path = output_dir_for_rule / "data_instances.json"
-        final_json_output = {"type": logic_type_folder_name, "axiom": rule_name.lower(), "samples": []}
-
-        for i, instance_data in enumerate(instances):
-            original_sentence_bank = instance_data["sentence_bank"]
-            natural_context = instance_data["natural_context"]
-
-            # Criamos um banco de sentenças limpo para formatar a conclusão
-            cleaned_bank = {}
-            for key, value in original_sentence_bank.items():
-                cleaned_value = value.strip().removesuffix('.')
-                if cleaned_value:
-                    cleaned_value = cleaned_value[0].lower() + cleaned_value[1:]
-                cleaned_bank[key] = cleaned_value
-
-            # 1. Encontrar a conclusão correta usando a chave explícita 'mcqa_correct_conclusion'
-            try:
-                conclusion_format = rule_template["mcqa_correct_conclusion"]
-                correct_conclusion_text = conclusion_format.format(**cleaned_bank)
-                # Garante que a conclusão final comece com letra maiúscula
-                if correct_conclusion_text:
-                    correct_conclusion_text = correct_conclusion_text[0].upper() + correct_conclusion_text[1:]
-            except KeyError:
-                logging.error(f"A chave 'mcqa_correct_conclusion' não foi encontrada para a regra {rule_key}. Pulando.")
+        seen = {correct_answer.casefold()} | {d.casefold() for d in existing}
+        accepted = []
+        for candidate in candidates:
+            if not isinstance(candidate, str) or not candidate.strip():
                 continue
-            
-            # 2. Gerar os distratores via API
-            distractors = generate_distractors(key_manager, MODEL_NAME, natural_context, correct_conclusion_text, rule_key)
-            if len(distractors) < 3:
-                logging.warning(f"Não foi possível gerar distratores suficientes para {rule_key}, instância {i+1}. Pulando.")
+            candidate = candidate.strip()
+            if candidate.casefold() in seen:
                 continue
+            seen.add(candidate.casefold())
+            accepted.append(candidate)
+        distractors_by_id[item_id] = accepted[:quantity]
+    return distractors_by_id
 
-            # 3. Montar e embaralhar as opções
-            options = [correct_conclusion_text] + distractors
-            random.shuffle(options)
-            
-            # 4. Encontrar o índice da resposta correta
-            try:
-                correct_answer_index = options.index(correct_conclusion_text)
-            except ValueError:
-                logging.error(f"A resposta correta não foi encontrada na lista de opções para {rule_key}, instância {i+1}. Pulando.")
-                continue
+def generate_distractors_in_batches(key_manager, model_name, work_items, batch_size, on_result):
+    """Gera `NUM_DISTRACTORS` distratores para cada item de `work_items`, vários itens por chamada.
+
+    Itens que voltarem com menos distratores são completados em rodadas seguintes, pedindo só
+    o que falta. `on_result(index, distratores)` é chamado assim que um item fica completo ou,
+    ao fim das rodadas, com o que houver.
+    """
+    collected = {idx: [] for idx in range(len(work_items))}
+    remaining = list(range(len(work_items)))
+    for round_number in range(MAX_BATCH_ROUNDS):
+        if not remaining:
+            break
+        batches = []
+        for start in range(0, len(remaining), batch_size):
+            batches.append([
+                (idx, work_items[idx]["context"], work_items[idx]["correct"],
+                 NUM_DISTRACTORS - len(collected[idx]), list(collected[idx]))
+                for idx in remaining[start:start + batch_size]
+            ])
+        prompts = [build_batched_distractors_prompt(batch) for batch in batches]
+        call_purposes = [f"Distratores em lote ({len(batch)} itens, rodada {round_number + 1})" for batch in batches]
+        short = []
+
+        def collect_batch(batch_index, response_text):
+            batch = batches[batch_index]
+            new_distractors = parse_batched_distractors(response_text, batch)
+            if any(len(new_distractors.get(idx, [])) < quantity for idx, _, _, quantity, _ in batch):
+                discard_response(model_name, prompts[batch_index])
+            for idx, *_ in batch:
+                collected[idx].extend(new_distractors.get(idx, []))
+                if len(collected[idx]) >= NUM_DISTRACTORS:
+                    on_result(idx, collected[idx][:NUM_DISTRACTORS])
+                else:
+                    short.append(idx)
+
+        run_api_calls(key_manager, model_name, prompts, call_purposes=call_purposes, on_result=collect_batch, ordered=False)
+        remaining = sorted(short)
+        if remaining:
+            logging.warning(f"{len(remaining)} itens com distratores insuficientes na rodada {round_number + 1}; completando.")
+        batch_size = max(1, batch_size // 2)
+
+    for idx in remaining:
+        on_result(idx, collected[idx])
+
+def build_correct_conclusion(rule_key, rule, cleaned_bank):
+    """Renderiza a `mcqa_correct_conclusion` compilada da regra com o banco normalizado; None se faltar chave."""
+    # Usando a chave explícita 'mcqa_correct_conclusion'
+    try:
+        if rule.mcqa_correct_conclusion is None:
+            raise KeyError('mcqa_correct_conclusion')
+        correct_conclusion_text = rule.mcqa_correct_conclusion.render(cleaned_bank)
+    except KeyError:
+        logging.error(f"A chave 'mcqa_correct_conclusion' não foi encontrada para a regra {rule_key}. Pulando.")
+        return None
+    # Garante que a conclusão final comece com letra maiúscula
+    return capitalize_first(correct_conclusion_text)
+
+def build_mcqa_sample(item, rng=random):
+    """Monta o sample MCQA de um item com `rule`, `index`, `context`, `correct` e `distractors`; None se incompleto.
+
+    `rng` embaralha as opções (ver `assembly.instance_rng`).
+    """
+    rule_key, i = item["rule"], item["index"]
+    correct_conclusion_text = item["correct"]
+    distractors = item["distractors"]
+    if len(distractors) < NUM_DISTRACTORS:
+        logging.warning(f"Não foi possível gerar distratores suficientes para {rule_key}, instância {i+1}. Pulando.")
+        return None
+
+    # 3. Montar e embaralhar as opções
+    options = [correct_conclusion_text] + distractors
+    rng.shuffle(options)
 
-            # 5. Montar o sample final
-            sample = {
-                "id": i + 1,
-                "context": natural_context,
-                "question": "Qual seria a conclusão mais apropriada com base no contexto?",
-                "options": options,
-                "answer": correct_answer_index
-            }
-            final_json_output["samples"].append(sample)
+    # 4. Encontrar o índice da resposta correta
+    try:
+        correct_answer_index = options.index(correct_conclusion_text)
+    except ValueError:
+        logging.error(f"A resposta correta não foi encontrada na lista de opções para {rule_key}, instância {i+1}. Pulando.")
+        return None
+
+    # 5. Montar o sample final
+    return {
+        "id": i + 1,
+        "context": item["context"],
+        "question": "Qual seria a conclusão mais apropriada com base no contexto?",
+        "options": options,
+        "answer": correct_answer_index
+    }
+
+def assemble_mcqa_shard(task):
+    """Monta e serializa os samples MCQA de uma fatia de itens (com distratores) de uma regra."""
+    rule_key, items, seed, output_format = task
+    samples = []
+    for item in items:
+        sample = build_mcqa_sample(item, instance_rng(seed, rule_key, item["index"] + 1))
+        if sample:
+            samples.append(sample)
+    return serialize_samples(samples, output_format), len(samples)
+
+def generate_missing_distractors(key_manager, items, checkpoint, batch_size, progress):
+    """Preenche `distractors` em cada item: do checkpoint, se já gravado, ou via API, gravando cada item pronto.
+
+    Devolve quantos itens vieram do checkpoint.
+    """
+    pending_items = []
+    for item in items:
+        item_key = item_hash(item["rule"], item["context"], item["correct"])
+        record = checkpoint.take(item_key)
+        if record is not None:
+            item["distractors"] = record["distractors"]
+            progress.update(1)
+        else:
+            pending_items.append((item_key, item))
+
+    def collect_distractors(index, distractors):
+        item_key, item = pending_items[index]
+        item["distractors"] = distractors
+        # Uma lista incompleta ainda monta a amostra, mas fica fora do checkpoint para ser refeita na retomada.
+        if len(distractors) >= NUM_DISTRACTORS:
+            checkpoint.write(item_key, [item])
+        progress.update(1)
+
+    pending_work_items = [item for _, item in pending_items]
+    if batch_size > 1:
+        generate_distractors_in_batches(key_manager, MODEL_NAME, pending_work_items, batch_size, collect_distractors)
+    else:
+        prompts = [build_distractors_prompt(item["context"], item["correct"]) for item in pending_work_items]
+        call_purposes = [f"Distratores ({item['rule']})" for item in pending_work_items]
+
+        def collect_response(index, response_text):
+            distractors = parse_distractors(response_text)
+            if len(distractors) < NUM_DISTRACTORS:
+                discard_response(MODEL_NAME, prompts[index])
+            collect_distractors(index, distractors)
 
-        if final_json_output["samples"]:
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(final_json_output, f, ensure_ascii=False, indent=4)
+        run_api_calls(key_manager, MODEL_NAME, prompts, call_purposes=call_purposes, on_result=collect_response)
+    return len(items) - len(pending_items)
+
+def _rule_shards(input_log_path, offsets_by_rule, rules_to_build, banks):
+    """Fatias `(regra, itens)` do log 2b, lidas uma de cada vez; cada item traz a conclusão correta da instância."""
+    for rule_key in rules_to_build:
+        rule = COMPILED_RULES[rule_key]
+        for start, chunk in shards(offsets_by_rule[rule_key]):
+            instances = list(read_lines_at(input_log_path, chunk))
+            cleaned_banks = normalized_banks_for(instances, [rule] * len(instances), banks)
+            items = []
+            for i, (instance_data, cleaned_bank) in enumerate(zip(instances, cleaned_banks), start=start):
+                correct_conclusion_text = build_correct_conclusion(rule_key, rule, cleaned_bank)
+                if correct_conclusion_text is not None:
+                    items.append({"rule": rule_key, "index": i, "context": instance_data["natural_context"],
+                                  "correct": correct_conclusion_text})
+            yield rule_key, items
+
+def run_stage_4(input_log_path, base_output_dir, distractors_path, key_manager, batch_size=DISTRACTORS_BATCH_SIZE, resume=True,
+                banks_path=NORMALIZED_BANKS_FILE, workers=ASSEMBLY_WORKERS, seed=DEFAULT_SEED, output_format="json"):
+    """Etapa 4: gera os distratores via API e monta os arquivos MCQA finais, por regra.
+
+    Os bancos normalizados vêm do artefato `banks_path` da Etapa 2a. O log 2b é só indexado
+    (offsets por regra) e lido em fatias: os distratores de até `DISTRACTORS_WINDOW` itens
+    (várias fatias, de uma ou mais regras) saem numa rodada de chamadas, e as fatias prontas
+    vão para o pool de `workers` processos, que grava os samples em fluxo (ver `assembly`).
+    Em memória fica só essa janela, não o dataset inteiro.
+
+    `distractors_path` é também o checkpoint: com `resume=True` os itens já gravados nele
+    reaproveitam os distratores salvos, e só os demais vão para a API.
+    """
+    print(f"INICIANDO ETAPA 4: Geração do Dataset MCQA")
+    print(f"Lendo contextos naturalizados de: {input_log_path}")
+    if not input_log_path.exists():
+        raise FileNotFoundError(f"Arquivo de log da Etapa 2 '{input_log_path}' não encontrado.")
+    offsets_by_rule = index_lines_by_rule(input_log_path)
+    rules_to_build = []
+    for rule_key in offsets_by_rule:
+        if rule_key not in COMPILED_RULES:
+            logging.error(f"Regra '{rule_key}' não encontrada no config.py. Pulando.")
+            continue
+        rules_to_build.append(rule_key)
+    # Uma tarefa de montagem por fatia do log, mesmo que todos os itens dela tenham sido pulados.
+    shard_rules = [rule_key for rule_key in rules_to_build for _ in range(0, len(offsets_by_rule[rule_key]), SHARD_SIZE)]
+
+    print(f"Gerando arquivos finais em: {base_output_dir}\n")
+
+    banks = NormalizedBanks.open(banks_path)
+    reused = 0
+    try:
+        with JsonlCheckpoint(distractors_path, resume=resume) as checkpoint, \
+             tqdm(desc="Processando Distratores (MCQA)", position=0) as distractors_progress, \
+             tqdm(total=len(rules_to_build), desc="Finalizando Regras MCQA", position=1) as rules_progress:
+
+            def assembly_tasks():
+                # Junta fatias até a janela encher, para as regras pequenas não gerarem uma rodada de chamadas cada.
+                nonlocal reused
+                waiting, num_items = [], 0
+                for rule_key, items in _rule_shards(input_log_path, offsets_by_rule, rules_to_build, banks):
+                    waiting.append((rule_key, items))
+                    num_items += len(items)
+                    if num_items >= DISTRACTORS_WINDOW:
+                        reused += generate_missing_distractors(key_manager, [item for _, shard in waiting for item in shard],
+                                                               checkpoint, batch_size, distractors_progress)
+                        yield from ((rule_key, shard, seed, output_format) for rule_key, shard in waiting)
+                        waiting, num_items = [], 0
+                reused += generate_missing_distractors(key_manager, [item for _, shard in waiting for item in shard],
+                                                       checkpoint, batch_size, distractors_progress)
+                yield from ((rule_key, shard, seed, output_format) for rule_key, shard in waiting)
+
+            results = map_shards(assemble_mcqa_shard, assembly_tasks(), workers)
+            write_sharded_samples(base_output_dir, shard_rules, results, output_format,
+                                  on_rule_done=lambda: rules_progress.update(1))
+    finally:
+        if banks is not None:
+            banks.close()
+    if reused:
+        print(f"Retomada: {reused} itens com distratores reaproveitados do checkpoint.")
 
     print(f"\nETAPA 3.2 (MCQA) CONCLUÍDA.")
-    print("Processo finalizado com sucesso.")
\ No newline at end of file
+    print("Processo finalizado com sucesso.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Etapa 4: montagem do dataset MCQA.")
+    parser.add_argument("--batch-size", type=int, default=DISTRACTORS_BATCH_SIZE,
+                        help="Amostras por chamada de distratores (1 desativa o modo em lote).")
+    add_cache_arguments(parser)
+    add_backend_arguments(parser)
+    add_resume_arguments(parser)
+    add_assembly_arguments(parser)
+    args = parser.parse_args()
+    configure_cache(args)
+    configure_backend(args)
+
+    try:
+        key_manager = create_key_manager(args)
+    except Exception as e:
+        print(f"CRÍTICO: Falha ao iniciar o gerenciador de chaves. Erro: {e}"); exit()
+
+    run_stage_4(INPUT_FILE, BASE_OUTPUT_DIR, DISTRACTORS_FILE, key_manager, batch_size=args.batch_size,
+                resume=not args.restart, workers=args.workers, seed=args.seed, output_format=args.output_format)
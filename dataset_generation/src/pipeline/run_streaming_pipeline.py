@@ -0,0 +1,450 @@
+"""
+Executa as Etapas 1 → 2a → 2b → 3 → 4 em fluxo contínuo, sem esperar cada etapa terminar.
+
+Cada banco de sentenças da Etapa 1 é templatizado (2a) assim que a resposta chega e entra
+numa fila limitada de naturalização (2b); cada contexto naturalizado vira imediatamente um
+sample BQA, gravado no arquivo da regra, e entra na fila de distratores (MCQA). Assim a naturalização roda
+enquanto a Etapa 1 ainda espera a API, e os distratores enquanto a 2b ainda naturaliza.
+Cada instância recebe o seu id na 2a, pela ordem dentro da regra (a mesma das Etapas 3 e 4), e o
+log 2b e os arquivos finais são gravados nessa ordem: quem termina antes da vez espera num buffer.
+Os artefatos intermediários continuam sendo gravados, linha a linha, para auditoria, e servem
+de checkpoint: por padrão uma nova execução reaproveita os pedidos, contextos e distratores já
+gravados e só chama a API para o que falta (`--restart` recomeça do zero).
+
+Uso:
+    python dataset_generation/src/pipeline/run_streaming_pipeline.py
+    python dataset_generation/src/pipeline/run_streaming_pipeline.py --backend mock --num-instances 100
+"""
+import os
+import argparse
+import asyncio
+import importlib
+import json
+import logging
+from collections import defaultdict
+from pathlib import Path
+from tqdm import tqdm
+import sys
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent))
+
+os.environ['GRPC_VERBOSITY'] = 'ERROR'
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+from config import COMPILED_RULES
+from prompts import PROMPT_BANK
+from engine import (MAX_CONCURRENT_CALLS, AsyncApiEngine, configure_backend, configure_cache, create_key_manager,
+                    discard_response)
+from cache import add_cache_arguments
+from checkpoint import JsonlCheckpoint, add_resume_arguments, item_hash
+from mock_backend import add_backend_arguments
+from sentence_banks import BANK_KEY_FIELD, normalize_bank, write_normalized_banks
+from assembly import DEFAULT_SEED, OUTPUT_FORMATS, SamplesWriter, instance_rng
+
+stage_1 = importlib.import_module("1_generate_sentence_banks")
+stage_2 = importlib.import_module("2_naturalize_contexts")
+stage_3 = importlib.import_module("3_finalize_bqa")
+stage_4 = importlib.import_module("4_finalize_mcqa")
+
+# --- CONFIGURAÇÃO DO PIPELINE EM FLUXO ---
+QUEUE_SIZE = 200
+# Cada worker mantém no máximo uma chamada em voo; quem limita a vazão real é o agendador de chaves.
+NATURALIZATION_WORKERS = MAX_CONCURRENT_CALLS
+DISTRACTORS_WORKERS = MAX_CONCURRENT_CALLS
+# Tempo que um worker espera para completar um lote antes de enviá-lo incompleto.
+BATCH_LINGER_SECONDS = 0.2
+# ------------------------------------
+
+async def _next_batch(queue, batch_size):
+    """Espera o primeiro item da fila e junta outros até `batch_size` ou até o tempo de espera acabar."""
+    batch = [await queue.get()]
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + BATCH_LINGER_SECONDS
+    while len(batch) < batch_size:
+        timeout = deadline - loop.time()
+        if timeout <= 0:
+            break
+        try:
+            batch.append(await asyncio.wait_for(queue.get(), timeout))
+        except asyncio.TimeoutError:
+            break
+    return batch
+
+def _naturalization_hash(data):
+    return item_hash(data["rule"], data["sentence_bank"], data["condition"], data["situation"])
+
+def _distractors_hash(item):
+    return item_hash(item["rule"], item["context"], item["correct"])
+
+def _instance_data(data, natural_context):
+    """Linha do log 2b; sem contexto naturalizado, o templatizado (condição + situação) ocupa o lugar."""
+    return {"rule": data["rule"], "sentence_bank": data["sentence_bank"], BANK_KEY_FIELD: data[BANK_KEY_FIELD],
+            "natural_context": natural_context or f"{data['condition']} {data['situation']}".strip()}
+
+class StreamingPipeline:
+    """Liga as etapas por filas `asyncio.Queue` limitadas, compartilhando um único `AsyncApiEngine`."""
+
+    def __init__(self, key_manager, artifacts_dir, bqa_output_dir, mcqa_output_dir,
+                 num_instances=stage_1.NUM_INSTANCES_PER_RULE,
+                 naturalization_batch_size=stage_2.NATURALIZATION_BATCH_SIZE,
+                 distractors_batch_size=stage_4.DISTRACTORS_BATCH_SIZE,
+                 queue_size=QUEUE_SIZE, naturalization_workers=NATURALIZATION_WORKERS,
+                 distractors_workers=DISTRACTORS_WORKERS, seed=DEFAULT_SEED, output_format="json", resume=True):
+        self.engine = AsyncApiEngine(key_manager)
+        self.artifacts_dir = Path(artifacts_dir)
+        self.bqa_output_dir = Path(bqa_output_dir)
+        self.mcqa_output_dir = Path(mcqa_output_dir)
+        self.num_instances = num_instances
+        self.naturalization_batch_size = naturalization_batch_size
+        self.distractors_batch_size = distractors_batch_size
+        self.queue_size = queue_size
+        self.naturalization_workers = naturalization_workers
+        self.distractors_workers = distractors_workers
+        self.seed = seed
+        self.output_format = output_format
+        self.resume = resume
+
+        self.instances_per_rule = defaultdict(int)
+        # Um `SamplesWriter` por regra, aberto no primeiro sample. Os resultados que chegam fora de
+        # ordem esperam a vez em buffers por regra (índice -> resultado), como `resolved` na Etapa 2b;
+        # só fica em memória o que terminou antes de um item anterior ainda em voo.
+        self.bqa_writers = {}
+        self.mcqa_writers = {}
+        self.naturalized = defaultdict(dict)
+        self.next_naturalized = defaultdict(int)
+        self.mcqa_samples = defaultdict(dict)
+        self.next_mcqa_sample = defaultdict(int)
+        # bank_key -> (regra, banco normalizado): normalizado uma vez na 2a e gravado no artefato Arrow ao final.
+        self.normalized_banks = {}
+
+    def _write(self, f, data):
+        f.write(json.dumps(data, ensure_ascii=False) + '\n')
+
+    def _write_sample(self, writers, base_output_dir, sample, rule_key):
+        writer = writers.get(rule_key)
+        if writer is None:
+            writer = writers[rule_key] = SamplesWriter(base_output_dir, rule_key, self.output_format)
+        writer.write(sample)
+
+    def num_samples(self):
+        """`(BQA, MCQA)`: quantos samples foram gravados até agora."""
+        return (sum(writer.count for writer in self.bqa_writers.values()),
+                sum(writer.count for writer in self.mcqa_writers.values()))
+
+    # --- Etapas 1 e 2a ---
+    async def _generate_rule(self, rule_key, rule):
+        # Como na Etapa 1: pedidos paralelos com temas variados, sem quase-duplicatas, até o alvo de bancos únicos.
+        collector = self.bank_collectors[rule_key]
+        for _ in range(stage_1.MAX_GENERATION_ROUNDS):
+            if collector.done:
+                break
+            requests = collector.next_requests()
+            # Pedidos já gravados numa execução anterior vêm do checkpoint, sem chamada.
+            stored = [[record["sentence_bank"] for record in self.f_stage_1.completed.pop(hash_value)]
+                      if self.f_stage_1.is_completed(hash_value) else None
+                      for _, hash_value in requests]
+            responses = await asyncio.gather(*(self.engine.call(stage_1.MODEL_NAME, prompt, rule_key)
+                                               for (prompt, _), banks in zip(requests, stored) if banks is None))
+            responses = iter(responses)
+            for (prompt, hash_value), stored_banks in zip(requests, stored):
+                if stored_banks is not None:
+                    collector.add_stored(stored_banks)
+                    sentence_banks = stored_banks
+                else:
+                    parsed = stage_1.parse_sentence_banks(next(responses), rule_key)
+                    if not parsed:
+                        discard_response(stage_1.MODEL_NAME, prompt)
+                    sentence_banks = collector.add_response(parsed)
+                    if sentence_banks:
+                        self.f_stage_1.write(hash_value, [{"rule": rule_key, "sentence_bank": bank} for bank in sentence_banks])
+                for sentence_bank in sentence_banks:
+                    bank = normalize_bank(rule, sentence_bank)
+                    templated = stage_2.build_templated_context(rule_key, sentence_bank, rule, bank)
+                    if templated:
+                        self.normalized_banks[templated[BANK_KEY_FIELD]] = (rule_key, bank)
+                        self._write(self.f_stage_2a, templated)
+                        # O id segue a ordem da 2a dentro da regra, como nas Etapas 3 e 4.
+                        index = self.instances_per_rule[rule_key]
+                        self.instances_per_rule[rule_key] += 1
+                        # A fila limitada segura a Etapa 1 se a naturalização ficar para trás.
+                        await self.q_naturalization.put({**templated, "index": index})
+        self.progress_1.update(1)
+
+    # --- Etapa 2b e montagem do BQA ---
+    async def _naturalization_worker(self):
+        while True:
+            batch = await _next_batch(self.q_naturalization, self.naturalization_batch_size)
+            pending = []
+            for idx, data in enumerate(batch):
+                record = self.f_stage_2b.take(_naturalization_hash(data))
+                if record is not None:
+                    self._finish_naturalization(data, record["natural_context"], stored=True)
+                else:
+                    pending.append(idx)
+            batch_size = len(pending)
+            for round_number in range(stage_2.MAX_BATCH_ROUNDS):
+                if not pending:
+                    break
+                missing = []
+                for start in range(0, len(pending), batch_size):
+                    chunk = pending[start:start + batch_size]
+                    contexts = await self._naturalize_chunk(batch, chunk, round_number)
+                    for idx in chunk:
+                        if idx in contexts:
+                            self._finish_naturalization(batch[idx], contexts[idx])
+                        else:
+                            missing.append(idx)
+                pending = missing
+                # Mesma estratégia de `naturalize_in_batches`: lotes menores a cada rodada.
+                batch_size = max(1, batch_size // 2)
+            for idx in pending:
+                self._finish_naturalization(batch[idx], None)
+
+    async def _naturalize_chunk(self, batch, chunk, round_number):
+        if self.naturalization_batch_size > 1:
+            prompt = stage_2.build_batched_naturalization_prompt(
+                [(idx, batch[idx]["condition"], batch[idx]["situation"]) for idx in chunk], round_number)
+            purpose = f"Naturalização em lote ({len(chunk)} itens, rodada {round_number + 1})"
+            response_text = await self.engine.call(stage_2.MODEL_NAME, prompt, purpose)
+            contexts = stage_2.parse_batched_naturalization(response_text, chunk)
+            if len(contexts) < len(chunk):
+                discard_response(stage_2.MODEL_NAME, prompt)
+            return contexts
+        data = batch[chunk[0]]
+        prompt = stage_2.build_naturalization_prompt(data["condition"], data["situation"])
+        response_text = await self.engine.call(stage_2.MODEL_NAME, prompt, f"Naturalização ({data['rule']})")
+        return {chunk[0]: response_text} if response_text else {}
+
+    def _finish_naturalization(self, data, natural_context, stored=False):
+        rule_key = data["rule"]
+        self.naturalized[rule_key][data["index"]] = (data, natural_context, stored)
+        while self.next_naturalized[rule_key] in self.naturalized[rule_key]:
+            index = self.next_naturalized[rule_key]
+            self.next_naturalized[rule_key] += 1
+            self._release_naturalization(*self.naturalized[rule_key].pop(index))
+        self.progress_2b.update(1)
+        self.q_naturalization.task_done()
+
+    def _release_naturalization(self, data, natural_context, stored):
+        rule_key, index = data["rule"], data["index"]
+        instance_data = _instance_data(data, natural_context)
+        # Como na Etapa 2b: o contexto templatizado vai sem hash, para ser refeito numa retomada.
+        if not stored and natural_context:
+            self.f_stage_2b.write(_naturalization_hash(data), [instance_data])
+        elif not stored:
+            self.f_stage_2b.write_provisional([instance_data])
+        natural_context = instance_data["natural_context"]
+
+        rule = COMPILED_RULES[rule_key]
+        _, bank = self.normalized_banks[data[BANK_KEY_FIELD]]
+
+        sample = stage_3.build_bqa_sample(rule_key, rule, index + 1, instance_data, bank,
+                                          instance_rng(self.seed, rule_key, index + 1))
+        if sample:
+            self._write_sample(self.bqa_writers, self.bqa_output_dir, sample, rule_key)
+
+        correct_conclusion_text = stage_4.build_correct_conclusion(rule_key, rule, bank)
+        if correct_conclusion_text is not None:
+            self.q_distractors.put_nowait({"rule": rule_key, "index": index, "context": natural_context,
+                                           "correct": correct_conclusion_text})
+        else:
+            self._add_mcqa_sample(rule_key, index, None)
+
+    def _flush_pending_naturalizations(self):
+        # Numa falha, os contextos já pagos que esperavam a vez vão para o checkpoint (fora de ordem).
+        for pending in self.naturalized.values():
+            for data, natural_context, stored in pending.values():
+                if natural_context and not stored:
+                    self.f_stage_2b.write(_naturalization_hash(data), [_instance_data(data, natural_context)])
+            pending.clear()
+
+    # --- Etapa 4 (MCQA) ---
+    async def _distractors_worker(self):
+        while True:
+            batch = await _next_batch(self.q_distractors, self.distractors_batch_size)
+            collected = [[] for _ in batch]
+            pending = []
+            for idx, item in enumerate(batch):
+                record = self.f_distractors.take(_distractors_hash(item))
+                if record is not None:
+                    self._finish_distractors(item, record["distractors"], stored=True)
+                else:
+                    pending.append(idx)
+            batch_size = len(pending)
+            for round_number in range(stage_4.MAX_BATCH_ROUNDS):
+                if not pending:
+                    break
+                short = []
+                for start in range(0, len(pending), batch_size):
+                    chunk = [(idx, batch[idx]["context"], batch[idx]["correct"],
+                              stage_4.NUM_DISTRACTORS - len(collected[idx]), list(collected[idx]))
+                             for idx in pending[start:start + batch_size]]
+                    new_distractors = await self._distractors_chunk(chunk, round_number)
+                    for idx, *_ in chunk:
+                        collected[idx].extend(new_distractors.get(idx, []))
+                        if len(collected[idx]) >= stage_4.NUM_DISTRACTORS:
+                            self._finish_distractors(batch[idx], collected[idx][:stage_4.NUM_DISTRACTORS])
+                        else:
+                            short.append(idx)
+                pending = short
+                batch_size = max(1, batch_size // 2)
+            for idx in pending:
+                self._finish_distractors(batch[idx], collected[idx])
+
+    async def _distractors_chunk(self, chunk, round_number):
+        if self.distractors_batch_size > 1:
+            prompt = stage_4.build_batched_distractors_prompt(chunk)
+            purpose = f"Distratores em lote ({len(chunk)} itens, rodada {round_number + 1})"
+            response_text = await self.engine.call(stage_4.MODEL_NAME, prompt, purpose)
+            distractors = stage_4.parse_batched_distractors(response_text, chunk)
+            if any(len(distractors.get(idx, [])) < quantity for idx, _, _, quantity, _ in chunk):
+                discard_response(stage_4.MODEL_NAME, prompt)
+            return distractors
+        idx, context, correct, _, existing = chunk[0]
+        prompt = stage_4.build_distractors_prompt(context, correct)
+        response_text = await self.engine.call(stage_4.MODEL_NAME, prompt, "Distratores")
+        distractors = stage_4.parse_distractors(response_text)
+        if len(distractors) < stage_4.NUM_DISTRACTORS:
+            discard_response(stage_4.MODEL_NAME, prompt)
+        distractors = [d for d in distractors if d not in existing]
+        return {idx: distractors}
+
+    def _finish_distractors(self, item, distractors, stored=False):
+        item["distractors"] = distractors
+        # Como na Etapa 4: uma lista incompleta monta a amostra, mas fica fora do checkpoint.
+        if not stored and len(distractors) >= stage_4.NUM_DISTRACTORS:
+            self.f_distractors.write(_distractors_hash(item), [item])
+        sample = stage_4.build_mcqa_sample(item, instance_rng(self.seed, item["rule"], item["index"] + 1))
+        self._add_mcqa_sample(item["rule"], item["index"], sample)
+        self.progress_4.update(1)
+        self.q_distractors.task_done()
+
+    def _add_mcqa_sample(self, rule_key, index, sample):
+        # None marca um índice sem sample MCQA, para não travar os seguintes.
+        pending = self.mcqa_samples[rule_key]
+        pending[index] = sample
+        while self.next_mcqa_sample[rule_key] in pending:
+            sample = pending.pop(self.next_mcqa_sample[rule_key])
+            self.next_mcqa_sample[rule_key] += 1
+            if sample:
+                self._write_sample(self.mcqa_writers, self.mcqa_output_dir, sample, rule_key)
+
+    def _flush_pending_mcqa_samples(self):
+        # Numa falha, os samples prontos que esperavam a vez saem em ordem de id, pulando os que faltam.
+        for rule_key, pending in self.mcqa_samples.items():
+            for index in sorted(pending):
+                if pending[index]:
+                    self._write_sample(self.mcqa_writers, self.mcqa_output_dir, pending[index], rule_key)
+            pending.clear()
+
+    async def _produce_and_drain(self, pl_rules):
+        await asyncio.gather(*(self._generate_rule(rule_key, rule) for rule_key, rule in pl_rules.items()))
+        await self.q_naturalization.join()
+        await self.q_distractors.join()
+
+    async def run(self):
+        pl_rules = {rule_key: rule for rule_key, rule in COMPILED_RULES.items() if rule_key.startswith("PL/")}
+        for rule_key in [rule_key for rule_key in pl_rules if rule_key not in PROMPT_BANK]:
+            logging.warning(f"Nenhum prompt especializado encontrado para {rule_key}. Pulando esta regra.")
+            del pl_rules[rule_key]
+
+        self.bank_collectors = {rule_key: stage_1.RuleBankCollector(rule_key, self.num_instances) for rule_key in pl_rules}
+        self.q_naturalization = asyncio.Queue(maxsize=self.queue_size)
+        # Sem limite: é alimentada pelos workers da 2b, que não podem bloquear com itens em mãos.
+        # A fila da 2b, limitada, já segura o volume total em trânsito.
+        self.q_distractors = asyncio.Queue()
+
+        os.makedirs(self.artifacts_dir, exist_ok=True)
+        # Os artefatos das etapas com LLM saem no formato de checkpoint (com `item_hash`): esta execução
+        # e os scripts de cada etapa retomam a partir deles. A 2a não chama a API e é refeita inteira,
+        # inclusive para os bancos lidos do checkpoint da Etapa 1.
+        with JsonlCheckpoint(self.artifacts_dir / stage_1.OUTPUT_FILE.name, resume=self.resume) as self.f_stage_1, \
+             open(self.artifacts_dir / stage_2.OUTPUT_STAGE_2A_FILE.name, 'w', encoding='utf-8') as self.f_stage_2a, \
+             JsonlCheckpoint(self.artifacts_dir / stage_2.OUTPUT_STAGE_2B_FILE.name, resume=self.resume) as self.f_stage_2b, \
+             JsonlCheckpoint(self.artifacts_dir / stage_4.DISTRACTORS_FILE.name, resume=self.resume) as self.f_distractors:
+            if self.f_stage_1.completed:
+                print(f"Retomando: {len(self.f_stage_1.completed)} pedidos da Etapa 1, "
+                      f"{self.f_stage_2b.num_completed()} contextos e {self.f_distractors.num_completed()} "
+                      f"itens com distratores já no checkpoint.")
+            self.progress_1 = tqdm(total=len(pl_rules), desc="Etapa 1 - Regras", position=0)
+            self.progress_2b = tqdm(desc="Etapa 2b - Naturalizando", position=1)
+            self.progress_4 = tqdm(desc="Etapa 4 - Distratores", position=2)
+
+            workers = [asyncio.create_task(self._naturalization_worker()) for _ in range(self.naturalization_workers)]
+            workers += [asyncio.create_task(self._distractors_worker()) for _ in range(self.distractors_workers)]
+            producer = asyncio.create_task(self._produce_and_drain(pl_rules))
+            try:
+                await asyncio.wait([producer, *workers], return_when=asyncio.FIRST_COMPLETED)
+                # Os workers só terminam por exceção (ex.: CacheMissError); sem isso o join nunca voltaria.
+                for task in [producer, *workers]:
+                    if task.done():
+                        task.result()
+            finally:
+                producer.cancel()
+                for worker in workers:
+                    worker.cancel()
+                await asyncio.gather(producer, *workers, return_exceptions=True)
+                for progress in (self.progress_1, self.progress_2b, self.progress_4):
+                    progress.close()
+                # Mesmo numa falha os samples já prontos vão para os arquivos finais; a retomada os refaz do checkpoint.
+                self._flush_pending_naturalizations()
+                self._flush_pending_mcqa_samples()
+                for writer in [*self.bqa_writers.values(), *self.mcqa_writers.values()]:
+                    writer.close()
+
+        stage_1.report_duplicates(list(self.bank_collectors.values()))
+
+        write_normalized_banks(self.artifacts_dir / stage_2.NORMALIZED_BANKS_FILE.name,
+                               ((key, rule_key, bank) for key, (rule_key, bank) in self.normalized_banks.items()))
+
+def run_streaming_pipeline(key_manager, artifacts_dir=stage_1.OUTPUT_FILE.parent,
+                           bqa_output_dir=stage_3.BASE_OUTPUT_DIR, mcqa_output_dir=stage_4.BASE_OUTPUT_DIR, **options):
+    """Versão síncrona de `StreamingPipeline.run`; `options` repassa tamanhos de lote, filas e workers."""
+    print(f"INICIANDO PIPELINE EM FLUXO: Etapas 1 → 2a → 2b → 3 → 4")
+    print(f"Artefatos intermediários em: {artifacts_dir}\n")
+    pipeline = StreamingPipeline(key_manager, artifacts_dir, bqa_output_dir, mcqa_output_dir, **options)
+    asyncio.run(pipeline.run())
+
+    print(f"\nPIPELINE EM FLUXO CONCLUÍDO.")
+    num_bqa, num_mcqa = pipeline.num_samples()
+    print(f"{num_bqa} samples BQA em '{bqa_output_dir}'.")
+    print(f"{num_mcqa} samples MCQA em '{mcqa_output_dir}'.")
+    return pipeline
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pipeline completo (Etapas 1 a 4) em fluxo, sem interação.")
+    parser.add_argument("--num-instances", type=int, default=stage_1.NUM_INSTANCES_PER_RULE, help="Bancos de sentenças por regra.")
+    parser.add_argument("--naturalization-batch-size", type=int, default=stage_2.NATURALIZATION_BATCH_SIZE,
+                        help="Contextos por chamada na Etapa 2b (1 desativa o modo em lote).")
+    parser.add_argument("--distractors-batch-size", type=int, default=stage_4.DISTRACTORS_BATCH_SIZE,
+                        help="Itens por chamada de distratores (1 desativa o modo em lote).")
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE, help="Capacidade da fila entre a Etapa 1 e a 2b.")
+    parser.add_argument("--naturalization-workers", type=int, default=NATURALIZATION_WORKERS)
+    parser.add_argument("--distractors-workers", type=int, default=DISTRACTORS_WORKERS)
+    parser.add_argument("--artifacts-dir", type=Path, default=stage_1.OUTPUT_FILE.parent, help="Pasta dos artefatos intermediários.")
+    parser.add_argument("--bqa-output-dir", type=Path, default=stage_3.BASE_OUTPUT_DIR)
+    parser.add_argument("--mcqa-output-dir", type=Path, default=stage_4.BASE_OUTPUT_DIR)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="Semente base dos sorteios por instância.")
+    parser.add_argument("--output-format", choices=OUTPUT_FORMATS, default="json")
+    add_cache_arguments(parser)
+    add_backend_arguments(parser)
+    add_resume_arguments(parser)
+    args = parser.parse_args()
+    configure_cache(args)
+    configure_backend(args)
+
+    try:
+        key_manager = create_key_manager(args)
+    except Exception as e:
+        print(f"CRÍTICO: Falha ao iniciar o gerenciador de chaves. Erro: {e}"); exit()
+
+    run_streaming_pipeline(key_manager, args.artifacts_dir, args.bqa_output_dir, args.mcqa_output_dir,
+                           num_instances=args.num_instances,
+                           naturalization_batch_size=args.naturalization_batch_size,
+                           distractors_batch_size=args.distractors_batch_size,
+                           queue_size=args.queue_size,
+                           naturalization_workers=args.naturalization_workers,
+                           distractors_workers=args.distractors_workers,
+                           seed=args.seed,
+                           output_format=args.output_format,
+                           resume=not args.restart)
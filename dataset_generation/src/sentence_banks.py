@@ -0,0 +1,113 @@
+"""
+Normalização dos bancos de sentenças, feita uma única vez, e o artefato colunar que a guarda.
+
+A Etapa 2a limpa cada banco (sem espaços nas pontas, sem o ponto final e com a primeira
+letra minúscula), completa as negações derivadas da regra (`not p` -> "não " + `p`) e grava
+o resultado num arquivo Arrow IPC: uma linha por banco, uma coluna de texto por placeholder
+usado em algum template e a coluna `bank_key`, o hash do banco original. As Etapas 3 e 4 e o
+pipeline em fluxo abrem esse arquivo com `memory_map` e buscam os bancos já prontos pelo
+`bank_key` gravado nos artefatos JSONL, sem limpar as sentenças de novo.
+"""
+import logging
+import os
+from pathlib import Path
+
+import pyarrow as pa
+
+from checkpoint import item_hash
+from config import COMPILED_RULES
+
+BANK_KEY_FIELD = "bank_key"
+RULE_COLUMN = "rule"
+# Uma coluna por placeholder de algum template (as negações inclusive); as demais chaves não são usadas.
+BANK_COLUMNS = sorted(frozenset().union(*(rule.placeholders for rule in COMPILED_RULES.values())))
+
+def clean_sentence(value):
+    value = value.strip().removesuffix('.')
+    return value[0].lower() + value[1:] if value else value
+
+def normalize_bank(rule, sentence_bank):
+    """Banco limpo e completado com as negações derivadas da regra (ver `CompiledRule.with_derived_negations`)."""
+    return rule.with_derived_negations({key: clean_sentence(value) for key, value in sentence_bank.items()})
+
+def bank_key(rule_key, sentence_bank):
+    """Chave estável de um banco original, a mesma entre execuções e artefatos."""
+    return item_hash(rule_key, sentence_bank)
+
+def write_normalized_banks(path, entries):
+    """Grava `entries` (`(bank_key, rule_key, banco normalizado)`) no artefato Arrow, de forma atômica."""
+    path = Path(path)
+    keys, rules = [], []
+    columns = {column: [] for column in BANK_COLUMNS}
+    for key, rule_key, bank in entries:
+        keys.append(key)
+        rules.append(rule_key)
+        for column, values in columns.items():
+            values.append(bank.get(column))
+    table = pa.table({
+        BANK_KEY_FIELD: pa.array(keys, pa.string()),
+        RULE_COLUMN: pa.array(rules, pa.string()).dictionary_encode(),
+        **{column: pa.array(values, pa.string()) for column, values in columns.items()},
+    })
+
+    os.makedirs(path.parent, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with pa.OSFile(str(tmp_path), 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp_path, path)
+    return len(keys)
+
+class NormalizedBanks:
+    """Leitura do artefato por `memory_map`; `get_many` devolve os bancos normalizados de várias chaves."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.source = pa.memory_map(str(self.path), 'r')
+        # Com o arquivo mapeado, `read_all` só aponta para as páginas; nada é copiado nem decodificado aqui.
+        self.table = pa.ipc.open_file(self.source).read_all()
+        self.rows = {key: row for row, key in enumerate(self.table.column(BANK_KEY_FIELD).to_pylist())}
+        self.columns = [column for column in BANK_COLUMNS if column in self.table.column_names]
+
+    @classmethod
+    def open(cls, path):
+        """O artefato em `path`, ou None (com aviso) se ele não existir."""
+        if not Path(path).exists():
+            logging.warning(f"Artefato de bancos normalizados '{path}' não encontrado; os bancos serão normalizados de novo.")
+            return None
+        return cls(path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.table.num_rows
+
+    def get_many(self, keys):
+        """Lista alinhada com `keys`: o banco normalizado (sem as colunas nulas) ou None se a chave não estiver no artefato."""
+        rows = [self.rows.get(key) for key in keys]
+        unique_rows = sorted({row for row in rows if row is not None})
+        if not unique_rows:
+            return [None] * len(rows)
+        # Conversão por coluna (bem mais rápida que `to_pylist`), uma vez por linha distinta do artefato.
+        taken = self.table.select(self.columns).take(unique_rows).to_pydict()
+        columns = [(column, taken[column]) for column in self.columns]
+        banks = {row: {column: values[i] for column, values in columns if values[i] is not None}
+                 for i, row in enumerate(unique_rows)}
+        return [None if row is None else dict(banks[row]) for row in rows]
+
+    def close(self):
+        self.table = None
+        self.source.close()
+
+def normalized_banks_for(instances, rules, banks=None):
+    """Bancos normalizados das instâncias (dicts com `rule` e `sentence_bank`), vindos do artefato quando possível.
+
+    `rules` é a `CompiledRule` de cada instância. Instâncias sem `bank_key`, ou cuja chave não
+    está no artefato `banks`, são normalizadas aqui mesmo.
+    """
+    stored = banks.get_many([data.get(BANK_KEY_FIELD) for data in instances]) if banks is not None else [None] * len(instances)
+    return [bank if bank is not None else normalize_bank(rule, data["sentence_bank"])
+            for data, rule, bank in zip(instances, rules, stored)]
@@ -0,0 +1,85 @@
+"""
+Compilação dos templates de `config.LOGIC_RULES_CONFIG` em renderizadores prontos.
+
+Cada template (`template_context`, variantes de `bqa_templates` e `mcqa_correct_conclusion`)
+é analisado uma única vez, na importação do config: os trechos fixos viram uma string de
+formatação `%s` e os placeholders, uma tupla de chaves. Renderizar uma instância passa a
+ser só buscar as chaves no banco e substituir, sem `json.dumps`, regex ou `str.format`.
+Cada regra também conhece o seu conjunto de placeholders e o plano de negações derivadas
+(`{not p}` -> "não " + `{p}`, quando o banco não traz `not p`).
+"""
+from string import Formatter
+
+NEGATION_PREFIX = "not "
+DERIVED_NEGATION_WORD = "não "
+
+def capitalize_first(text):
+    return text[0].upper() + text[1:] if text else text
+
+class TemplateRenderer:
+    """Template `str.format` pré-analisado; `render(bank)` levanta KeyError se faltar um placeholder."""
+    __slots__ = ("template", "fields", "placeholders", "_format")
+
+    def __init__(self, template):
+        self.template = template
+        literals, fields = [], []
+        for literal, field, _, _ in Formatter().parse(template):
+            literals.append(literal.replace('%', '%%'))
+            if field is not None:
+                literals.append('%s')
+                fields.append(field)
+        self._format = ''.join(literals)
+        self.fields = tuple(fields)
+        self.placeholders = frozenset(fields)
+
+    def render(self, bank):
+        return self._format % tuple([bank[field] for field in self.fields])
+
+class ClauseQuestionRenderer:
+    """Pergunta BQA no formato `{"prefix": ..., "clauses": [...]}`: prefixo + cláusulas unidas por " e " + "?"."""
+    __slots__ = ("prefix", "clauses", "placeholders")
+
+    def __init__(self, template):
+        self.prefix = TemplateRenderer(template["prefix"])
+        self.clauses = tuple(TemplateRenderer(clause) for clause in template["clauses"])
+        self.placeholders = self.prefix.placeholders.union(*(clause.placeholders for clause in self.clauses))
+
+    def render(self, bank):
+        return self.prefix.render(bank) + " e ".join([clause.render(bank) for clause in self.clauses]) + "?"
+
+def compile_question(template):
+    return ClauseQuestionRenderer(template) if isinstance(template, dict) else TemplateRenderer(template)
+
+class CompiledRule:
+    """Templates de uma regra, compilados; `template` guarda a entrada original do config."""
+
+    def __init__(self, rule_key, template):
+        self.rule_key = rule_key
+        self.template = template
+        self.context = TemplateRenderer(template["template_context"])
+        # Cada pergunta BQA: (variantes compiladas, resposta), na ordem do config.
+        self.bqa_questions = [([compile_question(variant) for variant in q["question"]], q["answer"])
+                              for q in template.get("bqa_templates", [])]
+        conclusion = template.get("mcqa_correct_conclusion")
+        self.mcqa_correct_conclusion = TemplateRenderer(conclusion) if conclusion is not None else None
+
+        renderers = [self.context, *(v for variants, _ in self.bqa_questions for v in variants)]
+        if self.mcqa_correct_conclusion is not None:
+            renderers.append(self.mcqa_correct_conclusion)
+        self.placeholders = frozenset().union(*(r.placeholders for r in renderers))
+        # Placeholder negado -> placeholder base, para completar bancos sem a negação explícita.
+        self.negation_plan = {p: p[len(NEGATION_PREFIX):] for p in sorted(self.placeholders) if p.startswith(NEGATION_PREFIX)}
+
+    def with_derived_negations(self, bank):
+        """Cópia de `bank` com as negações do plano que faltam, derivadas como "não " + base."""
+        bank = dict(bank)
+        for negated, base in self.negation_plan.items():
+            if negated not in bank and base in bank:
+                bank[negated] = DERIVED_NEGATION_WORD + bank[base]
+        return bank
+
+def compile_rules(logic_rules_config):
+    """`{"<tipo>/<regra>": CompiledRule}` para todas as regras do config."""
+    return {f"{logic_type}/{rule_name}": CompiledRule(f"{logic_type}/{rule_name}", template)
+            for logic_type, rules in logic_rules_config.items()
+            for rule_name, template in rules.items()}
@@ -0,0 +1,84 @@
+"""
+Testes da montagem em fatias dos arquivos finais.
+
+Rode a partir da raiz do repositório: python -m pytest dataset_generation/src/tests
+"""
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from assembly import (MAX_SHARDS_IN_FLIGHT_PER_WORKER, SamplesWriter, index_lines_by_rule, instance_rng, map_shards,
+                      read_lines_at, read_samples, rule_key_from_path, rule_output_path, serialize_samples, shards,
+                      write_sharded_samples)
+
+RULE_KEY = "PL/Modus_Tollens"
+
+def _samples(first_id, count):
+    return [{"id": i, "context": f"Contexto {i} com acentuação", "options": ["a", "b"], "answer": i % 2}
+            for i in range(first_id, first_id + count)]
+
+@pytest.mark.parametrize("output_format", ["json", "jsonl"])
+def test_sharded_writes_match_a_single_dump(tmp_path, output_format):
+    samples = _samples(1, 7)
+    shard_results = [(serialize_samples(chunk, output_format), len(chunk)) for _, chunk in shards(samples, 3)]
+    # Uma fatia vazia (todos os itens pulados) não pode deixar vírgula sobrando no JSON.
+    shard_results.insert(1, (serialize_samples([], output_format), 0))
+    write_sharded_samples(tmp_path, [RULE_KEY] * len(shard_results), iter(shard_results), output_format)
+
+    path = rule_output_path(tmp_path, RULE_KEY, output_format)
+    assert read_samples(path) == samples
+    if output_format == "json":
+        expected = {"type": "propositional_logic", "axiom": "modus_tollens", "samples": samples}
+        assert path.read_text(encoding="utf-8") == json.dumps(expected, ensure_ascii=False, indent=4)
+    assert rule_key_from_path(path, tmp_path) == RULE_KEY
+
+def test_failed_assembly_leaves_no_partial_file(tmp_path):
+    def results():
+        yield serialize_samples(_samples(1, 2)), 2
+        raise RuntimeError("falha no meio")
+
+    with pytest.raises(RuntimeError):
+        write_sharded_samples(tmp_path, [RULE_KEY] * 2, results())
+    assert not rule_output_path(tmp_path, RULE_KEY).exists()
+
+def test_samples_writer_counts_samples(tmp_path):
+    writer = SamplesWriter(tmp_path, RULE_KEY)
+    for sample in _samples(1, 3):
+        writer.write(sample)
+    writer.close()
+    assert writer.count == 3
+    assert [sample["id"] for sample in read_samples(rule_output_path(tmp_path, RULE_KEY))] == [1, 2, 3]
+
+def test_map_shards_keeps_task_order_with_any_number_of_workers():
+    tasks = [list(range(i)) for i in range(20)]
+    assert list(map_shards(sum, tasks, workers=3)) == list(map_shards(sum, tasks, workers=1)) == [sum(t) for t in tasks]
+
+def test_map_shards_bounds_the_tasks_in_flight():
+    consumed = []
+
+    def tasks():
+        for i in range(50):
+            consumed.append(i)
+            yield [i]
+
+    workers = 2
+    results = map_shards(sum, tasks(), workers=workers)
+    assert next(results) == 0
+    assert len(consumed) <= workers * MAX_SHARDS_IN_FLIGHT_PER_WORKER
+    assert list(results) == list(range(1, 50))
+
+def test_log_index_reads_each_rule_in_file_order(tmp_path):
+    log_path = tmp_path / "log.jsonl"
+    lines = [{"rule": "PL/A", "n": 0}, {"rule": "PL/B", "n": 1}, {"rule": "PL/A", "n": 2}]
+    log_path.write_text("".join(json.dumps(line) + "\n" for line in lines) + "{malformada\n", encoding="utf-8")
+    offsets = index_lines_by_rule(log_path)
+    assert set(offsets) == {"PL/A", "PL/B"}
+    assert [record["n"] for record in read_lines_at(log_path, offsets["PL/A"])] == [0, 2]
+
+def test_instance_rng_depends_only_on_seed_rule_and_id():
+    assert instance_rng(0, RULE_KEY, 5).random() == instance_rng(0, RULE_KEY, 5).random()
+    assert instance_rng(0, RULE_KEY, 5).random() != instance_rng(1, RULE_KEY, 5).random()
@@ -0,0 +1,96 @@
+"""
+Testes do cache de respostas da LLM e do modo replay.
+
+Rode a partir da raiz do repositório: python -m pytest dataset_generation/src/tests
+"""
+import sys
+from argparse import Namespace
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+import engine
+from cache import CacheMissError, ResponseCache
+from engine import ApiKeyManager, LLMResponse
+from mock_backend import MockBackend
+
+QUOTA = {"rpm": 10 ** 6, "tpm": 10 ** 12}
+MODEL_NAME = "gemini-2.5-flash"
+
+class CountingBackend(MockBackend):
+    def __init__(self, text="resposta"):
+        super().__init__()
+        self.text = text
+        self.calls = 0
+
+    def generate(self, key, model_name, prompt, generation_config=None):
+        self.calls += 1
+        return LLMResponse(self.text)
+
+@pytest.fixture
+def backend():
+    backend, previous = CountingBackend(), engine._backend
+    engine.set_backend(backend)
+    yield backend
+    engine.set_backend(previous)
+
+@pytest.fixture
+def configure(tmp_path):
+    previous = engine._response_cache
+
+    def configure(replay_only=False):
+        return engine.configure_cache(Namespace(no_cache=False, replay_only=replay_only, cache_path=tmp_path / "c.sqlite",
+                                                cache_max_age_days=None, cache_max_size_mb=None))
+    yield configure
+    engine._response_cache = previous
+
+def _call(prompt="Diga oi"):
+    return engine.make_api_call(ApiKeyManager(keys=["k"], quotas={MODEL_NAME: QUOTA}), MODEL_NAME, prompt)
+
+def test_second_call_is_answered_by_the_cache(backend, configure):
+    configure()
+    assert _call() == _call() == "resposta"
+    assert backend.calls == 1
+
+def test_replay_only_fails_on_a_miss_and_serves_hits(backend, configure):
+    configure()
+    _call("já respondido")
+    configure(replay_only=True)
+    assert _call("já respondido") == "resposta"
+    with pytest.raises(CacheMissError):
+        _call("nunca visto")
+    assert backend.calls == 1
+
+def test_discarded_response_is_fetched_again(backend, configure):
+    configure()
+    _call()
+    engine.discard_response(MODEL_NAME, "Diga oi")
+    _call()
+    assert backend.calls == 2
+
+def test_empty_responses_are_not_stored(configure, backend):
+    configure()
+    backend.text = ""
+    _call()
+    _call()
+    assert backend.calls == 2
+
+def test_hits_update_last_use_in_batches(tmp_path):
+    cache = ResponseCache(tmp_path / "c.sqlite")
+    cache.put(MODEL_NAME, "p", "r")
+    stored_at = cache.conn.execute("SELECT last_used_at FROM responses").fetchone()[0]
+    assert cache.get(MODEL_NAME, "p") == "r"
+    # Um acerto não escreve no disco; o horário sai no próximo lote (aqui, no close).
+    assert cache.conn.execute("SELECT last_used_at FROM responses").fetchone()[0] == stored_at
+    cache.close()
+    reopened = ResponseCache(tmp_path / "c.sqlite")
+    assert reopened.conn.execute("SELECT last_used_at FROM responses").fetchone()[0] > stored_at
+    reopened.close()
+
+def test_mock_responses_do_not_answer_the_real_backend(configure):
+    cache = configure()
+    cache.put(MODEL_NAME, "p", "simulada", namespace=MockBackend.cache_namespace)
+    assert cache.get(MODEL_NAME, "p", namespace=MockBackend.cache_namespace) == "simulada"
+    assert cache.get(MODEL_NAME, "p", namespace=engine.GeminiBackend.cache_namespace) is None
@@ -0,0 +1,63 @@
+"""
+Testes do checkpoint JSONL usado para retomar as etapas que chamam a LLM.
+
+Rode a partir da raiz do repositório: python -m pytest dataset_generation/src/tests
+"""
+import json
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from checkpoint import ITEM_HASH_FIELD, JsonlCheckpoint, item_hash
+
+def _lines(path):
+    return [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+
+def test_resume_loads_hashed_records_and_drops_provisional_ones(tmp_path):
+    path = tmp_path / "saida.jsonl"
+    with JsonlCheckpoint(path, resume=False) as checkpoint:
+        checkpoint.write("a", [{"texto": "pronto"}])
+        checkpoint.write_provisional([{"texto": "templatizado"}])
+        checkpoint.write("b", [{"texto": "b1"}, {"texto": "b2"}])
+
+    with JsonlCheckpoint(path) as checkpoint:
+        assert checkpoint.num_completed() == 3
+        assert checkpoint.is_completed("a") and not checkpoint.is_completed("c")
+        # O provisório sai do arquivo para o item refeito não aparecer duas vezes.
+        assert [line["texto"] for line in _lines(path)] == ["pronto", "b1", "b2"]
+        checkpoint.write("c", [{"texto": "refeito"}])
+    assert [line[ITEM_HASH_FIELD] for line in _lines(path)] == ["a", "b", "b", "c"]
+
+def test_take_consumes_one_record_per_repeated_item(tmp_path):
+    path = tmp_path / "saida.jsonl"
+    with JsonlCheckpoint(path, resume=False) as checkpoint:
+        checkpoint.write("x", [{"n": 1}])
+        checkpoint.write("x", [{"n": 2}])
+    with JsonlCheckpoint(path) as checkpoint:
+        assert checkpoint.take("x")["n"] == 1
+        assert checkpoint.take("x")["n"] == 2
+        assert checkpoint.take("x") is None
+        assert not checkpoint.is_completed("x")
+
+def test_partial_last_line_is_discarded(tmp_path):
+    path = tmp_path / "saida.jsonl"
+    with JsonlCheckpoint(path, resume=False) as checkpoint:
+        checkpoint.write("a", [{"texto": "pronto"}])
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('{"texto": "cort')
+    with JsonlCheckpoint(path) as checkpoint:
+        assert list(checkpoint.completed) == ["a"]
+    assert len(_lines(path)) == 1
+
+def test_restart_recreates_the_file(tmp_path):
+    path = tmp_path / "saida.jsonl"
+    with JsonlCheckpoint(path, resume=False) as checkpoint:
+        checkpoint.write("a", [{"texto": "pronto"}])
+    with JsonlCheckpoint(path, resume=False) as checkpoint:
+        assert not checkpoint.completed
+    assert path.read_text(encoding='utf-8') == ""
+
+def test_item_hash_is_stable_and_order_sensitive():
+    assert item_hash("regra", {"b": 1, "a": 2}) == item_hash("regra", {"a": 2, "b": 1})
+    assert item_hash("p", "q") != item_hash("q", "p")
@@ -0,0 +1,161 @@
+"""
+Testes do engine de chamadas: backend Gemini assíncrono, limitadores de quota e novas tentativas.
+
+Rode a partir da raiz do repositório: python -m pytest dataset_generation/src/tests
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+import engine
+from engine import GeminiBackend, glm
+
+class FakeAsyncClient:
+    """Substitui o cliente gRPC: guarda os pedidos e devolve uma resposta fixa."""
+    instances = []
+
+    def __init__(self, client_options):
+        self.api_key = client_options["api_key"]
+        self.requests = []
+        FakeAsyncClient.instances.append(self)
+
+    async def generate_content(self, request):
+        self.requests.append(request)
+        return glm.GenerateContentResponse(
+            candidates=[glm.Candidate(content=glm.Content(parts=[glm.Part(text=" Olá, "), glm.Part(text="mundo. ")]))],
+            usage_metadata={"total_token_count": 12})
+
+@pytest.fixture
+def fake_client(monkeypatch):
+    FakeAsyncClient.instances = []
+    monkeypatch.setattr(glm, "GenerativeServiceAsyncClient", FakeAsyncClient)
+    return FakeAsyncClient
+
+def test_gemini_async_call_builds_the_request_per_key(fake_client):
+    backend = GeminiBackend()
+
+    async def run():
+        first = await backend.generate_async("chave-a", "gemini-2.5-flash", "Diga oi", {"temperature": 0.2})
+        await backend.generate_async("chave-a", "gemini-2.5-flash", "De novo")
+        await backend.generate_async("chave-b", "gemini-2.5-pro", "Outra chave")
+        return first
+
+    response = asyncio.run(run())
+    assert (response.text, response.total_tokens) == ("Olá, mundo.", 12)
+    assert [client.api_key for client in fake_client.instances] == ["chave-a", "chave-b"]
+    request = fake_client.instances[0].requests[0]
+    assert request.model == "models/gemini-2.5-flash"
+    assert request.contents[0].parts[0].text == "Diga oi"
+    assert request.generation_config.temperature == pytest.approx(0.2)
+
+def test_gemini_blocked_response_is_an_error(fake_client, monkeypatch):
+    async def blocked(self, request):
+        return glm.GenerateContentResponse()
+    monkeypatch.setattr(FakeAsyncClient, "generate_content", blocked)
+    with pytest.raises(ValueError):
+        asyncio.run(GeminiBackend().generate_async("k", "gemini-2.5-flash", "p"))
+
+class FlakyBackend(engine.LLMBackend):
+    """Falha com erro genérico nas primeiras `failures` chamadas e depois responde."""
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = 0
+
+    def generate(self, key, model_name, prompt, generation_config=None):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise ConnectionError("serviço indisponível")
+        return engine.LLMResponse("ok")
+
+    async def generate_async(self, key, model_name, prompt, generation_config=None):
+        return self.generate(key, model_name, prompt, generation_config)
+
+@pytest.fixture
+def no_cache(monkeypatch):
+    monkeypatch.setattr(engine, "_response_cache", None)
+
+def _key_manager(num_keys=1):
+    quota = {"rpm": 10 ** 6, "tpm": 10 ** 12}
+    return engine.ApiKeyManager(keys=[f"k{i}" for i in range(num_keys)], quotas={"gemini-2.5-flash": quota})
+
+def test_generic_errors_back_off_exponentially(monkeypatch, no_cache):
+    sleeps = []
+    monkeypatch.setattr(engine, "_backend", FlakyBackend(failures=2))
+    monkeypatch.setattr(engine.time, "sleep", sleeps.append)
+    assert engine.make_api_call(_key_manager(), "gemini-2.5-flash", "p") == "ok"
+    base = engine.RETRY_BASE_DELAY_SECONDS
+    assert len(sleeps) == 2
+    assert base / 2 <= sleeps[0] <= base and base <= sleeps[1] <= 2 * base
+
+def test_async_call_backs_off_and_gives_up_without_a_final_wait(monkeypatch, no_cache):
+    sleeps = []
+
+    async def fake_sleep(seconds):
+        sleeps.append(seconds)
+    monkeypatch.setattr(engine, "_backend", FlakyBackend(failures=10))
+    monkeypatch.setattr(engine.asyncio, "sleep", fake_sleep)
+    assert asyncio.run(engine.AsyncApiEngine(_key_manager()).call("gemini-2.5-flash", "p")) is None
+    # Três tentativas, duas esperas: nada de esperar depois da última.
+    assert len(sleeps) == engine.MIN_ATTEMPTS_PER_CALL - 1
+    assert sleeps[1] >= engine.RETRY_BASE_DELAY_SECONDS
+
+def test_retry_delay_is_capped():
+    assert all(engine.RETRY_MAX_DELAY_SECONDS / 2 <= engine.retry_delay(50) <= engine.RETRY_MAX_DELAY_SECONDS
+               for _ in range(20))
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(engine.time, "monotonic", clock)
+    return clock
+
+def test_token_bucket_refills_at_the_quota_rate(clock):
+    bucket = engine.TokenBucket(60)  # 1 ficha por segundo
+    assert bucket.wait_time(60) == 0.0
+    bucket.consume(60)
+    assert bucket.wait_time(1) == pytest.approx(1.0)
+    clock.now += 30
+    assert bucket.wait_time(30) == 0.0
+    # Um pedido maior que a capacidade espera só até o balde encher, não para sempre.
+    assert bucket.wait_time(1000) == pytest.approx(30.0)
+    bucket.consume(100)
+    assert bucket.wait_time(1) == pytest.approx(71.0)
+
+def test_key_rate_limiter_waits_for_requests_and_tokens(clock):
+    limiter = engine.KeyRateLimiter(rpm=2, tpm=1000)
+    limiter.consume(100)
+    limiter.consume(100)
+    assert limiter.wait_time(100) == pytest.approx(30.0)
+    clock.now += 30
+    assert limiter.wait_time(100) == 0.0
+    assert limiter.wait_time(900) == pytest.approx(0.0)
+    limiter.consume(900)
+    assert limiter.wait_time(1) > 0
+
+def test_parked_key_waits_until_the_usage_window_expires(clock):
+    limiter = engine.KeyRateLimiter(rpm=100, tpm=10 ** 6)
+    limiter.consume(10)
+    clock.now += 10
+    assert limiter.park() == pytest.approx(engine.USAGE_WINDOW_SECONDS - 10)
+    clock.now += engine.USAGE_WINDOW_SECONDS - 10
+    assert limiter.wait_time(10) == 0.0
+
+def test_scheduler_prefers_the_key_with_most_headroom(clock):
+    key_manager = engine.ApiKeyManager(keys=["a", "b"], quotas={"m": {"rpm": 10, "tpm": 10 ** 6}})
+    key_manager.get_limiter(0, "m").consume(10)
+    assert key_manager.reserve_key("m", 10) == (1, 0.0)
+    key_manager.park_key(1, "m")
+    # Com a chave 1 estacionada, só a 0 atende, mesmo com menos folga.
+    assert key_manager.reserve_key("m", 10) == (0, 0.0)
@@ -0,0 +1,50 @@
+"""
+Testes do índice MinHash de quase-duplicatas.
+
+Rode a partir da raiz do repositório: python -m pytest dataset_generation/src/tests
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from near_duplicates import MinHashIndex, jaccard, normalize_text, similarity
+
+BANK = "Se o trem atrasar, Ana perde a reunião das nove. O trem atrasou hoje de manhã."
+REWORDED = "Se o trem atrasar, a Ana perde a reunião das nove! O trem atrasou hoje de manhã."
+UNRELATED = "Quando chove no litoral, os pescadores ficam em casa consertando as redes."
+
+def test_normalize_text_ignores_case_and_punctuation():
+    assert normalize_text("  Olá,   MUNDO!! ") == "olá mundo"
+
+def test_signature_estimates_jaccard():
+    index = MinHashIndex()
+    estimate = similarity(index.signature(BANK), index.signature(REWORDED))
+    assert estimate == pytest.approx(jaccard(BANK, REWORDED), abs=0.15)
+    assert similarity(index.signature(BANK), index.signature(UNRELATED)) < 0.2
+
+def test_signatures_are_stable_between_indexes():
+    assert (MinHashIndex().signature(BANK) == MinHashIndex().signature(BANK)).all()
+
+def test_add_if_new_rejects_near_duplicates():
+    index = MinHashIndex()
+    assert index.add_if_new("a", BANK) is None
+    key, value = index.add_if_new("b", REWORDED)
+    assert key == "a" and value >= index.threshold
+    assert index.add_if_new("c", UNRELATED) is None
+    assert len(index) == 2 and "b" not in index
+
+def test_index_grows_past_its_initial_capacity():
+    index = MinHashIndex()
+    for i in range(100):
+        index.add(i, f"texto número {i} sobre o assunto {i * 7919}")
+    assert len(index) == 100
+    assert index.query(f"texto número 99 sobre o assunto {99 * 7919}")[0][0] == 99
+
+def test_duplicate_key_is_rejected():
+    index = MinHashIndex()
+    index.add("a", BANK)
+    with pytest.raises(KeyError):
+        index.add("a", UNRELATED)
@@ -0,0 +1,52 @@
+"""
+Testes do pipeline em fluxo com o backend simulado: ids e ordem dos arquivos finais.
+
+Rode a partir da raiz do repositório: python -m pytest dataset_generation/src/tests
+"""
+import logging
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent))
+sys.path.append(str(Path(__file__).parent.parent / "pipeline"))
+
+import engine
+from assembly import read_samples
+from engine import ApiKeyManager
+from mock_backend import MockBackend
+import run_streaming_pipeline as streaming
+
+QUOTA = {"rpm": 10 ** 6, "tpm": 10 ** 12}
+NUM_INSTANCES = 5
+
+@pytest.fixture
+def key_manager():
+    # Latência variável: os itens terminam fora da ordem em que entraram nas filas.
+    previous = engine._backend
+    engine.set_backend(MockBackend(latency=0.005, seed=3))
+    logging.disable(logging.CRITICAL)
+    yield ApiKeyManager(keys=["k"], quotas={streaming.stage_1.MODEL_NAME: QUOTA, streaming.stage_2.MODEL_NAME: QUOTA,
+                                            streaming.stage_4.MODEL_NAME: QUOTA})
+    logging.disable(logging.NOTSET)
+    engine.set_backend(previous)
+
+def _samples_by_file(base_dir):
+    return {path.relative_to(base_dir): read_samples(path) for path in sorted(base_dir.rglob("data_instances.json"))}
+
+def test_ids_follow_input_order_and_match_stages_3_and_4(tmp_path, key_manager):
+    streaming.run_streaming_pipeline(key_manager, tmp_path, tmp_path / "BQA", tmp_path / "MCQA", num_instances=NUM_INSTANCES,
+                                     naturalization_batch_size=1, distractors_batch_size=1, resume=False)
+    log_path = tmp_path / streaming.stage_2.OUTPUT_STAGE_2B_FILE.name
+    banks_path = tmp_path / streaming.stage_2.NORMALIZED_BANKS_FILE.name
+    streaming.stage_3.run_stage_3(log_path, tmp_path / "BQA3", banks_path)
+    # Com o checkpoint de distratores completo, a Etapa 4 não chama a API.
+    streaming.stage_4.run_stage_4(log_path, tmp_path / "MCQA4", tmp_path / streaming.stage_4.DISTRACTORS_FILE.name,
+                                  key_manager, resume=True, banks_path=banks_path)
+
+    for streamed_dir, staged_dir in (("BQA", "BQA3"), ("MCQA", "MCQA4")):
+        streamed, staged = _samples_by_file(tmp_path / streamed_dir), _samples_by_file(tmp_path / staged_dir)
+        assert streamed and streamed == staged
+        for samples in streamed.values():
+            assert [sample["id"] for sample in samples] == list(range(1, len(samples) + 1))
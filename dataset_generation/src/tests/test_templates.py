@@ -0,0 +1,49 @@
+"""
+Testes dos templates compilados das regras.
+
+Rode a partir da raiz do repositório: python -m pytest dataset_generation/src/tests
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from config import COMPILED_RULES, LOGIC_RULES_CONFIG
+from templates import ClauseQuestionRenderer, CompiledRule, TemplateRenderer
+
+def _bank(placeholders):
+    return {p: f"<{p}>" for p in placeholders}
+
+def test_render_matches_str_format_for_every_configured_template():
+    for rule_key, rule in COMPILED_RULES.items():
+        bank = _bank(rule.placeholders)
+        assert rule.context.render(bank) == rule.template["template_context"].format(**bank), rule_key
+        if rule.mcqa_correct_conclusion is not None:
+            expected = rule.template["mcqa_correct_conclusion"].format(**bank)
+            assert rule.mcqa_correct_conclusion.render(bank) == expected, rule_key
+
+def test_compiled_rules_cover_the_config():
+    assert set(COMPILED_RULES) == {f"{logic_type}/{name}" for logic_type, rules in LOGIC_RULES_CONFIG.items() for name in rules}
+
+def test_literal_percent_and_missing_placeholder():
+    renderer = TemplateRenderer("{p} em 100% dos casos")
+    assert renderer.render({"p": "chove"}) == "chove em 100% dos casos"
+    assert renderer.placeholders == {"p"}
+    with pytest.raises(KeyError):
+        renderer.render({})
+
+def test_clause_question_joins_clauses():
+    renderer = ClauseQuestionRenderer({"prefix": "É verdade que ", "clauses": ["{p}", "{not q}"]})
+    assert renderer.render({"p": "chove", "not q": "não venta"}) == "É verdade que chove e não venta?"
+    assert renderer.placeholders == {"p", "not q"}
+
+def test_negation_plan_derives_only_missing_negations():
+    rule = CompiledRule("PL/teste", {"template_context": "Se {p}, então {q}. {not q}.",
+                                     "mcqa_correct_conclusion": "{not p}"})
+    assert rule.negation_plan == {"not p": "p", "not q": "q"}
+    bank = rule.with_derived_negations({"p": "chove", "q": "a rua molha", "not q": "a rua segue seca"})
+    assert bank["not p"] == "não chove"
+    # Uma negação escrita pela LLM no banco não é substituída pela derivada.
+    assert bank["not q"] == "a rua segue seca"
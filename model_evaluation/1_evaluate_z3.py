@@ -1,12 +1,12 @@
 # model_evaluation/1_evaluate_z3.py
 import os
+import argparse
 import json
 import re
 import logging
 from z3 import *
 from pathlib import Path
 from tqdm import tqdm
-import pandas as pd
 import sys
 
 PROJECT_ROOT = Path(__file__).parent.parent
@@ -16,50 +16,58 @@ sys.path.append(str(DATASET_GENERATION_SRC_PATH))
 os.environ['GRPC_VERBOSITY'] = 'ERROR'
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-from engine import ApiKeyManager, make_api_call
+from engine import configure_backend, configure_cache, create_key_manager, make_api_call, run_api_calls_by_model
+from cache import add_cache_arguments
+from mock_backend import add_backend_arguments
+from verdict_cache import VerdictCache, add_verdict_cache_arguments, canonical_form
+from truth_table import UnsupportedFormula, truth_table_consequences, truth_table_entailments
+from formula import formula_to_z3, parse_formula
+from results_ledger import LEDGER_FILE_NAME, ResultsLedger, prompt_hash
+from results_store import add_store_arguments, export_to_excel, load_table, save_table
+from z3_solver import DEFAULT_CHUNK_SIZE, DEFAULT_TIMEOUT_MS, add_z3_arguments, solve_consequence, solve_consequences, solve_entailment_batches
 
 # --- CONFIGURAÇÃO DA AVALIAÇÃO Z3 ---
 MODELS_TO_TEST = ['gemini-2.5-pro', 'gemini-2.5-flash']
-EVALUATION_FILE = PROJECT_ROOT / "model_evaluation" / "dataframes" / "evaluation_spreadsheet.xlsx"
+Z3_TABLE = "z3_evaluation"
+# Colunas de que a coleta precisa; a tabela inteira só é lida na consolidação.
+TASK_COLUMNS = ['sample_id', 'rule', 'full_prompt']
 RAW_RESULTS_DIR = PROJECT_ROOT / "model_evaluation" / "z3_raw_results"
+# Tarefa das respostas desta etapa no ledger de resultados (`RAW_RESULTS_DIR/results_ledger.sqlite`).
+LEDGER_TASK = "z3_formalization"
+# Decide pela tabela-verdade (NumPy) antes de recorrer ao Z3; o resultado é o mesmo.
+USE_TRUTH_TABLE = True
+# Pool de processos do Z3 (None = número de CPUs) e tempo limite por checagem.
+Z3_WORKERS = None
+Z3_TIMEOUT_MS = DEFAULT_TIMEOUT_MS
+Z3_CHUNK_SIZE = DEFAULT_CHUNK_SIZE
 # ------------------------------------
 
+# Só em memória por padrão; `configure_verdict_cache` liga a persistência em disco.
+_verdict_cache = VerdictCache()
+
+def configure_verdict_cache(args):
+    global _verdict_cache
+    _verdict_cache = VerdictCache(None if args.no_verdict_cache else args.verdict_cache_path)
+    return _verdict_cache
+
 def parse_expr(expr_str, vars_map):
-    if not isinstance(expr_str, str): return BoolVal(True)
-    expr_str = expr_str.strip()
-    if re.fullmatch(r"[A-Za-z_][A-Za-z0-9_]*", expr_str):
-        name = expr_str
-        if name not in vars_map: vars_map[name] = Bool(name)
-        return vars_map[name]
-    m = re.match(r"^([A-Za-z_][A-Za-z0-9_]*)\((.*)\)$", expr_str)
-    if not m: raise ValueError(f"Erro ao analisar expressão: {expr_str}")
-    func, args_text = m.group(1), m.group(2).strip()
-    args, depth, current = [], 0, ''
-    for ch in args_text:
-        if ch == ',' and depth == 0:
-            args.append(current.strip()); current = ''
-            continue
-        current += ch
-        if ch == '(': depth += 1
-        elif ch == ')': depth -= 1
-    if current.strip(): args.append(current.strip())
-    parsed_args = [parse_expr(a, vars_map) for a in args if a != '']
-    if func == 'Not': return Not(parsed_args[0])
-    if func == 'Implies': return Implies(parsed_args[0], parsed_args[1])
-    if func == 'Or': return Or(*parsed_args)
-    if func == 'And': return And(*parsed_args)
-    raise ValueError(f"Função desconhecida: {func}")
+    """Expressão Z3 de `expr_str` (notação de funções ou infixa); ver `formula.parse_formula`."""
+    return formula_to_z3(parse_formula(expr_str), vars_map)
 
-def get_llm_formalization_from_text(context, model_name, key_manager):
+def build_formalization_prompt(natural_context):
     prompt = f"""Leia o contexto em linguagem natural abaixo. Identifique as premissas e a conclusão lógica implícita.
 Traduza-as para um objeto JSON, usando variáveis de uma letra (p, q, r, s).
 Use apenas as funções: Implies, Not, Or, And.
 
 Contexto:
-"{context['natural_context']}"
+"{natural_context}"
 
 Retorne SOMENTE o objeto JSON, com o formato: {{"variables": ["p", "q"], "premises": ["Implies(p,q)", "Not(q)"], "conclusion": "Not(p)"}}.
 JSON:"""
+    return prompt
+
+def get_llm_formalization_from_text(context, model_name, key_manager):
+    prompt = build_formalization_prompt(context['natural_context'])
     response_text = make_api_call(key_manager, model_name, prompt, call_purpose=f"TextToZ3 ({context['rule']})")
     if not response_text: raise Exception("LLM retornou resposta vazia")
     try:
@@ -70,116 +78,258 @@ JSON:"""
         raise Exception(f"Erro ao analisar resposta da LLM: {e}")
 
 def evaluate_z3_consequence(formalization_dict):
-    try:
-        solver = Solver()
-        vars_map = {}
-        for p_str in formalization_dict.get('premises', []):
-            expr = parse_expr(p_str, vars_map)
-            solver.add(expr)
-        conclusion_expr = parse_expr(formalization_dict.get('conclusion', 'True'), vars_map)
-        solver.add(Not(conclusion_expr))
-        result = solver.check()
-        is_consequence = (result == unsat)
-        return {
-            "z3_result_of_negation": str(result),
-            "is_consequence_logic": is_consequence
-        }
-    except Exception as e:
-        return {
-            "z3_result_of_negation": f"Z3_ERROR: {e}",
-            "is_consequence_logic": False
-        }
+    """Veredito de uma formalização; ver `evaluate_consequences`."""
+    return evaluate_consequences([formalization_dict])[0]
+
+def evaluate_consequences(formalization_dicts):
+    """Vereditos de um lote, no formato de `solve_z3_consequence`.
+
+    Cada forma canônica distinta é decidida uma vez: primeiro no cache de vereditos, depois
+    pela tabela-verdade vetorizada e, só para o que ela não cobre, pelo Z3 (em um pool de
+    processos, com tempo limite por checagem).
+    """
+    results = [None] * len(formalization_dicts)
+    # Forma canônica (ou a própria posição, se não houver forma) -> posições no lote.
+    pending = {}
+    for index, formalization_dict in enumerate(formalization_dicts):
+        canonical = canonical_form(formalization_dict)
+        cached = _verdict_cache.get(canonical) if canonical is not None else None
+        if cached is not None:
+            results[index] = dict(cached)
+        else:
+            pending.setdefault(canonical if canonical is not None else index, []).append(index)
+
+    groups = list(pending.items())
+    representatives = [formalization_dicts[indexes[0]] for _, indexes in groups]
+    group_results = truth_table_consequences(representatives) if USE_TRUTH_TABLE else [None] * len(groups)
+    for_z3 = [i for i, result in enumerate(group_results) if result is None]
+    z3_results = solve_consequences([representatives[i] for i in for_z3], workers=Z3_WORKERS,
+                                    timeout_ms=Z3_TIMEOUT_MS, chunk_size=Z3_CHUNK_SIZE)
+    for i, result in zip(for_z3, z3_results):
+        group_results[i] = result
+
+    for (key, indexes), result in zip(groups, group_results):
+        # Só "sat"/"unsat" entram no cache: erros citam os nomes originais e um timeout pode
+        # ser resolvido numa execução com mais tempo.
+        if isinstance(key, tuple) and result["z3_result_of_negation"] in ("sat", "unsat"):
+            _verdict_cache.put(key, result)
+        for index in indexes:
+            results[index] = dict(result)
+    return results
+
+def evaluate_entailments(contexts):
+    """Vetor de vereditos por contexto `{"premises": [...], "conclusions": [...]}`.
+
+    As premissas de cada contexto são avaliadas uma única vez para todas as conclusões (as
+    perguntas de uma amostra BQA ou as opções de uma MCQA): pela tabela-verdade quando
+    possível e, senão, por um único `Solver` do Z3 com `push()/pop()` por conclusão.
+    """
+    results = [None] * len(contexts)
+    for_z3 = []
+    for index, context in enumerate(contexts):
+        premises, conclusions = list(context.get('premises', [])), list(context.get('conclusions', []))
+        if USE_TRUTH_TABLE:
+            try:
+                results[index] = truth_table_entailments(premises, conclusions)
+                continue
+            except UnsupportedFormula:
+                pass
+        for_z3.append((index, premises, conclusions))
+    z3_results = solve_entailment_batches([(premises, conclusions) for _, premises, conclusions in for_z3],
+                                          workers=Z3_WORKERS, timeout_ms=Z3_TIMEOUT_MS, chunk_size=Z3_CHUNK_SIZE)
+    for (index, _, _), verdicts in zip(for_z3, z3_results):
+        results[index] = verdicts
+    return results
+
+def solve_z3_consequence(formalization_dict):
+    return solve_consequence(formalization_dict, timeout_ms=Z3_TIMEOUT_MS)
+
+def open_results_ledger(raw_results_dir):
+    return ResultsLedger(raw_results_dir / LEDGER_FILE_NAME)
+
+def legacy_results_path(raw_results_dir, model_name):
+    return raw_results_dir / f"z3_results_{model_name.replace('-', '_')}.jsonl"
+
+def current_prompt_hashes(df_tasks):
+    """`{sample_id: hash do prompt atual}` das tarefas, para casar com as chaves do ledger."""
+    return dict(zip(df_tasks['sample_id'].tolist(), map(prompt_hash, df_tasks['full_prompt'].tolist())))
+
+def migrate_legacy_results(ledger, model_name, raw_results_dir, df_tasks):
+    """Importa o JSONL antigo de `model_name` para o ledger, se o ledger ainda não tiver respostas do modelo.
+
+    As respostas antigas recebem o hash do prompt atual da tarefa, como a retomada por
+    `sample_id` já supunha.
+    """
+    legacy_path = legacy_results_path(raw_results_dir, model_name)
+    if not legacy_path.exists() or ledger.count(model_name, LEDGER_TASK):
+        return 0
+    return ledger.import_jsonl(model_name, LEDGER_TASK, legacy_path, current_prompt_hashes(df_tasks),
+                               response_field="llm_formalization")
 
+def _pending_tasks(ledger, df_tasks, model_name):
+    # Uma tarefa cujo prompt mudou tem outro hash e é coletada de novo.
+    completed = ledger.completed_keys(model_name, LEDGER_TASK)
+    hashes = [prompt_hash(prompt) for prompt in df_tasks['full_prompt'].tolist()]
+    pending = [(sample_id, h) not in completed for sample_id, h in zip(df_tasks['sample_id'].tolist(), hashes)]
+    print(f"{model_name}: {len(df_tasks) - sum(pending)} tarefas já concluídas. Pulando.")
+    tasks_to_run = df_tasks[pending]
+    return {
+        "sample_ids": tasks_to_run['sample_id'].tolist(),
+        "prompts": tasks_to_run['full_prompt'].tolist(),
+        "prompt_hashes": [h for h, is_pending in zip(hashes, pending) if is_pending],
+        "call_purposes": [f"ToZ3 ({rule})" for rule in tasks_to_run['rule']],
+    }
+
+def collect_results(df_tasks, model_names, key_manager, raw_results_dir):
+    """Coleta (de forma resumível) as formalizações de todos os modelos ao mesmo tempo.
+
+    As tarefas pendentes de todos os modelos são disparadas juntas, com workers e barra de
+    progresso por modelo; como as quotas são por par (chave, modelo), acrescentar um modelo
+    custa quota, e não tempo de parede.
+    """
+    print(f"\n--- Iniciando coleta de dados para os modelos: {', '.join(model_names)} ---")
+    with open_results_ledger(raw_results_dir) as ledger:
+        pending = {}
+        for model_name in model_names:
+            migrate_legacy_results(ledger, model_name, raw_results_dir, df_tasks)
+            pending[model_name] = _pending_tasks(ledger, df_tasks, model_name)
+
+        progress = {model_name: tqdm(total=len(tasks["prompts"]), desc=f"Avaliando {model_name}", position=position)
+                    for position, (model_name, tasks) in enumerate(pending.items())}
+
+        def write_result(model_name, index, response_text):
+            if not response_text:
+                response_text = "API_ERROR"
+            tasks = pending[model_name]
+            ledger.add(model_name, LEDGER_TASK, tasks["sample_ids"][index], tasks["prompt_hashes"][index], response_text)
+            progress[model_name].update(1)
+
+        # A retomada usa a chave do ledger, então os resultados podem ser gravados fora de ordem.
+        run_api_calls_by_model(key_manager, {model_name: tasks["prompts"] for model_name, tasks in pending.items()},
+                               call_purposes_by_model={model_name: tasks["call_purposes"] for model_name, tasks in pending.items()},
+                               on_result=write_result, ordered=False)
+        for bar in progress.values():
+            bar.close()
+
+def collect_model_results(df_tasks, model_name, key_manager, raw_results_dir):
+    """Coleta as formalizações de um único modelo; ver `collect_results`."""
+    collect_results(df_tasks, [model_name], key_manager, raw_results_dir)
+
+def export_model_results(model_names, raw_results_dir, df_tasks):
+    """Regrava `z3_results_<modelo>.jsonl` a partir do ledger, no formato anterior (só respostas aos prompts atuais)."""
+    prompt_hashes = current_prompt_hashes(df_tasks)
+    with open_results_ledger(raw_results_dir) as ledger:
+        for model_name in model_names:
+            path = legacy_results_path(raw_results_dir, model_name)
+            count = ledger.export_jsonl(model_name, LEDGER_TASK, path, response_field="llm_formalization",
+                                        prompt_hashes=prompt_hashes)
+            print(f"{count} resultados de {model_name} exportados para '{path.name}'.")
+
+def z3_verdicts_from_texts(formalization_strs):
+    """Vereditos Z3 (`z3_result_of_negation`) de respostas brutas da LLM; None onde o JSON for inválido."""
+    parsed = {}
+    for formalization_str in formalization_strs:
+        match = re.search(r'\{.*\}', formalization_str, re.DOTALL)
+        json_str = match.group(0) if match else "{}"
+        try:
+            parsed[formalization_str] = json.loads(json_str)
+        except json.JSONDecodeError:
+            continue
+    results = evaluate_consequences(list(parsed.values()))
+    verdicts = {text: result["z3_result_of_negation"] for text, result in zip(parsed, results)}
+    return [verdicts.get(text) for text in formalization_strs]
+
+def consolidate_results(df_final, model_names, raw_results_dir):
+    """Preenche em `df_final` as formalizações brutas e o veredito Z3 de cada modelo.
+
+    Os resultados de cada modelo vêm do ledger e entram com um único merge por `sample_id`,
+    e o Z3 roda uma vez por formalização distinta em vez de uma vez por linha. Só valem as
+    respostas ao prompt atual de cada amostra; as de um prompt que mudou desde a coleta ficam de fora.
+    """
+    prompt_hashes = current_prompt_hashes(df_final)
+    with open_results_ledger(raw_results_dir) as ledger:
+        for model_name in model_names:
+            model_key = model_name.replace('-', '_')
+            formalization_col = f"{model_key}_formalization"
+            result_col = f"{model_key}_z3_result"
+
+            # Colunas vazias lidas do Excel vêm como float; object aceita os textos sem conversão.
+            for col in (formalization_col, result_col):
+                df_final[col] = df_final[col].astype(object) if col in df_final.columns else None
+
+            migrate_legacy_results(ledger, model_name, raw_results_dir, df_final)
+            df_results = ledger.results(model_name, LEDGER_TASK, prompt_hashes).rename(columns={'response': 'llm_formalization'})
+            if df_results.empty:
+                continue
+            texts = df_results['llm_formalization'].unique().tolist()
+            verdicts = dict(zip(texts, z3_verdicts_from_texts(texts)))
+            df_results['z3_result'] = df_results['llm_formalization'].map(verdicts)
+
+            merged = df_final[['sample_id']].merge(df_results, on='sample_id', how='left', validate='many_to_one')
+            matched = merged['llm_formalization'].notna().to_numpy()
+            df_final.loc[matched, formalization_col] = merged.loc[matched, 'llm_formalization'].to_numpy()
+            # Formalizações com JSON inválido mantêm o veredito anterior, como antes.
+            has_verdict = matched & merged['z3_result'].notna().to_numpy()
+            df_final.loc[has_verdict, result_col] = merged.loc[has_verdict, 'z3_result'].to_numpy()
+    _verdict_cache.log_stats()
+    return df_final
 
 def main():
+    parser = argparse.ArgumentParser(description="Avaliação das formalizações Z3 geradas pelas LLMs.")
+    add_cache_arguments(parser)
+    add_backend_arguments(parser)
+    add_verdict_cache_arguments(parser)
+    parser.add_argument("--z3-only", action="store_true", help="Decide tudo pelo Z3, sem o atalho da tabela-verdade.")
+    add_z3_arguments(parser)
+    add_store_arguments(parser)
+    parser.add_argument("--export-jsonl", action="store_true",
+                        help="Após a coleta, exporta as respostas do ledger para 'z3_results_<modelo>.jsonl'.")
+    args = parser.parse_args()
+    configure_cache(args)
+    configure_backend(args)
+    configure_verdict_cache(args)
+    global USE_TRUTH_TABLE, Z3_WORKERS, Z3_TIMEOUT_MS, Z3_CHUNK_SIZE
+    USE_TRUTH_TABLE = not args.z3_only
+    Z3_WORKERS, Z3_TIMEOUT_MS, Z3_CHUNK_SIZE = args.z3_workers, args.z3_timeout_ms, args.z3_chunk_size
+
     try:
-        key_manager = ApiKeyManager()
+        key_manager = create_key_manager(args)
     except Exception as e:
         print(f"CRÍTICO: Falha ao iniciar o gerenciador de chaves. Erro: {e}"); exit()
 
     try:
-        df_tasks = pd.read_excel(EVALUATION_FILE, sheet_name="Z3_Evaluation")
-        print(f"Planilha 'Z3_Evaluation' carregada com {len(df_tasks)} tarefas.")
+        df_tasks = load_table(Z3_TABLE, columns=TASK_COLUMNS, store_dir=args.store_dir)
+        print(f"Tabela '{Z3_TABLE}' carregada com {len(df_tasks)} tarefas.")
     except (FileNotFoundError, ValueError) as e:
-        print(f"ERRO: Não foi possível ler a aba 'Z3_Evaluation' do arquivo '{EVALUATION_FILE.name}'.")
+        print(f"ERRO: Não foi possível ler a tabela '{Z3_TABLE}' (nem a aba 'Z3_Evaluation' da planilha) em '{args.store_dir}': {e}")
         print("Por favor, execute o script 'generate_z3_sheet_template.py' primeiro.")
         exit()
 
     os.makedirs(RAW_RESULTS_DIR, exist_ok=True)
 
     # --- ETAPA 1: COLETA DE DADOS (RESUMÍVEL) ---
-    for model_name in MODELS_TO_TEST:
-        print(f"\n--- Iniciando coleta de dados para o modelo: {model_name} ---")
-        output_jsonl_path = RAW_RESULTS_DIR / f"z3_results_{model_name.replace('-', '_')}.jsonl"
-        
-        completed_tasks = set()
-        if output_jsonl_path.exists():
-            with open(output_jsonl_path, 'r', encoding='utf-8') as f:
-                for line in f:
-                    try:
-                        completed_tasks.add(json.loads(line)['sample_id'])
-                    except (json.JSONDecodeError, KeyError):
-                        continue
-        
-        print(f"{len(completed_tasks)} tarefas já concluídas para {model_name}. Pulando.")
-
-        with open(output_jsonl_path, 'a', encoding='utf-8') as f_out:
-            tasks_to_run = df_tasks[~df_tasks['sample_id'].isin(completed_tasks)]
-            
-            for index, row in tqdm(tasks_to_run.iterrows(), total=len(tasks_to_run), desc=f"Avaliando {model_name}"):
-                prompt = row['full_prompt']
-                response_text = make_api_call(key_manager, model_name, prompt, call_purpose=f"ToZ3 ({row['rule']})")
-                
-                if not response_text:
-                    response_text = "API_ERROR"
-                
-                result_data = {
-                    "sample_id": row['sample_id'],
-                    "llm_formalization": response_text
-                }
-                f_out.write(json.dumps(result_data, ensure_ascii=False) + '\n')
+    collect_results(df_tasks, MODELS_TO_TEST, key_manager, RAW_RESULTS_DIR)
 
     print("\n--- COLETA DE DADOS CONCLUÍDA PARA TODOS OS MODELOS ---")
+    if args.export_jsonl:
+        export_model_results(MODELS_TO_TEST, RAW_RESULTS_DIR, df_tasks)
 
-    # --- ETAPA 2: CONSOLIDAÇÃO E INCLUSÃO NA PLANILHA ---
-    print("\nIniciando consolidação dos resultados na planilha Excel...")
-    
-    df_final = pd.read_excel(EVALUATION_FILE, sheet_name="Z3_Evaluation")
-
-    for model_name in MODELS_TO_TEST:
-        model_key = model_name.replace('-', '_')
-        formalization_col = f"{model_key}_formalization"
-        result_col = f"{model_key}_z3_result"
-        
-        if formalization_col not in df_final.columns: df_final[formalization_col] = None
-        if result_col not in df_final.columns: df_final[result_col] = None
-        
-        results_path = RAW_RESULTS_DIR / f"z3_results_{model_key}.jsonl"
-        if results_path.exists():
-            with open(results_path, 'r', encoding='utf-8') as f:
-                for line in f:
-                    try:
-                        res = json.loads(line)
-                        sample_id = res['sample_id']
-                        formalization_str = res['llm_formalization']
-                        
-                        target_index = df_final[df_final['sample_id'] == sample_id].index
-                        if not target_index.empty:
-                            df_final.loc[target_index, formalization_col] = formalization_str
-                            
-                            match = re.search(r'\{.*\}', formalization_str, re.DOTALL)
-                            json_str = match.group(0) if match else "{}"
-                            z3_result_dict = evaluate_z3_consequence(json.loads(json_str))
-                            df_final.loc[target_index, result_col] = z3_result_dict["z3_result_of_negation"]
-                    except (json.JSONDecodeError, KeyError):
-                        continue
+    # --- ETAPA 2: CONSOLIDAÇÃO NA TABELA DE RESULTADOS ---
+    print("\nIniciando consolidação dos resultados...")
 
-    try:
-        with pd.ExcelWriter(EVALUATION_FILE, engine='openpyxl', mode='a', if_sheet_exists='replace') as writer:
-            df_final.to_excel(writer, sheet_name="Z3_Evaluation", index=False)
-        print(f"\nSucesso! Os resultados foram preenchidos na aba 'Z3_Evaluation' do arquivo '{EVALUATION_FILE.name}'.")
-    except Exception as e:
-        print(f"\nERRO ao salvar os resultados no arquivo Excel: {e}")
+    df_final = load_table(Z3_TABLE, store_dir=args.store_dir)
+
+    df_final = consolidate_results(df_final, MODELS_TO_TEST, RAW_RESULTS_DIR)
+
+    table_file = save_table(df_final, Z3_TABLE, store_dir=args.store_dir)
+    print(f"\nSucesso! Os resultados foram gravados em '{table_file}'.")
+
+    if args.export_excel:
+        try:
+            excel_file = export_to_excel({Z3_TABLE: df_final}, store_dir=args.store_dir)
+            print(f"Resultados exportados para a aba 'Z3_Evaluation' do arquivo '{excel_file.name}'.")
+        except Exception as e:
+            print(f"\nERRO ao exportar os resultados para o Excel: {e}")
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,167 @@
+"""
+Busca de quase-duplicatas nos datasets gerados: contextos quase idênticos e distratores que copiam a opção correta.
+
+Os contextos de todas as regras (BQA e MCQA) passam por um único índice MinHash/LSH
+(`near_duplicates.MinHashIndex`): cada contexto novo é comparado só com os que caem nas
+mesmas faixas da assinatura, então o custo por inserção não cresce com o dataset. Um contexto
+quase idêntico a um já visto é marcado junto com o primeiro da série.
+
+Nos distratores, texto parecido não basta: "não X", "X e Y" no lugar de "X ou Y" e a recíproca
+"Se Y, então X" são distratores legítimos e repetem quase todas as palavras da opção correta.
+Um distrator só é cópia se tiver o mesmo esqueleto lógico da correta (os conectivos, na ordem) e
+cada trecho entre eles tiver o mesmo número de negações, as mesmas ressalvas e texto parecido
+com o trecho correspondente; com só "e"/"ou" os trechos podem vir em qualquer ordem. Negações
+e ressalvas vêm de pequenos léxicos de palavras, contadas em qualquer posição do trecho
+("jamais X", "X é falso", "ninguém garante que X", "talvez X"), e não de frases fixas.
+
+Uso: python model_evaluation/find_near_duplicates.py [--datasets-dir DIR] [--output relatorio.json]
+"""
+import argparse
+import logging
+import sys
+from pathlib import Path
+
+import pandas as pd
+
+PROJECT_ROOT = Path(__file__).parent.parent
+DATASET_GENERATION_SRC_PATH = PROJECT_ROOT / 'dataset_generation' / 'src'
+sys.path.append(str(DATASET_GENERATION_SRC_PATH))
+
+from assembly import read_samples, rule_key_from_path
+from near_duplicates import MinHashIndex, jaccard, normalize_text
+
+# --- CONFIGURAÇÃO DA BUSCA DE QUASE-DUPLICATAS ---
+DATASETS_DIR = PROJECT_ROOT / "dataset_generation" / "output" / "LogicBench(Eval)"
+TASKS = ("BQA", "MCQA")
+CONTEXT_THRESHOLD = 0.8
+DISTRACTOR_THRESHOLD = 0.7
+CONNECTIVES = frozenset({"se", "então", "ou", "e"})
+# "Se" só abre um condicional no começo de um trecho; no meio ("não se pode afirmar") é pronome.
+CLAUSE_OPENING_CONNECTIVES = frozenset({"se"})
+COMMUTATIVE_CONNECTIVES = frozenset({"ou", "e"})
+# Palavras que invertem o sentido do trecho em que aparecem, em qualquer posição.
+NEGATION_WORDS = frozenset({"não", "nem", "nunca", "jamais", "nenhum", "nenhuma", "ninguém", "nada", "sem",
+                            "impossível", "falso", "falsa", "mentira", "incorreto", "incorreta", "errado", "errada",
+                            "contrário"})
+# Ressalvas que mudam o sentido sem negar: o trecho só bate com outro que tenha as mesmas.
+HEDGING_WORDS = frozenset({"talvez", "apenas", "só", "somente", "vezes", "raramente", "possivelmente",
+                           "provavelmente", "quase", "mas", "porém", "contudo"})
+REPORT_COLUMNS = ["kind", "source", "rule", "sample_id", "text", "match_source", "match_rule", "match_id",
+                  "match_text", "similarity"]
+# ------------------------------------
+
+def iter_dataset_samples(base_dir=DATASETS_DIR):
+    """`(tarefa, regra, sample)` de todos os arquivos BQA e MCQA de `base_dir`, na ordem das pastas."""
+    for task in TASKS:
+        task_dir = Path(base_dir) / task
+        if not task_dir.exists():
+            continue
+        for path in sorted([*task_dir.rglob("data_instances.json"), *task_dir.rglob("data_instances.jsonl")]):
+            rule_key = rule_key_from_path(path, task_dir)
+            for sample in read_samples(path):
+                yield task, rule_key, sample
+
+def _clauses(text):
+    """Esqueleto lógico (os conectivos, na ordem) e os trechos entre eles, como `(negações, ressalvas, texto)`."""
+    skeleton, clauses, current = [], [], []
+
+    def close_clause():
+        if current:
+            negations = sum(word in NEGATION_WORDS for word in current)
+            hedges = frozenset(word for word in current if word in HEDGING_WORDS)
+            words = [word for word in current if word not in NEGATION_WORDS and word not in HEDGING_WORDS]
+            clauses.append((negations, hedges, " ".join(words)))
+            current.clear()
+
+    for word in normalize_text(text).split():
+        if word in CONNECTIVES and (word not in CLAUSE_OPENING_CONNECTIVES or not current):
+            skeleton.append(word)
+            close_clause()
+        else:
+            current.append(word)
+    close_clause()
+    return tuple(skeleton), clauses
+
+def _clause_similarity(clause, other):
+    # Trechos com negações ou ressalvas diferentes dizem outra coisa, por mais parecidas que sejam as palavras.
+    # A contagem é comparada, não a paridade: "o contrário ocorre: X é falso" não vira "X".
+    return jaccard(clause[2], other[2]) if clause[:2] == other[:2] else 0.0
+
+def near_copy_similarity(correct, distractor):
+    """Similaridade de um distrator com a opção correta: a do trecho menos parecido, ou 0 se os esqueletos diferem."""
+    correct_skeleton, correct_clauses = _clauses(correct)
+    skeleton, clauses = _clauses(distractor)
+    if skeleton != correct_skeleton or len(clauses) != len(correct_clauses) or not clauses:
+        return 0.0
+    if set(skeleton) <= COMMUTATIVE_CONNECTIVES:
+        return min(max(_clause_similarity(clause, other) for other in correct_clauses) for clause in clauses)
+    return min(_clause_similarity(clause, other) for clause, other in zip(clauses, correct_clauses))
+
+def _flag(kind, source, rule_key, sample_id, text, match, similarity):
+    match_source, match_rule, match_id, match_text = match
+    return {"kind": kind, "source": source, "rule": rule_key, "sample_id": sample_id, "text": text,
+            "match_source": match_source, "match_rule": match_rule, "match_id": match_id,
+            "match_text": match_text, "similarity": round(similarity, 3)}
+
+def near_duplicate_report(base_dir=DATASETS_DIR, context_threshold=CONTEXT_THRESHOLD,
+                          distractor_threshold=DISTRACTOR_THRESHOLD):
+    """DataFrame com um contexto ou distrator marcado por linha e o texto do qual ele é quase-cópia."""
+    index = MinHashIndex(context_threshold)
+    # O mesmo sample aparece no BQA e no MCQA com o mesmo contexto; ele entra no índice uma vez só.
+    contexts_by_sample, sources, rows, num_samples = {}, [], [], 0
+    for task, rule_key, sample in iter_dataset_samples(base_dir):
+        num_samples += 1
+        sample_id, context = sample.get("id"), sample.get("context", "")
+        if contexts_by_sample.get((rule_key, sample_id)) != context:
+            contexts_by_sample[(rule_key, sample_id)] = context
+            match = index.add_if_new(len(sources), context)
+            if match is None:
+                sources.append((task, rule_key, sample_id, context))
+            else:
+                rows.append(_flag("contexto", task, rule_key, sample_id, context, sources[match[0]], match[1]))
+
+        options, answer = sample.get("options", []), sample.get("answer")
+        if task == "MCQA" and isinstance(answer, int) and not 0 <= answer < len(options):
+            # O verify_labels.py aponta o índice inválido; aqui o sample só fica sem a checagem dos distratores.
+            logging.warning(f"{rule_key} #{sample_id}: índice de resposta inválido ({answer}); distratores não checados.")
+        elif task == "MCQA" and isinstance(answer, int):
+            correct = options[answer]
+            for position, option in enumerate(options):
+                similarity = near_copy_similarity(correct, option) if position != answer else 0.0
+                if similarity >= distractor_threshold:
+                    rows.append(_flag("distrator", task, rule_key, sample_id, option,
+                                      (task, rule_key, sample_id, correct), similarity))
+    logging.info(f"{num_samples} samples lidos, {len(index)} contextos distintos no índice.")
+    return pd.DataFrame(rows, columns=REPORT_COLUMNS)
+
+def summarize(report):
+    """Quantidade de contextos e distratores marcados por regra."""
+    return report.groupby(["kind", "rule"], sort=True).size().rename("flagged").reset_index()
+
+def main():
+    parser = argparse.ArgumentParser(description="Contextos quase duplicados e distratores que copiam a opção correta.")
+    parser.add_argument("--datasets-dir", type=Path, default=DATASETS_DIR, help="Pasta com as subpastas BQA e MCQA.")
+    parser.add_argument("--context-threshold", type=float, default=CONTEXT_THRESHOLD,
+                        help="Similaridade (Jaccard estimado) a partir da qual dois contextos são quase duplicados.")
+    parser.add_argument("--distractor-threshold", type=float, default=DISTRACTOR_THRESHOLD,
+                        help="Similaridade a partir da qual um distrator é cópia da opção correta.")
+    parser.add_argument("--output", type=Path, help="Grava os itens marcados em JSON (uma lista de objetos).")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    report = near_duplicate_report(args.datasets_dir, args.context_threshold, args.distractor_threshold)
+    with pd.option_context("display.width", 160, "display.max_columns", None, "display.max_colwidth", 80):
+        if len(report):
+            print(summarize(report).to_string(index=False))
+        for kind, flagged in report.groupby("kind", sort=True):
+            print(f"\n{kind}: {len(flagged)} marcado(s)")
+            print(flagged[["rule", "sample_id", "text", "match_rule", "match_id", "match_text", "similarity"]]
+                  .head(20).to_string(index=False))
+    if args.output:
+        report.to_json(args.output, orient="records", force_ascii=False, indent=2)
+        print(f"\nItens marcados gravados em '{args.output}'.")
+    print(f"\n{len(report)} quase-duplicata(s) encontrada(s).")
+    return 1 if len(report) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,235 @@
+"""
+Representação das fórmulas proposicionais das formalizações (Implies, Not, Or, And).
+
+`parse_formula` lê o texto da LLM em uma única passada, tanto na notação de funções
+(`Implies(p,Not(q))`) quanto na infixa (`p -> ~q`, `p | q`, `p & q`), e devolve uma árvore
+de `Node` com hash-consing: subárvores iguais são o mesmo objeto, então comparação e hash
+custam O(1). A árvore não depende do Z3; `formula_to_z3` e a tabela-verdade partem dela.
+"""
+import re
+import weakref
+from functools import lru_cache
+
+CONNECTIVES = ("Not", "Implies", "Or", "And")
+
+# Precedência dos operadores infixos; `->` associa à direita.
+PRECEDENCE = {"Implies": 1, "Or": 2, "And": 3, "Not": 4}
+INFIX_SYMBOLS = {"->": "Implies", "=>": "Implies", "→": "Implies", "|": "Or", "||": "Or", "∨": "Or",
+                 "&": "And", "&&": "And", "∧": "And", "~": "Not", "!": "Not", "¬": "Not"}
+
+TOKEN_PATTERN = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<ident>[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<operator>->|=>|→|\|\||\||&&|&|∨|∧|~|!|¬)
+  | (?P<lparen>\()
+  | (?P<rparen>\))
+  | (?P<comma>,)
+""", re.VERBOSE)
+
+class FormulaSyntaxError(ValueError):
+    """Expressão malformada; `position` é o índice do caractere onde o erro foi detectado."""
+
+    def __init__(self, message, text, position):
+        super().__init__(f"Erro ao analisar expressão na posição {position}: {message} em '{text}'")
+        self.text = text
+        self.position = position
+
+class Node:
+    """Nó imutável e único por conteúdo (hash-consing); crie-os só por `var`, `const` e `apply`.
+
+    `op` é "var", "const" ou um conectivo; `name` é o nome da variável ou o valor da constante.
+    """
+    __slots__ = ("op", "name", "args", "__weakref__")
+
+    def __repr__(self):
+        return format_formula(self)
+
+_interned = weakref.WeakValueDictionary()
+
+def _intern(op, name, args):
+    # Os filhos já são únicos, então a identidade deles basta como chave. Um nó vivo mantém os
+    # filhos vivos, o que impede a reutilização desses ids enquanto a entrada existir.
+    key = (op, name, tuple(id(arg) for arg in args))
+    node = _interned.get(key)
+    if node is None:
+        node = Node()
+        node.op, node.name, node.args = op, name, tuple(args)
+        _interned[key] = node
+    return node
+
+def var(name):
+    return _intern("var", name, ())
+
+def const(value):
+    return _intern("const", bool(value), ())
+
+def apply(op, *args):
+    """Aplica um conectivo, conferindo a aridade (Not: 1, Implies: 2, Or/And: 1 ou mais)."""
+    if op not in CONNECTIVES:
+        raise ValueError(f"Função desconhecida: {op}")
+    expected = {"Not": 1, "Implies": 2}.get(op)
+    if (expected is not None and len(args) != expected) or not args:
+        raise ValueError(f"{op} recebeu {len(args)} argumento(s)")
+    return _intern(op, None, args)
+
+TRUE = const(True)
+
+def tokenize(text):
+    """Lista de `(tipo, valor, posição)` em uma única passada sobre o texto."""
+    tokens, position = [], 0
+    while position < len(text):
+        match = TOKEN_PATTERN.match(text, position)
+        if match is None:
+            raise FormulaSyntaxError(f"caractere inesperado {text[position]!r}", text, position)
+        if match.lastgroup != "space":
+            tokens.append((match.lastgroup, match.group(), position))
+        position = match.end()
+    return tokens
+
+def _reduce(output, ops, text):
+    kind, op, position, _ = ops.pop()
+    try:
+        if kind == "prefix":
+            output.append(apply(op, output.pop()))
+        else:
+            right = output.pop()
+            output.append(apply(op, output.pop(), right))
+    except IndexError:
+        raise FormulaSyntaxError(f"operando ausente para {op}", text, position)
+
+def _parse(text):
+    output, ops = [], []  # ops: (tipo, conectivo, posição, início dos argumentos na saída)
+    tokens = tokenize(text)
+    expect_operand = True
+    index = 0
+    while index < len(tokens):
+        kind, value, position = tokens[index]
+        index += 1
+        if kind == "ident":
+            if not expect_operand:
+                raise FormulaSyntaxError(f"operador esperado antes de {value!r}", text, position)
+            if index < len(tokens) and tokens[index][0] == "lparen":
+                if value not in CONNECTIVES:
+                    raise FormulaSyntaxError(f"Função desconhecida: {value}", text, position)
+                ops.append(("call", value, position, len(output)))
+                index += 1
+            else:
+                output.append(var(value))
+                expect_operand = False
+        elif kind == "operator":
+            op = INFIX_SYMBOLS[value]
+            if op == "Not":
+                if not expect_operand:
+                    raise FormulaSyntaxError(f"operador esperado antes de {value!r}", text, position)
+                ops.append(("prefix", op, position, None))
+                continue
+            if expect_operand:
+                raise FormulaSyntaxError(f"operando esperado antes de {value!r}", text, position)
+            while ops and ops[-1][0] in ("prefix", "binary") and (
+                    PRECEDENCE[ops[-1][1]] > PRECEDENCE[op] or (PRECEDENCE[ops[-1][1]] == PRECEDENCE[op] and op != "Implies")):
+                _reduce(output, ops, text)
+            ops.append(("binary", op, position, None))
+            expect_operand = True
+        elif kind == "lparen":
+            if not expect_operand:
+                raise FormulaSyntaxError("operador esperado antes de '('", text, position)
+            ops.append(("group", None, position, len(output)))
+        elif kind in ("comma", "rparen"):
+            # Argumentos vazios (`Or(p,q,)`) são ignorados, como no parser anterior.
+            while ops and ops[-1][0] in ("prefix", "binary"):
+                if expect_operand:
+                    raise FormulaSyntaxError(f"operando esperado antes de {value!r}", text, position)
+                _reduce(output, ops, text)
+            if not ops or (kind == "comma" and ops[-1][0] != "call"):
+                raise FormulaSyntaxError(f"{value!r} sem '(' correspondente" if kind == "rparen"
+                                         else "',' fora de uma chamada de função", text, position)
+            if kind == "comma":
+                expect_operand = True
+                continue
+            frame_kind, op, frame_position, start = ops.pop()
+            if frame_kind == "group":
+                if len(output) != start + 1:
+                    raise FormulaSyntaxError("expressão vazia entre parênteses", text, frame_position)
+            else:
+                args = output[start:]
+                del output[start:]
+                try:
+                    output.append(apply(op, *args))
+                except ValueError as e:
+                    raise FormulaSyntaxError(str(e), text, frame_position)
+            expect_operand = False
+    if expect_operand:
+        raise FormulaSyntaxError("expressão incompleta", text, len(text))
+    while ops:
+        if ops[-1][0] in ("group", "call"):
+            raise FormulaSyntaxError("'(' não fechado", text, ops[-1][2])
+        _reduce(output, ops, text)
+    if len(output) != 1:
+        raise FormulaSyntaxError("operador esperado entre expressões", text, 0)
+    return output[0]
+
+@lru_cache(maxsize=65536)
+def _parse_cached(text):
+    return _parse(text)
+
+def parse_formula(expr_str):
+    """Converte `Implies(p,Not(q))` ou `p -> ~q` em `Node`; levanta `FormulaSyntaxError` se for inválida.
+
+    Valores que não são texto (ex.: premissa nula no JSON) valem `True`, como no parser anterior.
+    """
+    if not isinstance(expr_str, str): return TRUE
+    return _parse_cached(expr_str.strip())
+
+def postorder(roots):
+    """Nós distintos alcançáveis a partir de `roots`, cada filho antes do pai (sem recursão)."""
+    order, seen = [], set()
+    stack = [(root, False) for root in reversed(roots)]
+    while stack:
+        node, expanded = stack.pop()
+        if expanded:
+            order.append(node)
+            continue
+        if node in seen:
+            continue
+        seen.add(node)
+        stack.append((node, True))
+        stack.extend((child, False) for child in reversed(node.args) if child not in seen)
+    return order
+
+def formula_variables(*roots):
+    """Nomes das variáveis das fórmulas, na ordem em que aparecem da esquerda para a direita."""
+    found = {}
+    for node in postorder(list(roots)):
+        if node.op == "var":
+            found.setdefault(node.name, None)
+    return list(found)
+
+def format_formula(root, names=None):
+    """Texto na notação de funções, sem espaços; `names` renomeia variáveis (ex.: forma canônica)."""
+    texts = {}
+    for node in postorder([root]):
+        if node.op == "var":
+            texts[node] = names.get(node.name, node.name) if names else node.name
+        elif node.op == "const":
+            # Não colide com uma variável chamada "True", que o parser aceita.
+            texts[node] = "⊤" if node.name else "⊥"
+        else:
+            texts[node] = f"{node.op}({','.join(texts[child] for child in node.args)})"
+    return texts[root]
+
+def formula_to_z3(root, vars_map, ctx=None):
+    """Expressão Z3 equivalente; `vars_map` guarda as variáveis criadas (nome -> Bool)."""
+    import z3
+
+    exprs = {}
+    for node in postorder([root]):
+        if node.op == "var":
+            if node.name not in vars_map:
+                vars_map[node.name] = z3.Bool(node.name, ctx)
+            exprs[node] = vars_map[node.name]
+        elif node.op == "const":
+            exprs[node] = z3.BoolVal(node.name, ctx)
+        else:
+            args = [exprs[child] for child in node.args]
+            exprs[node] = {"Not": z3.Not, "Implies": z3.Implies, "Or": z3.Or, "And": z3.And}[node.op](*args)
+    return exprs[root]
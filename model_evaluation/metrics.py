@@ -0,0 +1,196 @@
+"""
+Métricas das respostas dos modelos: acurácia com intervalo de confiança bootstrap e matrizes de confusão.
+
+Os modelos vêm das colunas `<modelo>_answer` da tabela de resultados, sem nomes fixos no
+código. Todas as contagens saem de uma única passada vetorizada: cada linha recebe o código
+da sua célula (modelo × regra × tipo de tarefa × resposta correta), as contagens da célula
+mais fina saem de um `np.bincount`, e os recortes mais grossos são somas dessas contagens.
+O bootstrap de uma proporção equivale a sortear Binomial(n, acertos/n), então os intervalos
+de todos os grupos saem de um único sorteio vetorizado, sem reamostrar as linhas.
+
+Uso: python model_evaluation/metrics.py [--table evaluation] [--bootstrap-samples 2000]
+"""
+import argparse
+import math
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from results_store import DEFAULT_STORE_DIR, load_table, save_table, table_columns
+
+# --- CONFIGURAÇÃO DAS MÉTRICAS ---
+ANSWER_SUFFIX = "_answer"
+GOLD_COLUMN = "correct_answer"
+GROUP_COLUMNS = ("rule", "task_type", GOLD_COLUMN)
+NO_ANSWER = "(sem resposta)"
+DEFAULT_BOOTSTRAP_SAMPLES = 2000
+DEFAULT_CONFIDENCE = 0.95
+# Grupos sorteados por vez no bootstrap (limita a matriz grupos × amostras em memória).
+BOOTSTRAP_CHUNK = 4096
+# ---------------------------------
+
+def model_columns(df):
+    """Modelo -> coluna de respostas, para cada coluna `<modelo>_answer` com ao menos uma resposta."""
+    return {col[:-len(ANSWER_SUFFIX)]: col for col in df.columns
+            if col.endswith(ANSWER_SUFFIX) and col != GOLD_COLUMN and df[col].notna().any()}
+
+def metric_columns(columns):
+    """Colunas que as métricas usam, para ler a tabela com projeção."""
+    return [col for col in columns if col in GROUP_COLUMNS or col.endswith(ANSWER_SUFFIX)]
+
+def _normalize_answer(value):
+    # Respostas do Excel misturam "Sim", 1 e 1.0; todas viram texto, e 1.0 vira "1".
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+def _answer_ids(series, vocabulary):
+    """Códigos inteiros das respostas normalizadas (-1 = ausente); a normalização roda uma vez por valor distinto."""
+    codes, uniques = pd.factorize(series)
+    ids = np.array([vocabulary.setdefault(_normalize_answer(v), len(vocabulary)) for v in uniques] + [-1], dtype=np.int64)
+    return ids[codes]  # código -1 (ausente) cai no -1 do final
+
+class _Encoded:
+    """A tabela em códigos inteiros: célula (regra × tipo × resposta correta) de cada linha e respostas de cada modelo."""
+
+    def __init__(self, df, models):
+        self.vocabulary = {}
+        self.gold = _answer_ids(df[GOLD_COLUMN], self.vocabulary)
+        self.predicted = {model: _answer_ids(df[col], self.vocabulary) for model, col in models.items()}
+        self.labels = np.array([*self.vocabulary, None], dtype=object)  # labels[-1] é None (ausente)
+
+        group_codes, self.levels = [], []
+        for col in GROUP_COLUMNS:
+            if col == GOLD_COLUMN:
+                codes, uniques = pd.factorize(self.gold)
+                codes[codes < 0] = len(uniques)
+                uniques = [*self.labels[uniques], None]
+            else:
+                codes, uniques = pd.factorize(df[col], use_na_sentinel=False)
+            group_codes.append(codes)
+            self.levels.append(np.asarray(uniques, dtype=object))
+        self.shape = tuple(len(levels) for levels in self.levels)
+        self.cells = np.ravel_multi_index(group_codes, self.shape) if len(df) else np.zeros(0, dtype=np.int64)
+        self.num_cells = math.prod(self.shape)
+
+def bootstrap_intervals(n, correct, samples=DEFAULT_BOOTSTRAP_SAMPLES, confidence=DEFAULT_CONFIDENCE, seed=0):
+    """Intervalos percentis bootstrap da acurácia `correct/n` de cada grupo (arrays alinhados)."""
+    rng = np.random.default_rng(seed)
+    n, correct = np.asarray(n, dtype=np.int64), np.asarray(correct, dtype=np.int64)
+    alpha = (1 - confidence) / 2
+    low, high = np.full(len(n), np.nan), np.full(len(n), np.nan)
+    for start in range(0, len(n), BOOTSTRAP_CHUNK):
+        block = slice(start, start + BOOTSTRAP_CHUNK)
+        block_n = n[block]
+        valid = block_n > 0
+        draws = rng.binomial(block_n[valid, None], (correct[block][valid] / block_n[valid])[:, None],
+                             size=(int(valid.sum()), samples)) / block_n[valid, None]
+        block_low, block_high = low[block], high[block]
+        block_low[valid], block_high[valid] = np.quantile(draws, [alpha, 1 - alpha], axis=1)
+    return low, high
+
+def _grouping_sets():
+    # Total, cada dimensão sozinha e o cruzamento completo.
+    return [(), *((col,) for col in GROUP_COLUMNS), GROUP_COLUMNS]
+
+def accuracy_table(df, models=None, samples=DEFAULT_BOOTSTRAP_SAMPLES, confidence=DEFAULT_CONFIDENCE, seed=0):
+    """Acurácia por modelo em cada recorte (total, regra, tipo de tarefa, resposta correta e o cruzamento).
+
+    Colunas: model, grouping, rule, task_type, correct_answer, n, answered, correct, accuracy,
+    ci_low, ci_high. Uma resposta ausente conta como erro (e fica fora de `answered`).
+    """
+    models = models if models is not None else model_columns(df)
+    encoded = _Encoded(df, models)
+    n = np.bincount(encoded.cells, minlength=encoded.num_cells)
+
+    per_model = []
+    for model, predicted in encoded.predicted.items():
+        answered = predicted >= 0
+        per_model.append(pd.DataFrame({
+            "model": model,
+            "n": n,
+            "answered": np.bincount(encoded.cells[answered], minlength=encoded.num_cells),
+            "correct": np.bincount(encoded.cells[answered & (predicted == encoded.gold)], minlength=encoded.num_cells),
+        }))
+    counts = pd.concat(per_model, ignore_index=True) if per_model else pd.DataFrame(columns=["model", "n", "answered", "correct"])
+    cell_codes = np.unravel_index(np.tile(np.arange(encoded.num_cells), len(models)), encoded.shape)
+    for col, codes, levels in zip(GROUP_COLUMNS, cell_codes, encoded.levels):
+        counts[col] = levels[codes]
+    counts = counts[counts["n"] > 0]
+
+    tables = []
+    for grouping in _grouping_sets():
+        table = counts.groupby(["model", *grouping], sort=False, dropna=False)[["n", "answered", "correct"]].sum().reset_index()
+        table.insert(1, "grouping", " × ".join(grouping) or "total")
+        tables.append(table)
+    result = pd.concat(tables, ignore_index=True)
+    for col in GROUP_COLUMNS:
+        result[col] = result[col].astype(object).where(result[col].notna(), None)
+    result["accuracy"] = result["correct"] / result["n"]
+    result["ci_low"], result["ci_high"] = bootstrap_intervals(result["n"], result["correct"], samples, confidence, seed)
+    return result[["model", "grouping", *GROUP_COLUMNS, "n", "answered", "correct", "accuracy", "ci_low", "ci_high"]]
+
+def confusion_counts(df, models=None):
+    """Contagens (model, task_type, correct_answer, predicted, count) de todas as matrizes de confusão."""
+    models = models if models is not None else model_columns(df)
+    encoded = _Encoded(df, models)
+    task_codes, task_levels = pd.factorize(df["task_type"], use_na_sentinel=False)
+    num_labels = len(encoded.labels)  # inclui a posição de "ausente" (-1)
+    shape = (len(task_levels), num_labels, num_labels)
+
+    tables = []
+    for model, predicted in encoded.predicted.items():
+        flat = np.ravel_multi_index((task_codes, encoded.gold % num_labels, predicted % num_labels), shape)
+        counts = np.bincount(flat, minlength=math.prod(shape))
+        present = np.flatnonzero(counts)
+        task, gold, answer = np.unravel_index(present, shape)
+        predicted_labels = encoded.labels[answer]
+        predicted_labels[answer == num_labels - 1] = NO_ANSWER
+        tables.append(pd.DataFrame({
+            "model": model,
+            "task_type": np.asarray(task_levels, dtype=object)[task],
+            GOLD_COLUMN: encoded.labels[gold],
+            "predicted": predicted_labels,
+            "count": counts[present],
+        }))
+    if not tables:
+        return pd.DataFrame(columns=["model", "task_type", GOLD_COLUMN, "predicted", "count"])
+    return pd.concat(tables, ignore_index=True)
+
+def confusion_matrix(confusion, model, task_type):
+    """Matriz resposta correta (linhas) × resposta do modelo (colunas) a partir de `confusion_counts`."""
+    subset = confusion[(confusion["model"] == model) & (confusion["task_type"] == task_type)]
+    return subset.pivot_table(index=GOLD_COLUMN, columns="predicted", values="count", aggfunc="sum", fill_value=0)
+
+def main():
+    parser = argparse.ArgumentParser(description="Acurácia, intervalos bootstrap e matrizes de confusão das respostas dos modelos.")
+    parser.add_argument("--table", default="evaluation", help="Tabela de resultados (ver results_store).")
+    parser.add_argument("--store-dir", type=Path, default=DEFAULT_STORE_DIR, help="Pasta das tabelas em Parquet.")
+    parser.add_argument("--bootstrap-samples", type=int, default=DEFAULT_BOOTSTRAP_SAMPLES)
+    parser.add_argument("--confidence", type=float, default=DEFAULT_CONFIDENCE)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output-prefix", default="metrics",
+                        help="As métricas são gravadas nas tabelas '<prefixo>_accuracy' e '<prefixo>_confusion'.")
+    args = parser.parse_args()
+
+    df = load_table(args.table, columns=metric_columns(table_columns(args.table, args.store_dir)), store_dir=args.store_dir)
+    models = model_columns(df)
+    print(f"Tabela '{args.table}': {len(df)} linhas, modelos: {', '.join(models)}.")
+
+    accuracy = accuracy_table(df, models, args.bootstrap_samples, args.confidence, args.seed)
+    confusion = confusion_counts(df, models)
+    save_table(accuracy, f"{args.output_prefix}_accuracy", args.store_dir)
+    save_table(confusion, f"{args.output_prefix}_confusion", args.store_dir)
+
+    summary = accuracy[accuracy["grouping"].isin(["total", "task_type"])]
+    with pd.option_context("display.width", 160, "display.max_columns", None):
+        print(summary[["model", "task_type", "n", "correct", "accuracy", "ci_low", "ci_high"]].to_string(index=False))
+        for model in models:
+            for task_type in sorted(confusion["task_type"].dropna().unique()):
+                print(f"\nMatriz de confusão: {model} / {task_type}")
+                print(confusion_matrix(confusion, model, task_type).to_string())
+    print(f"\nMétricas gravadas nas tabelas '{args.output_prefix}_accuracy' e '{args.output_prefix}_confusion'.")
+
+if __name__ == '__main__':
+    main()
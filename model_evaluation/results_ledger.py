@@ -0,0 +1,120 @@
+"""
+Registro (ledger) em SQLite das respostas brutas dos modelos, no lugar dos JSONL por modelo.
+
+Cada resposta é uma linha com chave (model, task, sample_id, prompt_hash): mudar o prompt de
+uma tarefa invalida só as respostas dela. O banco roda em modo WAL, então vários processos
+podem gravar no mesmo arquivo enquanto outros leem. Cada resposta é gravada numa transação
+própria assim que chega: com WAL e `synchronous=NORMAL` o commit não espera o fsync, e uma
+resposta paga nunca fica só em memória. A retomada consulta as chaves já gravadas em vez
+de reler um arquivo inteiro; `export_jsonl` gera de volta o formato JSONL anterior.
+"""
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import pandas as pd
+
+LEDGER_FILE_NAME = "results_ledger.sqlite"
+# Espera por um lock de escrita de outro processo antes de desistir.
+BUSY_TIMEOUT_MS = 30000
+
+def prompt_hash(prompt):
+    return hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:32]
+
+class ResultsLedger:
+    """Respostas brutas por (modelo, tarefa, sample_id, hash do prompt), gravadas uma a uma."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # Com WAL, NORMAL só arrisca a última transação numa queda de energia, não a integridade.
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS results (
+                model TEXT NOT NULL,
+                task TEXT NOT NULL,
+                sample_id NOT NULL,
+                prompt_hash TEXT NOT NULL,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (model, task, sample_id, prompt_hash)
+            ) WITHOUT ROWID""")
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add(self, model, task, sample_id, prompt_hash_value, response):
+        """Grava uma resposta na hora, numa transação própria."""
+        self._insert([(model, task, sample_id, prompt_hash_value, response, time.time())])
+
+    def _insert(self, rows):
+        with self.lock, self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    def completed_keys(self, model, task):
+        """Conjunto de `(sample_id, prompt_hash)` já gravados, para checagens O(1) na retomada."""
+        rows = self.conn.execute("SELECT sample_id, prompt_hash FROM results WHERE model = ? AND task = ?", (model, task))
+        return set(rows)
+
+    def count(self, model, task):
+        return self.conn.execute("SELECT COUNT(*) FROM results WHERE model = ? AND task = ?", (model, task)).fetchone()[0]
+
+    def results(self, model, task, prompt_hashes=None):
+        """DataFrame `(sample_id, response)` com uma resposta por `sample_id`.
+
+        Com `prompt_hashes` (`{sample_id: hash do prompt atual}`), só entram as respostas ao prompt
+        atual de cada amostra: as de um prompt antigo e as de amostras fora do dicionário ficam de
+        fora. Sem ele, vale a resposta mais recente de cada `sample_id`, seja qual for o prompt.
+        """
+        df = pd.read_sql_query(
+            "SELECT sample_id, prompt_hash, response FROM results WHERE model = ? AND task = ? ORDER BY created_at",
+            self.conn, params=(model, task))
+        if prompt_hashes is not None:
+            df = df[df['prompt_hash'] == df['sample_id'].map(prompt_hashes)]
+        df = df.drop_duplicates('sample_id', keep='last')
+        return df[['sample_id', 'response']].reset_index(drop=True)
+
+    def export_jsonl(self, model, task, path, response_field="response", prompt_hashes=None):
+        """Escreve as respostas de `(model, task)` em JSONL (`sample_id` + `response_field`); devolve o número de linhas.
+
+        `prompt_hashes` filtra as respostas como em `results`.
+        """
+        df = self.results(model, task, prompt_hashes)
+        with open(path, 'w', encoding='utf-8') as f:
+            for sample_id, response in zip(df['sample_id'].tolist(), df['response'].tolist()):
+                f.write(json.dumps({"sample_id": sample_id, response_field: response}, ensure_ascii=False) + '\n')
+        return len(df)
+
+    def import_jsonl(self, model, task, path, prompt_hashes, response_field="response"):
+        """Importa um JSONL no formato de `export_jsonl`, atribuindo a cada linha o hash do prompt atual da sua tarefa.
+
+        Linhas cujo `sample_id` não está em `prompt_hashes` são ignoradas.
+        """
+        rows = []
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    sample_id, response = record['sample_id'], record[response_field]
+                except (json.JSONDecodeError, KeyError, TypeError):
+                    continue
+                if sample_id in prompt_hashes:
+                    rows.append((model, task, sample_id, prompt_hashes[sample_id], response, time.time()))
+        # A importação vai numa única transação.
+        self._insert(rows)
+        logging.info(f"Ledger: {len(rows)} respostas de '{Path(path).name}' importadas para {model}/{task}.")
+        return len(rows)
+
+    def close(self):
+        self.conn.close()
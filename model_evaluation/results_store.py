@@ -0,0 +1,87 @@
+"""
+Tabelas de tarefas e resultados em Parquet, no lugar das idas e voltas pela planilha Excel.
+
+Cada tabela é um arquivo `<nome>.parquet` em `dataframes/`, lido com projeção de colunas
+(`load_table(nome, columns=[...])` só lê do disco as colunas pedidas). Na primeira leitura,
+se o Parquet ainda não existir, a tabela é importada da aba correspondente da planilha; a
+planilha passa a ser só uma exportação opcional para leitura humana (`export_to_excel`).
+"""
+import logging
+import os
+from pathlib import Path
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+PROJECT_ROOT = Path(__file__).parent.parent
+DEFAULT_STORE_DIR = PROJECT_ROOT / "model_evaluation" / "dataframes"
+EXCEL_FILE_NAME = "evaluation_spreadsheet.xlsx"
+
+# Tabela -> aba da planilha de onde ela é importada e para onde é exportada.
+TABLE_SHEETS = {
+    "evaluation": "evaluation_spreadsheet (1)",
+    "z3_evaluation": "Z3_Evaluation",
+}
+
+def table_path(name, store_dir=DEFAULT_STORE_DIR):
+    return Path(store_dir) / f"{name}.parquet"
+
+def _normalize_for_parquet(df):
+    # Colunas lidas do Excel misturam tipos (ex.: "Sim"/"Não" e 0-3 nas respostas), o que o
+    # Arrow não aceita; elas são gravadas como texto, mantendo os valores ausentes.
+    df = df.copy()
+    for col in df.columns[df.dtypes == object]:
+        values = df[col].dropna()
+        if values.map(type).nunique() > 1:
+            df[col] = df[col].map(lambda v: v if pd.isna(v) else str(v)).astype(object)
+    return df
+
+def save_table(df, name, store_dir=DEFAULT_STORE_DIR):
+    """Grava a tabela de forma atômica (arquivo temporário + `os.replace`)."""
+    path = table_path(name, store_dir)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".parquet.tmp")
+    _normalize_for_parquet(df).to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    return path
+
+def import_from_excel(name, excel_path=None, store_dir=DEFAULT_STORE_DIR):
+    """Converte a aba de `name` na planilha para Parquet e devolve o caminho do arquivo."""
+    excel_path = Path(excel_path) if excel_path else Path(store_dir) / EXCEL_FILE_NAME
+    df = pd.read_excel(excel_path, sheet_name=TABLE_SHEETS[name])
+    path = save_table(df, name, store_dir)
+    logging.info(f"Tabela '{name}' importada da aba '{TABLE_SHEETS[name]}' de '{excel_path.name}' ({len(df)} linhas).")
+    return path
+
+def load_table(name, columns=None, store_dir=DEFAULT_STORE_DIR):
+    """Lê a tabela `name`, só com `columns` se dadas; importa da planilha se ainda não houver Parquet.
+
+    Levanta `FileNotFoundError` se não houver nem o Parquet nem a planilha.
+    """
+    path = table_path(name, store_dir)
+    if not path.exists():
+        import_from_excel(name, store_dir=store_dir)
+    return pd.read_parquet(path, columns=columns)
+
+def table_columns(name, store_dir=DEFAULT_STORE_DIR):
+    """Nomes das colunas da tabela, lidos só do esquema do Parquet (para escolher a projeção)."""
+    path = table_path(name, store_dir)
+    if not path.exists():
+        import_from_excel(name, store_dir=store_dir)
+    return pq.read_schema(path).names
+
+def export_to_excel(tables, excel_path=None, store_dir=DEFAULT_STORE_DIR):
+    """Escreve as tabelas (nome -> DataFrame) nas suas abas da planilha, preservando as outras abas."""
+    excel_path = Path(excel_path) if excel_path else Path(store_dir) / EXCEL_FILE_NAME
+    mode, extra = ('a', {"if_sheet_exists": 'replace'}) if excel_path.exists() else ('w', {})
+    with pd.ExcelWriter(excel_path, engine='openpyxl', mode=mode, **extra) as writer:
+        for name, df in tables.items():
+            df.to_excel(writer, sheet_name=TABLE_SHEETS[name], index=False)
+    return excel_path
+
+def add_store_arguments(parser):
+    group = parser.add_argument_group("tabelas de resultados")
+    group.add_argument("--store-dir", type=Path, default=DEFAULT_STORE_DIR, help="Pasta das tabelas em Parquet.")
+    group.add_argument("--export-excel", action="store_true",
+                       help=f"Ao final, exporta as tabelas também para '{EXCEL_FILE_NAME}' (para leitura humana).")
+    return parser
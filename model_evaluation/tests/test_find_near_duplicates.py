@@ -0,0 +1,69 @@
+"""
+Testes da busca de contextos quase duplicados e de distratores que copiam a opção correta.
+
+Rode a partir da raiz do repositório: python -m pytest model_evaluation/tests
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from find_near_duplicates import DISTRACTOR_THRESHOLD, _clauses, near_copy_similarity, near_duplicate_report
+from assembly import SamplesWriter
+
+CORRECT = "A rua fica molhada"
+CONDITIONAL = "Se chove, então a rua fica molhada"
+
+@pytest.mark.parametrize("distractor", [
+    # Negações e ressalvas em frases que o backend simulado não usa, no começo, no meio ou no fim.
+    "Jamais a rua fica molhada",
+    "A rua nunca fica molhada",
+    "Ninguém garante que a rua fica molhada",
+    "A rua fica molhada, o que é incorreto",
+    "Não é o caso que a rua fica molhada",
+    "Não se pode dizer que a rua fica molhada",
+    "Possivelmente a rua fica molhada",
+    "A rua raramente fica molhada",
+    "A rua fica molhada, porém",
+    # Duas negações não se anulam: a contagem é comparada, não a paridade.
+    "É falso que a rua não fica molhada",
+])
+def test_negated_or_hedged_distractors_are_not_copies(distractor):
+    assert near_copy_similarity(CORRECT, distractor) < DISTRACTOR_THRESHOLD
+
+@pytest.mark.parametrize("correct, distractor", [
+    (CORRECT, "a rua fica  molhada!"),
+    ("A rua da escola fica molhada depois da chuva forte", "A rua da escola ficou molhada depois da chuva forte"),
+    (CONDITIONAL, "Se chove então a rua fica molhada."),
+    ("Ana sai ou Bia fica", "Bia fica ou Ana sai"),
+    ("Nunca chove e a rua fica seca", "A rua fica seca e nunca chove"),
+])
+def test_rewordings_are_copies(correct, distractor):
+    assert near_copy_similarity(correct, distractor) >= DISTRACTOR_THRESHOLD
+
+@pytest.mark.parametrize("distractor", [
+    "Se a rua fica molhada, então chove",
+    "Chove e a rua fica molhada",
+    "Se chove, então a rua não fica molhada",
+])
+def test_different_logical_form_is_not_a_copy(distractor):
+    assert near_copy_similarity(CONDITIONAL, distractor) < DISTRACTOR_THRESHOLD
+
+def test_se_inside_a_clause_is_not_a_connective():
+    assert _clauses("Não se pode dizer que chove") == ((), [(1, frozenset(), "se pode dizer que chove")])
+    assert _clauses("Se chove, então talvez molhe")[0] == ("se", "então")
+
+def test_report_flags_repeated_contexts_and_copied_distractors(tmp_path):
+    context = "Se chove, a rua fica molhada. Hoje choveu bastante durante a manhã inteira na cidade."
+    samples = [
+        {"id": 1, "context": context, "options": [CORRECT, "Jamais a rua fica molhada", "a rua fica molhada!"], "answer": 0},
+        {"id": 2, "context": context + " ", "options": [CORRECT, "Talvez a rua fique molhada", "Chove"], "answer": 0},
+    ]
+    with SamplesWriter(tmp_path / "MCQA", "PL/Modus_Ponens") as writer:
+        for sample in samples:
+            writer.write(sample)
+    report = near_duplicate_report(tmp_path)
+    assert sorted(zip(report["kind"], report["sample_id"])) == [("contexto", 2), ("distrator", 1)]
+    assert report.loc[report["kind"] == "distrator", "text"].tolist() == ["a rua fica molhada!"]
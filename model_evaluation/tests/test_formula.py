@@ -0,0 +1,142 @@
+"""
+Testes do parser de fórmulas e checagem diferencial contra o Z3.
+
+Rode a partir da raiz do repositório: python -m pytest model_evaluation/tests
+"""
+import random
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from formula import FormulaSyntaxError, TRUE, apply, format_formula, parse_formula, var
+from truth_table import truth_table_consequence
+from verdict_cache import canonical_form
+from z3_solver import solve_consequence
+
+# --- CONFIGURAÇÃO DA CHECAGEM DIFERENCIAL ---
+NUM_RANDOM_FORMALIZATIONS = 300
+VARIABLE_NAMES = ("p", "q", "r", "s")
+MAX_DEPTH = 3
+# ------------------------------------
+
+@pytest.mark.parametrize("text, expected", [
+    ("Implies(p,Not(q))", "Implies(p,Not(q))"),
+    ("p -> ~q", "Implies(p,Not(q))"),
+    # Argumentos vazios são ignorados, como no parser anterior.
+    ("Or(p,q,)", "Or(p,q)"),
+    ("Or(,p)", "Or(p)"),
+    # `->` associa à direita.
+    ("p -> q -> r", "Implies(p,Implies(q,r))"),
+    ("(p -> q) -> r", "Implies(Implies(p,q),r)"),
+    ("p & q | r", "Or(And(p,q),r)"),
+    ("~p & q", "And(Not(p),q)"),
+    ("And(p -> q, ¬r)", "And(Implies(p,q),Not(r))"),
+])
+def test_parse_formula(text, expected):
+    assert format_formula(parse_formula(text)) == expected
+
+@pytest.mark.parametrize("text, position", [
+    ("(p -> q", 0),
+    ("p -> q)", 6),
+    ("Implies(p, q", 0),
+    ("And(p))", 6),
+    ("p q", 2),
+    ("p ->", 4),
+    ("Not(p, q)", 0),
+    ("Foo(p)", 0),
+    ("p, q", 1),
+    ("", 0),
+])
+def test_parse_formula_rejects_malformed(text, position):
+    with pytest.raises(FormulaSyntaxError) as error:
+        parse_formula(text)
+    assert error.value.position == position
+
+def test_true_is_a_variable_name():
+    # "True" no texto da LLM é uma variável; a constante só vem de valores que não são texto.
+    node = parse_formula("True")
+    assert node is var("True")
+    assert node is not TRUE
+    assert parse_formula(None) is TRUE
+    assert format_formula(TRUE) != format_formula(node)
+    assert not truth_table_consequence({"premises": [], "conclusion": "True"})["is_consequence_logic"]
+    assert not solve_consequence({"premises": [], "conclusion": "True"})["is_consequence_logic"]
+    assert solve_consequence({"premises": ["True"], "conclusion": "True"})["is_consequence_logic"]
+
+def test_equal_subtrees_are_the_same_node():
+    assert parse_formula("Implies(p,q)") is parse_formula("p -> q")
+    assert parse_formula("And(p -> q, q)").args[0] is apply("Implies", var("p"), var("q"))
+
+def _random_formula(rng, depth=MAX_DEPTH):
+    if depth == 0 or rng.random() < 0.3:
+        return var(rng.choice(VARIABLE_NAMES))
+    op = rng.choice(("Not", "Implies", "Or", "And"))
+    arity = {"Not": 1, "Implies": 2}.get(op) or rng.randint(2, 3)
+    return apply(op, *(_random_formula(rng, depth - 1) for _ in range(arity)))
+
+def _infix(node, names=None):
+    """Texto infixo, totalmente entre parênteses, da mesma fórmula (`names` renomeia variáveis).
+
+    `p & q & r` seria lido como `And(And(p,q),r)`; And/Or com três ou mais argumentos ficam na
+    notação de funções, com os argumentos em infixo.
+    """
+    if node.op == "var":
+        return (names or {}).get(node.name, node.name)
+    if node.op == "Not":
+        return f"~{_infix(node.args[0], names)}"
+    if len(node.args) > 2:
+        return f"{node.op}({', '.join(_infix(child, names) for child in node.args)})"
+    symbol = {"Implies": " -> ", "Or": " | ", "And": " & "}[node.op]
+    return "(" + symbol.join(_infix(child, names) for child in node.args) + ")"
+
+def _random_formalizations(seed=0):
+    rng = random.Random(seed)
+    for _ in range(NUM_RANDOM_FORMALIZATIONS):
+        premises = [_random_formula(rng) for _ in range(rng.randint(0, 3))]
+        yield premises, _random_formula(rng)
+
+def test_truth_table_matches_z3():
+    for premises, conclusion in _random_formalizations():
+        formalization = {"premises": [format_formula(p) for p in premises], "conclusion": _infix(conclusion)}
+        assert truth_table_consequence(formalization) == solve_consequence(formalization), formalization
+
+def test_canonical_form_ignores_names_premise_order_and_notation():
+    rng = random.Random(1)
+    for premises, conclusion in _random_formalizations(seed=1):
+        formalization = {"premises": [format_formula(p) for p in premises], "conclusion": format_formula(conclusion)}
+        names = dict(zip(VARIABLE_NAMES, rng.sample(["a", "b", "chove", "rua_molhada"], len(VARIABLE_NAMES))))
+        variant = {"premises": [_infix(p, names) for p in rng.sample(premises, len(premises))],
+                   "conclusion": _infix(conclusion, names)}
+        assert canonical_form(variant) == canonical_form(formalization), (formalization, variant)
+
+def test_symmetric_variables_get_one_canonical_form():
+    # a e b têm a mesma assinatura; trocar os nomes não pode mudar a forma.
+    formalization = {"premises": ["Or(a,b)", "Implies(a,b)", "Implies(b,a)"], "conclusion": "And(a,b)"}
+    swapped = {"premises": ["Implies(a,b)", "Or(b,a)", "Implies(b,a)"], "conclusion": "And(b,a)"}
+    assert canonical_form(swapped) == canonical_form(formalization)
+
+@pytest.mark.parametrize("formalization, renamed", [
+    ({"premises": ["Implies(p,q)", "Not(q)"], "conclusion": "Not(p)"},
+     {"premises": ["~chove", "rua_molhada -> chove"], "conclusion": "~rua_molhada"}),
+    ({"premises": ["Or(p,q)", "Implies(p,r)", "Implies(q,s)"], "conclusion": "Or(r,s)"},
+     {"premises": ["b -> d", "a | b", "a -> c"], "conclusion": "c | d"}),
+    ({"premises": ["Implies(p,q)", "Implies(q,r)"], "conclusion": "Implies(p,r)"},
+     {"premises": ["y -> z", "x -> y"], "conclusion": "x -> z"}),
+])
+def test_canonical_form_ignores_variable_names(formalization, renamed):
+    assert canonical_form(renamed) == canonical_form(formalization)
+
+def test_same_canonical_form_has_same_verdict():
+    # O cache de vereditos só é correto se formas iguais nunca tiverem vereditos diferentes.
+    rng = random.Random(2)
+    verdicts = {}
+    for premises, conclusion in _random_formalizations(seed=2):
+        renaming = dict(zip(VARIABLE_NAMES, rng.sample(["a", "b", "chove", "rua_molhada"], len(VARIABLE_NAMES))))
+        for names in (None, renaming):
+            formalization = {"premises": [format_formula(p, names) for p in rng.sample(premises, len(premises))],
+                             "conclusion": format_formula(conclusion, names)}
+            verdict = solve_consequence(formalization)
+            assert verdicts.setdefault(canonical_form(formalization), verdict) == verdict, formalization
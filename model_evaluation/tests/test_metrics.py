@@ -0,0 +1,68 @@
+"""
+Testes das métricas: acurácia por recorte, intervalos bootstrap e matrizes de confusão.
+
+Rode a partir da raiz do repositório: python -m pytest model_evaluation/tests
+"""
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from metrics import NO_ANSWER, accuracy_table, bootstrap_intervals, confusion_counts, confusion_matrix, model_columns
+
+def _results():
+    return pd.DataFrame({
+        "rule": ["PL/MP", "PL/MP", "PL/MT", "PL/MT", "PL/MT"],
+        "task_type": ["BQA", "BQA", "BQA", "MCQA", "MCQA"],
+        "correct_answer": ["Sim", "Não", "Sim", 2, 3],
+        # Respostas do Excel: 2.0 é a mesma resposta que 2.
+        "gpt_answer": ["Sim", "Sim", "Sim", 2.0, None],
+        "llama_answer": ["Sim", "Não", "Não", 1, 3],
+        "vazio_answer": [None] * 5,
+    })
+
+def _row(table, model, grouping, **values):
+    rows = table[(table["model"] == model) & (table["grouping"] == grouping)]
+    for col, value in values.items():
+        rows = rows[rows[col] == value]
+    assert len(rows) == 1
+    return rows.iloc[0]
+
+def test_model_columns_skip_gold_and_empty_columns():
+    assert model_columns(_results()) == {"gpt": "gpt_answer", "llama": "llama_answer"}
+
+def test_accuracy_table_counts_each_grouping():
+    table = accuracy_table(_results(), samples=200)
+    total = _row(table, "gpt", "total")
+    assert (total["n"], total["answered"], total["correct"]) == (5, 4, 3)
+    assert total["accuracy"] == pytest.approx(0.6)
+    assert _row(table, "llama", "rule", rule="PL/MT")["correct"] == 1
+    assert _row(table, "gpt", "task_type", task_type="MCQA")["correct"] == 1
+    cell = _row(table, "llama", "rule × task_type × correct_answer", rule="PL/MP", task_type="BQA", correct_answer="Não")
+    assert (cell["n"], cell["correct"]) == (1, 1)
+    assert (table["ci_low"] <= table["accuracy"]).all() and (table["accuracy"] <= table["ci_high"]).all()
+
+def test_bootstrap_intervals_are_reproducible_and_narrow_with_n():
+    low, high = bootstrap_intervals([10, 1000, 0], [7, 700, 0], samples=1000)
+    again = bootstrap_intervals([10, 1000, 0], [7, 700, 0], samples=1000)
+    assert np.array_equal(low, again[0], equal_nan=True)
+    assert low[0] < 0.7 < high[0]
+    assert high[1] - low[1] < high[0] - low[0]
+    assert np.isnan(low[2]) and np.isnan(high[2])
+
+def test_perfect_accuracy_has_a_degenerate_interval():
+    low, high = bootstrap_intervals([50], [50])
+    assert low[0] == high[0] == 1.0
+
+def test_confusion_counts_include_missing_answers():
+    confusion = confusion_counts(_results())
+    gpt_mcqa = confusion_matrix(confusion, "gpt", "MCQA")
+    assert gpt_mcqa.loc["2", "2"] == 1
+    assert gpt_mcqa.loc["3", NO_ANSWER] == 1
+    llama_bqa = confusion_matrix(confusion, "llama", "BQA")
+    assert llama_bqa.loc["Sim", "Não"] == 1 and llama_bqa.loc["Sim", "Sim"] == 1
+    assert confusion["count"].sum() == 2 * len(_results())
@@ -0,0 +1,61 @@
+"""
+Testes do ledger SQLite das respostas brutas dos modelos.
+
+Rode a partir da raiz do repositório: python -m pytest model_evaluation/tests
+"""
+import json
+import sqlite3
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from results_ledger import ResultsLedger, prompt_hash
+
+MODEL, TASK = "gemini-2.5-flash", "z3"
+
+def test_each_response_is_on_disk_as_soon_as_it_is_added(tmp_path):
+    path = tmp_path / "ledger.sqlite"
+    ledger = ResultsLedger(path)
+    ledger.add(MODEL, TASK, 1, prompt_hash("prompt 1"), "resposta")
+    # Outra conexão (outro processo, ou esta depois de uma queda) já enxerga a resposta.
+    other = sqlite3.connect(path)
+    assert other.execute("SELECT sample_id, response FROM results").fetchall() == [(1, "resposta")]
+    other.close()
+    ledger.close()
+
+def test_completed_keys_include_the_prompt_hash(tmp_path):
+    with ResultsLedger(tmp_path / "ledger.sqlite") as ledger:
+        ledger.add(MODEL, TASK, 1, prompt_hash("antigo"), "a")
+        assert ledger.completed_keys(MODEL, TASK) == {(1, prompt_hash("antigo"))}
+        assert (1, prompt_hash("novo")) not in ledger.completed_keys(MODEL, TASK)
+        assert ledger.count(MODEL, TASK) == 1 and ledger.count("outro", TASK) == 0
+
+def test_results_keep_only_answers_to_the_current_prompts(tmp_path):
+    with ResultsLedger(tmp_path / "ledger.sqlite") as ledger:
+        ledger.add(MODEL, TASK, 1, prompt_hash("prompt 1"), "resposta atual")
+        # A resposta mais recente de 1 é a de um prompt que já mudou.
+        ledger.add(MODEL, TASK, 1, prompt_hash("prompt 1 antigo"), "resposta antiga")
+        ledger.add(MODEL, TASK, 2, prompt_hash("prompt 2 antigo"), "só antiga")
+        ledger.add(MODEL, TASK, 3, prompt_hash("prompt 3"), "fora da tabela")
+
+        current = {1: prompt_hash("prompt 1"), 2: prompt_hash("prompt 2")}
+        df = ledger.results(MODEL, TASK, current)
+        assert df.to_dict("records") == [{"sample_id": 1, "response": "resposta atual"}]
+        # Sem os hashes, vale a resposta mais recente de cada amostra.
+        assert dict(ledger.results(MODEL, TASK).itertuples(index=False)) == {
+            1: "resposta antiga", 2: "só antiga", 3: "fora da tabela"}
+
+def test_export_and_import_round_trip(tmp_path):
+    hashes = {1: prompt_hash("p1"), 2: prompt_hash("p2")}
+    with ResultsLedger(tmp_path / "a.sqlite") as ledger:
+        for sample_id, hash_value in hashes.items():
+            ledger.add(MODEL, TASK, sample_id, hash_value, f"r{sample_id}")
+        assert ledger.export_jsonl(MODEL, TASK, tmp_path / "r.jsonl", response_field="llm_formalization") == 2
+    lines = [json.loads(line) for line in (tmp_path / "r.jsonl").read_text(encoding="utf-8").splitlines()]
+    assert lines == [{"sample_id": 1, "llm_formalization": "r1"}, {"sample_id": 2, "llm_formalization": "r2"}]
+
+    with ResultsLedger(tmp_path / "b.sqlite") as ledger:
+        # Só as amostras da tabela atual entram, com o hash do prompt atual.
+        assert ledger.import_jsonl(MODEL, TASK, tmp_path / "r.jsonl", {1: hashes[1]}, response_field="llm_formalization") == 1
+        assert ledger.completed_keys(MODEL, TASK) == {(1, hashes[1])}
@@ -0,0 +1,62 @@
+"""
+Testes da verificação simbólica dos rótulos: templates do config e amostras geradas.
+
+Rode a partir da raiz do repositório: python -m pytest model_evaluation/tests
+"""
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from verify_labels import COMPILED_RULES, verification_report
+from assembly import SamplesWriter
+from templates import CompiledRule, capitalize_first
+
+RULE_KEY = "PL/Modus_Ponens"
+BANK = {"p": "chove", "q": "a rua fica molhada", "not q": "a rua não fica molhada"}
+DISTRACTORS = ["Não chove", "A rua não fica molhada", "Chove granizo"]
+
+def _write_instance(base_dir, bqa_answers=None, mcqa_answer_offset=0):
+    """Grava uma instância BQA e a MCQA de mesmo id, como as Etapas 3 e 4; permite estragar os rótulos."""
+    rule = COMPILED_RULES[RULE_KEY]
+    qa_pairs = [{"question": capitalize_first(variants[0].render(BANK)), "answer": answer}
+                for variants, answer in rule.bqa_questions]
+    for pair, answer in zip(qa_pairs, bqa_answers or []):
+        pair["answer"] = answer
+    options = [capitalize_first(rule.mcqa_correct_conclusion.render(BANK)), *DISTRACTORS]
+    samples = {"BQA": {"id": 1, "context": "Se chove, a rua fica molhada. Choveu.", "qa_pairs": qa_pairs},
+               "MCQA": {"id": 1, "context": "Se chove, a rua fica molhada. Choveu.", "options": options,
+                        "answer": mcqa_answer_offset}}
+    for task, sample in samples.items():
+        writer = SamplesWriter(base_dir / task, RULE_KEY, "jsonl")
+        writer.write(sample)
+        writer.close()
+
+def _problems(report):
+    return report[report["status"] != "ok"]
+
+def test_configured_templates_are_consistent():
+    report = verification_report(include_datasets=False)
+    assert len(report) and _problems(report).empty, _problems(report).to_dict("records")
+
+def test_wrong_template_answer_is_flagged():
+    template = dict(COMPILED_RULES[RULE_KEY].template)
+    template["bqa_templates"] = [{**template["bqa_templates"][0], "answer": "Não"}, *template["bqa_templates"][1:]]
+    report = verification_report(include_datasets=False, compiled_rules={RULE_KEY: CompiledRule(RULE_KEY, template)})
+    problems = _problems(report)
+    assert list(problems["item"]) == ["bqa[0][0]", "bqa[0][1]"]
+    assert set(problems["status"]) == {"divergente"}
+
+def test_correct_dataset_has_no_problems(tmp_path):
+    _write_instance(tmp_path)
+    report = verification_report(base_dir=tmp_path, compiled_rules={RULE_KEY: COMPILED_RULES[RULE_KEY]})
+    assert set(report["source"]) == {"config", "BQA", "MCQA"}
+    assert _problems(report).empty
+
+def test_wrong_dataset_labels_are_flagged(tmp_path):
+    _write_instance(tmp_path, bqa_answers=["Não"], mcqa_answer_offset=1)
+    report = verification_report(base_dir=tmp_path, compiled_rules={RULE_KEY: COMPILED_RULES[RULE_KEY]})
+    problems = _problems(report).set_index("source")
+    assert problems.loc["BQA", "status"] == "divergente"
+    assert problems.loc["BQA", "item"] == "bqa[0][0]"
+    assert problems.loc["MCQA", "status"] == "resposta aponta para a opção errada"
@@ -0,0 +1,115 @@
+"""
+Decisão de consequência lógica por tabela-verdade vetorizada, como atalho antes do Z3.
+
+As formalizações têm poucas variáveis, então enumerar as 2^k valorações de uma vez com
+arrays booleanos do NumPy sai bem mais barato que montar um `Solver`. Fórmulas com mais de
+`MAX_VARIABLES` variáveis, ou com erro de sintaxe, levantam `UnsupportedFormula` e ficam
+para o Z3 (que reporta o erro).
+"""
+import numpy as np
+
+from formula import parse_formula, formula_variables, postorder
+
+# 2^20 valorações ocupam ~1 MB por variável em arrays booleanos.
+MAX_VARIABLES = 20
+
+class UnsupportedFormula(ValueError):
+    """A formalização não pode ser decidida pela tabela-verdade; use o Z3."""
+
+_assignment_tables = {}
+
+def assignment_table(num_variables):
+    """Matriz (k, 2^k) com todas as valorações de k variáveis; reaproveitada entre chamadas."""
+    table = _assignment_tables.get(num_variables)
+    if table is None:
+        rows = np.arange(2 ** num_variables, dtype=np.uint32)
+        table = np.array([(rows >> i) & 1 for i in range(num_variables)], dtype=bool).reshape(num_variables, -1)
+        table.setflags(write=False)
+        _assignment_tables[num_variables] = table
+    return table
+
+def _evaluate(roots, columns, num_rows):
+    # Com hash-consing, subárvores repetidas (ex.: a mesma premissa duas vezes) são o mesmo nó
+    # e são avaliadas uma única vez.
+    values = {}
+    for node in postorder(roots):
+        if node.op == "var":
+            values[node] = columns[node.name]
+        elif node.op == "const":
+            values[node] = np.full(num_rows, node.name, dtype=bool)
+        else:
+            args = [values[child] for child in node.args]
+            if node.op == "Not":
+                values[node] = ~args[0]
+            elif node.op == "Implies":
+                values[node] = ~args[0] | args[1]
+            elif node.op == "Or":
+                values[node] = np.logical_or.reduce(args)
+            else:
+                values[node] = np.logical_and.reduce(args)
+    return [values[root] for root in roots]
+
+def _parse_all(premises, conclusions):
+    try:
+        return [parse_formula(p) for p in premises], [parse_formula(c) for c in conclusions]
+    except (ValueError, TypeError) as e:
+        raise UnsupportedFormula(str(e)) from e
+
+def truth_table_entailments(premises, conclusions):
+    """Para cada conclusão, o resultado de `truth_table_consequence` sobre as mesmas premissas.
+
+    As premissas são avaliadas uma única vez; cada conclusão custa só a sua própria subárvore.
+    """
+    premises, conclusions = _parse_all(premises, conclusions)
+    variables = formula_variables(*premises, *conclusions)
+    if len(variables) > MAX_VARIABLES:
+        raise UnsupportedFormula(f"{len(variables)} variáveis excedem o limite de {MAX_VARIABLES}.")
+
+    table = assignment_table(len(variables))
+    columns = dict(zip(variables, table))
+    values = _evaluate([*premises, *conclusions], columns, 2 ** len(variables))
+    premises_hold = np.logical_and.reduce(values[:len(premises)]) if premises else np.ones(2 ** len(variables), dtype=bool)
+
+    results = []
+    for conclusion_value in values[len(premises):]:
+        result = "sat" if (premises_hold & ~conclusion_value).any() else "unsat"
+        results.append({"z3_result_of_negation": result, "is_consequence_logic": result == "unsat"})
+    return results
+
+def truth_table_consequence(formalization_dict):
+    """Mesmo resultado de `evaluate_z3_consequence`, calculado pela tabela-verdade.
+
+    `z3_result_of_negation` é "sat" se alguma valoração satisfaz as premissas e falsifica a
+    conclusão, e "unsat" caso contrário (a conclusão é consequência lógica).
+    """
+    if not isinstance(formalization_dict, dict):
+        raise UnsupportedFormula("Formalização não é um objeto JSON.")
+    try:
+        premises = list(formalization_dict.get('premises', []))
+    except TypeError as e:
+        raise UnsupportedFormula(str(e)) from e
+    return truth_table_entailments(premises, [formalization_dict.get('conclusion', 'True')])[0]
+
+def truth_table_consequences(formalization_dicts):
+    """Avalia um lote; a posição de cada formalização não suportada recebe None (para o Z3).
+
+    Formalizações idênticas são decididas uma única vez.
+    """
+    results, seen = [], {}
+    for formalization_dict in formalization_dicts:
+        try:
+            key = (tuple(formalization_dict.get('premises', [])), formalization_dict.get('conclusion', 'True'))
+            hash(key)
+        except (AttributeError, TypeError):
+            key = None
+        if key is not None and key in seen:
+            results.append(seen[key])
+            continue
+        try:
+            result = truth_table_consequence(formalization_dict)
+        except UnsupportedFormula:
+            result = None
+        if key is not None:
+            seen[key] = result
+        results.append(result)
+    return results
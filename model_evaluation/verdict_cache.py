@@ -0,0 +1,133 @@
+"""
+Cache dos vereditos Z3, endereçado pela forma canônica da formalização.
+
+As formalizações das LLMs repetem poucas formas, como `Implies(p,q)`, `Not(q)` ⊢ `Not(p)`,
+às vezes com outras letras, outra ordem de premissas, outros espaços ou em notação infixa.
+A forma canônica elimina essas diferenças, e o veredito de uma forma já vista é devolvido
+sem chamar o Solver.
+"""
+import itertools
+import json
+import logging
+import math
+import sqlite3
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from formula import format_formula, formula_variables, parse_formula
+
+PROJECT_ROOT = Path(__file__).parent.parent
+DEFAULT_VERDICT_CACHE_PATH = PROJECT_ROOT / ".llm_cache" / "z3_verdicts.sqlite"
+# Numerações testadas por formalização; variáveis indistinguíveis além disso ficam na ordem dos nomes.
+MAX_CANONICAL_RENAMINGS = 5040
+
+def _variable_invariants(premises, conclusion):
+    """Variável -> assinatura que não depende do nome: onde ela ocorre (premissa ou conclusão, o
+    formato da fórmula sem os nomes e o caminho até a ocorrência)."""
+    occurrences = defaultdict(list)
+    for role, root in [*(("premissa", p) for p in premises), ("conclusão", conclusion)]:
+        shape = format_formula(root, dict.fromkeys(formula_variables(root), "_"))
+        stack = [(root, ())]
+        while stack:
+            node, path = stack.pop()
+            if node.op == "var":
+                occurrences[node.name].append((role, shape, path))
+            elif node.op != "const":
+                stack.extend((child, (*path, (node.op, i))) for i, child in enumerate(node.args))
+    return {name: tuple(sorted(found)) for name, found in occurrences.items()}
+
+def _candidate_renamings(premises, conclusion):
+    """Numerações v0, v1, ... que respeitam a ordem das assinaturas; só variáveis de mesma assinatura trocam de lugar."""
+    invariants = _variable_invariants(premises, conclusion)
+    classes = defaultdict(list)
+    for name in sorted(invariants, key=invariants.get):
+        classes[invariants[name]].append(name)
+    classes = list(classes.values())
+    if math.prod(math.factorial(len(names)) for names in classes) > MAX_CANONICAL_RENAMINGS:
+        # Forma ainda correta, mas não canônica: dependendo dos nomes originais, só custa um miss.
+        classes = [[name] for names in classes for name in sorted(names)]
+    for ordering in itertools.product(*(itertools.permutations(names) for names in classes)):
+        yield {name: f"v{i}" for i, name in enumerate(itertools.chain.from_iterable(ordering))}
+
+def canonical_form(formalization_dict):
+    """Forma canônica `(premissas, conclusão)` de uma formalização; None se ela não puder ser analisada.
+
+    Cada fórmula passa pelo parser (o que já elimina espaços e unifica as notações infixa e de
+    funções) e as premissas repetidas se juntam. As variáveis são ordenadas por uma assinatura
+    que não depende do nome (ver `_variable_invariants`) e numeradas v0, v1, ...; entre as
+    numerações possíveis quando há empate de assinatura, vale a de menor texto, com as premissas
+    ordenadas. Assim a forma não depende dos nomes nem da ordem das premissas, e duas
+    formalizações com a mesma forma canônica têm o mesmo veredito.
+    """
+    if not isinstance(formalization_dict, dict):
+        return None
+    try:
+        premises = {parse_formula(p) for p in formalization_dict.get('premises', [])}
+        conclusion = parse_formula(formalization_dict.get('conclusion', 'True'))
+    except (ValueError, TypeError):
+        return None
+
+    return min((tuple(sorted(format_formula(p, names) for p in premises)), format_formula(conclusion, names))
+               for names in _candidate_renamings(premises, conclusion))
+
+class VerdictCache:
+    """Vereditos por forma canônica, em memória e, se `path` for dado, também em SQLite."""
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path else None
+        self.memory = {}
+        self.hits = 0
+        self.misses = 0
+        self.conn = None
+        if self.path:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.conn = sqlite3.connect(self.path, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS verdicts (
+                    canonical TEXT PRIMARY KEY,
+                    verdict TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )""")
+            self.conn.commit()
+
+    @staticmethod
+    def _key(canonical):
+        return json.dumps(canonical, ensure_ascii=False)
+
+    def get(self, canonical):
+        key = self._key(canonical)
+        verdict = self.memory.get(key)
+        if verdict is None and self.conn is not None:
+            row = self.conn.execute("SELECT verdict FROM verdicts WHERE canonical = ?", (key,)).fetchone()
+            if row is not None:
+                verdict = self.memory[key] = json.loads(row[0])
+        if verdict is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return verdict
+
+    def put(self, canonical, verdict):
+        key = self._key(canonical)
+        self.memory[key] = verdict
+        if self.conn is not None:
+            self.conn.execute("INSERT OR REPLACE INTO verdicts VALUES (?, ?, ?)",
+                              (key, json.dumps(verdict), time.time()))
+            self.conn.commit()
+
+    def log_stats(self):
+        total = self.hits + self.misses
+        if total:
+            logging.info(f"Cache de vereditos Z3: {self.hits}/{total} acertos ({len(self.memory)} formas distintas).")
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+
+def add_verdict_cache_arguments(parser):
+    group = parser.add_argument_group("cache de vereditos Z3")
+    group.add_argument("--no-verdict-cache", action="store_true", help="Não grava os vereditos Z3 em disco (o cache em memória continua ativo).")
+    group.add_argument("--verdict-cache-path", type=Path, default=DEFAULT_VERDICT_CACHE_PATH, help="Arquivo SQLite dos vereditos.")
+    return parser
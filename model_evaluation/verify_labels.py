@@ -0,0 +1,386 @@
+"""
+Verificação simbólica dos rótulos do dataset: templates do `config.py` e arquivos gerados.
+
+Os templates de cada regra são compilados em fórmulas proposicionais: `{p}` vira a variável
+`p`, `{not p}` vira `Not(p)`, "Se A, então B" vira `Implies(A, B)` e "A ou B"/"A e B" viram
+`Or`/`And`. As frases do contexto são as premissas; cada pergunta BQA e a
+`mcqa_correct_conclusion` são conclusões. "Sim" exige consequência lógica e "Não" exige que
+ela falte. Os vereditos saem em lote, pela tabela-verdade e, se preciso, pelo Z3 com as
+premissas declaradas uma vez por contexto.
+
+Nos arquivos de `output/LogicBench(Eval)`, cada pergunta é alinhada ao seu template (na
+ordem do config) e as sentenças capturadas viram a valoração da amostra: placeholders com o
+mesmo texto passam a ser a mesma variável. Amostras com a mesma estrutura compartilham um
+único veredito, então a varredura do dataset inteiro é uma passada de regex mais poucas
+chamadas ao verificador.
+
+Uso: python model_evaluation/verify_labels.py [--skip-datasets] [--output relatorio.json]
+"""
+import argparse
+import logging
+import re
+import sys
+from pathlib import Path
+from string import Formatter
+
+import pandas as pd
+
+PROJECT_ROOT = Path(__file__).parent.parent
+DATASET_GENERATION_SRC_PATH = PROJECT_ROOT / 'dataset_generation' / 'src'
+sys.path.append(str(DATASET_GENERATION_SRC_PATH))
+
+from config import COMPILED_RULES
+from templates import NEGATION_PREFIX, capitalize_first
+from assembly import read_samples, rule_key_from_path
+from formula import apply, format_formula, var
+from truth_table import UnsupportedFormula, truth_table_entailments
+from z3_solver import solve_entailment_batches
+
+# --- CONFIGURAÇÃO DA VERIFICAÇÃO ---
+DATASETS_DIR = PROJECT_ROOT / "dataset_generation" / "output" / "LogicBench(Eval)"
+# Aberturas de frase que só afirmam o que vem depois ("Sabe-se que X" = X).
+ASSERTION_PREFIXES = ("Naquele dia, porém, sabe-se que ", "Também se sabe que ", "Sabe-se que ")
+CONDITIONAL_PATTERN = re.compile(r"^Se (.+?), então (.+)$")
+# Perguntas BQA: "Isso implica que 'X'?" pergunta por X; "Se A, isso significa que B?" por A → B.
+QUESTION_PATTERNS = (
+    (re.compile(r"^(?:Isso implica|Podemos inferir) que '(.+)'\?$"), lambda m: (m.group(1),)),
+    (re.compile(r"^Se (.+?), isso significa que (.+)\?$"), lambda m: (m.group(1), m.group(2))),
+)
+# Pergunta de cláusulas: "pelo menos um dos seguintes" é a disjunção das cláusulas.
+AT_LEAST_ONE_PREFIX = "Podemos dizer que pelo menos um dos seguintes deve ser sempre verdadeiro? "
+CLAUSE_LABEL = re.compile(r"^\([a-z]\) ")
+PLACEHOLDER = re.compile(r"^\{([^{}]+)\}$")
+ANSWERS = {"Sim": True, "Não": False}
+# ------------------------------------
+
+class TemplateFormulaError(ValueError):
+    """Trecho de template que não corresponde a nenhuma construção conhecida."""
+
+def _atom(text):
+    match = PLACEHOLDER.match(text.strip())
+    if not match:
+        raise TemplateFormulaError(f"Trecho não reconhecido: '{text.strip()}'")
+    name = match.group(1)
+    if name.startswith(NEGATION_PREFIX):
+        return apply("Not", var(name[len(NEGATION_PREFIX):]))
+    return var(name)
+
+def compile_expression(text):
+    """Fórmula de um trecho de template: condicional, disjunção, conjunção ou placeholder."""
+    text = text.strip().removesuffix('.')
+    conditional = CONDITIONAL_PATTERN.match(text)
+    if conditional:
+        return apply("Implies", compile_expression(conditional.group(1)), compile_expression(conditional.group(2)))
+    for separator, op in ((" ou ", "Or"), (" e ", "And")):
+        if separator in text:
+            return apply(op, *(compile_expression(part) for part in text.split(separator)))
+    return _atom(text)
+
+def compile_context(template_context):
+    """Premissas do `template_context`, uma por frase."""
+    premises = []
+    for sentence in re.split(r"\.\s+", template_context.strip().removesuffix('.')):
+        for prefix in ASSERTION_PREFIXES:
+            if sentence.startswith(prefix):
+                sentence = sentence[len(prefix):]
+                break
+        premises.append(compile_expression(sentence))
+    return premises
+
+def compile_question(template):
+    """Conclusão perguntada por uma variante de pergunta BQA (texto ou `{"prefix", "clauses"}`)."""
+    if isinstance(template, dict):
+        if template["prefix"] != AT_LEAST_ONE_PREFIX:
+            raise TemplateFormulaError(f"Prefixo de pergunta não reconhecido: '{template['prefix']}'")
+        return apply("Or", *(compile_expression(CLAUSE_LABEL.sub("", clause)) for clause in template["clauses"]))
+    for pattern, parts in QUESTION_PATTERNS:
+        match = pattern.match(template)
+        if match:
+            formulas = [compile_expression(part) for part in parts(match)]
+            return formulas[0] if len(formulas) == 1 else apply("Implies", *formulas)
+    raise TemplateFormulaError(f"Pergunta não reconhecida: '{template}'")
+
+def _render_pattern(template):
+    """Regex que reconhece um template renderizado e captura o texto de cada placeholder."""
+    parts, groups = [], {}
+    for literal, field, _, _ in Formatter().parse(template):
+        parts.append(re.escape(literal))
+        if field is not None:
+            if field in groups:
+                parts.append(f"(?P={groups[field]})")
+            else:
+                groups[field] = f"f{len(groups)}"
+                parts.append(f"(?P<{groups[field]}>.+?)")
+    pattern = re.compile("^" + "".join(parts) + "$", re.DOTALL)
+    return pattern, {group: field for field, group in groups.items()}
+
+class _Matcher:
+    """Reconhece o texto renderizado de um template e devolve `{placeholder: texto}` (ou None)."""
+
+    def __init__(self, template):
+        if isinstance(template, dict):
+            # Mesmo texto de `ClauseQuestionRenderer.render`: prefixo + cláusulas unidas por " e " + "?".
+            template = template["prefix"] + " e ".join(template["clauses"]) + "?"
+        self.pattern, self.fields = _render_pattern(template)
+        # O texto renderizado passa por `capitalize_first`; se o template começa num placeholder, a
+        # primeira letra capturada volta a ser minúscula, como no banco normalizado.
+        self.starts_with_field = template.startswith("{")
+
+    def match(self, text):
+        if self.starts_with_field and text:
+            text = text[0].lower() + text[1:]
+        match = self.pattern.match(text)
+        if not match:
+            return None
+        return {self.fields[group]: value for group, value in match.groupdict().items()}
+
+class RuleFormulas:
+    """Fórmulas de uma regra: premissas, conclusão de cada variante de pergunta e conclusão MCQA."""
+
+    def __init__(self, rule):
+        template = rule.template
+        self.rule_key = rule.rule_key
+        self.premises = compile_context(template["template_context"])
+        self.questions = [([(compile_question(v), _Matcher(v)) for v in q["question"]], q["answer"])
+                          for q in template.get("bqa_templates", [])]
+        conclusion = template.get("mcqa_correct_conclusion")
+        self.conclusion = None
+        if conclusion is not None:
+            self.conclusion = (compile_expression(conclusion), _Matcher(conclusion))
+        self.conclusion_renderer = rule.mcqa_correct_conclusion
+        self._texts = {}
+
+    def texts(self, mapping=None):
+        """Fórmulas em texto (premissas, perguntas por variante, conclusão MCQA) após `mapping` (variável -> nó).
+
+        Quase todas as amostras têm o mesmo `mapping` (vazio), então o texto sai do cache.
+        """
+        key = tuple(sorted((name, node.name) for name, node in (mapping or {}).items()))
+        if key not in self._texts:
+            mapping = mapping or {}
+            self._texts[key] = {
+                "premises": tuple(format_formula(_substitute(p, mapping)) for p in self.premises),
+                "questions": [[format_formula(_substitute(conclusion, mapping)) for conclusion, _ in variants]
+                              for variants, _ in self.questions],
+                "conclusion": format_formula(_substitute(self.conclusion[0], mapping)) if self.conclusion else None,
+            }
+        return self._texts[key]
+
+def _substitute(node, mapping):
+    if node.op == "var":
+        return mapping.get(node.name, node)
+    if node.op == "const":
+        return node
+    return apply(node.op, *(_substitute(child, mapping) for child in node.args))
+
+def _identify_equal_sentences(binding):
+    """Variável -> variável canônica: placeholders (base) com o mesmo texto viram a mesma variável."""
+    canonical, by_text = {}, {}
+    for field in sorted(binding):
+        if field.startswith(NEGATION_PREFIX):
+            continue
+        text = binding[field].strip().casefold()
+        canonical[field] = var(by_text.setdefault(text, field))
+    return {name: node for name, node in canonical.items() if node.name != name}
+
+def entailment_verdicts(contexts):
+    """`contexts`: lista de `(premissas, conclusões)` em texto; devolve um bool (ou None se indecidível) por conclusão.
+
+    A tabela-verdade decide o que conseguir; o resto vai em lote para o Z3.
+    """
+    results, for_z3 = [None] * len(contexts), []
+    for index, (premises, conclusions) in enumerate(contexts):
+        try:
+            results[index] = [r["is_consequence_logic"] for r in truth_table_entailments(premises, conclusions)]
+        except UnsupportedFormula:
+            for_z3.append(index)
+    z3_results = solve_entailment_batches([contexts[index] for index in for_z3])
+    for index, verdicts in zip(for_z3, z3_results):
+        results[index] = [r["is_consequence_logic"] if r["z3_result_of_negation"] in ("sat", "unsat") else None
+                          for r in verdicts]
+    return results
+
+class _VerdictBatch:
+    """Junta as checagens `(premissas, conclusão)` e decide cada combinação distinta uma única vez."""
+
+    def __init__(self):
+        self.contexts = {}  # premissas (texto) -> {conclusão (texto): índice}
+        self.checks = []    # (premissas, conclusão, linha do relatório)
+
+    def add(self, premises, conclusion, row):
+        """`premises` (tupla) e `conclusion` em texto, como em `RuleFormulas.texts`."""
+        self.contexts.setdefault(premises, {}).setdefault(conclusion, None)
+        self.checks.append((premises, conclusion, row))
+
+    def resolve(self):
+        """Preenche `entailed` (True/False/None) em cada linha e devolve as linhas."""
+        keys = list(self.contexts)
+        verdicts = entailment_verdicts([(list(premises), list(self.contexts[premises])) for premises in keys])
+        for premises, context_verdicts in zip(keys, verdicts):
+            self.contexts[premises] = dict(zip(self.contexts[premises], context_verdicts))
+        rows = []
+        for premises, conclusion, row in self.checks:
+            row["entailed"] = self.contexts[premises][conclusion]
+            rows.append(row)
+        return rows
+
+def _label_status(row):
+    if row.get("status"):
+        return row["status"]
+    if row["entailed"] is None:
+        return "indecidível"
+    if row["expected"] is None:
+        return "ok" if row["entailed"] else "divergente"
+    return "ok" if ANSWERS.get(row["expected"]) == row["entailed"] else "divergente"
+
+def _row(source, rule_key, item, expected, sample_id=None, text=None, status=None):
+    return {"source": source, "rule": rule_key, "sample_id": sample_id, "item": item,
+            "text": text, "expected": expected, "status": status}
+
+def verify_config(compiled_rules=COMPILED_RULES, batch=None):
+    """Checa os rótulos dos templates; devolve `(fórmulas por regra, linhas sem veredito ainda)`."""
+    batch = batch if batch is not None else _VerdictBatch()
+    formulas, rows = {}, []
+    for rule_key, rule in compiled_rules.items():
+        try:
+            formulas[rule_key] = rule_formulas = RuleFormulas(rule)
+        except TemplateFormulaError as e:
+            rows.append(_row("config", rule_key, "template", None, text=str(e), status="não compilado"))
+            continue
+        texts = rule_formulas.texts()
+        for q_index, (variants, answer) in enumerate(rule_formulas.questions):
+            for v_index, conclusion in enumerate(texts["questions"][q_index]):
+                batch.add(texts["premises"], conclusion,
+                          _row("config", rule_key, f"bqa[{q_index}][{v_index}]", answer, text=conclusion))
+        if texts["conclusion"] is not None:
+            batch.add(texts["premises"], texts["conclusion"],
+                      _row("config", rule_key, "mcqa_correct_conclusion", None, text=texts["conclusion"]))
+    return formulas, rows
+
+def _check_bqa_sample(rule_formulas, sample, batch, rows, source, bindings):
+    rule_key, sample_id = rule_formulas.rule_key, sample.get("id")
+    binding, matched, cursor = {}, [], 0
+    for pair in sample.get("qa_pairs", []):
+        question = pair.get("question", "")
+        # As perguntas saem na ordem do config (as que faltaram chave são puladas), então a busca
+        # avança a partir da última pergunta reconhecida; variantes de mesmo texto se distinguem assim.
+        for q_index in range(cursor, len(rule_formulas.questions)):
+            found = next(((v_index, conclusion, captured)
+                          for v_index, (conclusion, matcher) in enumerate(rule_formulas.questions[q_index][0])
+                          if (captured := matcher.match(question)) is not None), None)
+            if found:
+                cursor = q_index + 1
+                matched.append((q_index, *found, pair))
+                break
+        else:
+            rows.append(_row(source, rule_key, "pergunta", pair.get("answer"), sample_id, question, "sem template"))
+            continue
+        for field, text in found[2].items():
+            if binding.setdefault(field, text) != text:
+                rows.append(_row(source, rule_key, f"bqa[{q_index}]", pair.get("answer"), sample_id, question,
+                                 f"'{{{field}}}' com textos diferentes na mesma amostra"))
+
+    bindings[rule_key, sample_id] = binding
+    texts = rule_formulas.texts(_identify_equal_sentences(binding))
+    for q_index, v_index, _, _, pair in matched:
+        batch.add(texts["premises"], texts["questions"][q_index][v_index],
+                  _row(source, rule_key, f"bqa[{q_index}][{v_index}]", pair.get("answer"), sample_id, pair.get("question")))
+
+def _expected_conclusion(rule_formulas, binding):
+    # Conclusão renderizada com as sentenças que as perguntas BQA da mesma instância revelaram.
+    try:
+        return capitalize_first(rule_formulas.conclusion_renderer.render(binding))
+    except (KeyError, AttributeError):
+        return None
+
+def _check_mcqa_sample(rule_formulas, sample, batch, rows, source, bindings):
+    rule_key, sample_id = rule_formulas.rule_key, sample.get("id")
+    options, answer = sample.get("options", []), sample.get("answer")
+    if not isinstance(answer, int) or not 0 <= answer < len(options):
+        rows.append(_row(source, rule_key, "answer", None, sample_id, str(answer), "índice de resposta inválido"))
+        return
+    if rule_formulas.conclusion is None:
+        rows.append(_row(source, rule_key, "answer", None, sample_id, options[answer], "regra sem mcqa_correct_conclusion"))
+        return
+    # A instância BQA de mesmo id (mesma linha do log 2b) fixa o texto esperado da opção correta.
+    expected = _expected_conclusion(rule_formulas, bindings.get((rule_key, sample_id), {}))
+    if expected is not None and options[answer] != expected:
+        status = ("resposta aponta para a opção errada" if expected in options
+                  else "opção correta difere da conclusão do template")
+        rows.append(_row(source, rule_key, "answer", expected, sample_id, options[answer], status))
+        return
+    binding = rule_formulas.conclusion[1].match(options[answer])
+    if binding is None:
+        rows.append(_row(source, rule_key, "answer", None, sample_id, options[answer], "opção correta fora do template"))
+        return
+    texts = rule_formulas.texts(_identify_equal_sentences(binding))
+    batch.add(texts["premises"], texts["conclusion"],
+              _row(source, rule_key, "mcqa_correct_conclusion", None, sample_id, options[answer]))
+
+def verify_datasets(formulas, base_dir=DATASETS_DIR, batch=None):
+    """Varre os arquivos BQA e MCQA de `base_dir`; devolve `(número de amostras, linhas sem veredito ainda)`.
+
+    O BQA vem antes: as sentenças de cada instância, capturadas nas perguntas, conferem a
+    opção correta da amostra MCQA de mesmo id.
+    """
+    batch = batch if batch is not None else _VerdictBatch()
+    rows, num_samples, bindings = [], 0, {}
+    for task, check in (("BQA", _check_bqa_sample), ("MCQA", _check_mcqa_sample)):
+        task_dir = Path(base_dir) / task
+        if not task_dir.exists():
+            continue
+        for path in sorted([*task_dir.rglob("data_instances.json"), *task_dir.rglob("data_instances.jsonl")]):
+            rule_key = rule_key_from_path(path, task_dir)
+            if rule_key not in formulas:
+                rows.append(_row(task, rule_key, "arquivo", None, text=str(path), status="regra sem fórmulas"))
+                continue
+            samples = read_samples(path)
+            num_samples += len(samples)
+            for sample in samples:
+                check(formulas[rule_key], sample, batch, rows, task, bindings)
+    return num_samples, rows
+
+def verification_report(include_datasets=True, base_dir=DATASETS_DIR, compiled_rules=COMPILED_RULES):
+    """DataFrame com uma linha por rótulo checado (`status` "ok", "divergente", "indecidível" ou o problema)."""
+    batch = _VerdictBatch()
+    formulas, rows = verify_config(compiled_rules, batch)
+    if include_datasets:
+        num_samples, dataset_rows = verify_datasets(formulas, base_dir, batch)
+        rows += dataset_rows
+        logging.info(f"{num_samples} amostras lidas de '{base_dir}'.")
+    rows += batch.resolve()
+    for row in rows:
+        row.setdefault("entailed", None)
+        row["status"] = _label_status(row)
+    return pd.DataFrame(rows, columns=["source", "rule", "sample_id", "item", "text", "expected", "entailed", "status"])
+
+def summarize(report):
+    """Contagem de rótulos por regra e origem: total checado e total de problemas."""
+    problems = report["status"] != "ok"
+    summary = (report.assign(problem=problems)
+               .groupby(["rule", "source"], sort=True)["problem"].agg(checked="size", problems="sum").reset_index())
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Verificação simbólica dos rótulos dos templates e dos datasets gerados.")
+    parser.add_argument("--datasets-dir", type=Path, default=DATASETS_DIR, help="Pasta com as subpastas BQA e MCQA.")
+    parser.add_argument("--skip-datasets", action="store_true", help="Checa só os templates do config.py.")
+    parser.add_argument("--output", type=Path, help="Grava as divergências em JSON (uma lista de objetos).")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    report = verification_report(not args.skip_datasets, args.datasets_dir)
+    problems = report[report["status"] != "ok"]
+    with pd.option_context("display.width", 160, "display.max_columns", None, "display.max_colwidth", 80):
+        print(summarize(report).to_string(index=False))
+        for rule_key, rule_problems in problems.groupby("rule", sort=True):
+            print(f"\n{rule_key}: {len(rule_problems)} problema(s)")
+            print(rule_problems[["source", "sample_id", "item", "expected", "status", "text"]].head(20).to_string(index=False))
+    if args.output:
+        problems.to_json(args.output, orient="records", force_ascii=False, indent=2)
+        print(f"\nDivergências gravadas em '{args.output}'.")
+    print(f"\n{len(report)} rótulos checados, {len(problems)} com problema.")
+    return 1 if len(problems) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
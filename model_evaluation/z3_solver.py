@@ -0,0 +1,125 @@
+"""
+Checagem de consequência lógica no Z3, no processo atual ou em um pool de processos.
+
+Cada processo do pool tem o seu próprio `z3.Context`, as formalizações são enviadas em blocos
+e cada `check()` tem um tempo limite. Uma checagem que estoura o limite devolve o veredito
+`TIMEOUT_VERDICT` em vez de travar a consolidação.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import z3
+
+from formula import formula_to_z3, parse_formula
+
+DEFAULT_TIMEOUT_MS = 10000
+DEFAULT_CHUNK_SIZE = 64
+TIMEOUT_VERDICT = "unknown/timeout"
+
+def _error(e):
+    return {"z3_result_of_negation": f"Z3_ERROR: {e}", "is_consequence_logic": False}
+
+def _check(solver):
+    result = solver.check()
+    if result == z3.unknown:
+        reason = solver.reason_unknown()
+        verdict = TIMEOUT_VERDICT if reason in ("timeout", "canceled") else f"unknown/{reason}"
+        return {"z3_result_of_negation": verdict, "is_consequence_logic": False}
+    return {
+        "z3_result_of_negation": str(result),
+        "is_consequence_logic": result == z3.unsat
+    }
+
+def solve_entailments(premises, conclusions, ctx=None, timeout_ms=DEFAULT_TIMEOUT_MS):
+    """Vetor de vereditos, um por conclusão, com as premissas declaradas uma única vez.
+
+    Cada conclusão é testada entre `push()` e `pop()`, de modo que o solver reaproveita o que
+    já aprendeu sobre as premissas. Erro nas premissas vale para todas as conclusões.
+    """
+    try:
+        solver = z3.Solver(ctx=ctx)
+        if timeout_ms:
+            solver.set("timeout", int(timeout_ms))
+        vars_map = {}
+        for p_str in premises:
+            solver.add(formula_to_z3(parse_formula(p_str), vars_map, ctx))
+    except Exception as e:
+        return [_error(e) for _ in conclusions]
+
+    results = []
+    for conclusion in conclusions:
+        try:
+            conclusion_expr = formula_to_z3(parse_formula(conclusion), vars_map, ctx)
+        except Exception as e:
+            results.append(_error(e))
+            continue
+        solver.push()
+        try:
+            solver.add(z3.Not(conclusion_expr))
+            results.append(_check(solver))
+        except Exception as e:
+            results.append(_error(e))
+        finally:
+            solver.pop()
+    return results
+
+def solve_consequence(formalization_dict, ctx=None, timeout_ms=DEFAULT_TIMEOUT_MS):
+    """Checa se as premissas implicam a conclusão, testando a satisfatibilidade da negação."""
+    try:
+        premises = list(formalization_dict.get('premises', []))
+        conclusion = formalization_dict.get('conclusion', 'True')
+    except Exception as e:
+        return _error(e)
+    return solve_entailments(premises, [conclusion], ctx, timeout_ms)[0]
+
+_worker_context = None
+
+def _init_worker():
+    # Um Context por processo: o Z3 não compartilha estado entre contextos.
+    global _worker_context
+    _worker_context = z3.Context()
+
+def _solve_chunk(formalization_dicts, timeout_ms):
+    return [solve_consequence(fd, _worker_context, timeout_ms) for fd in formalization_dicts]
+
+def _solve_entailment_chunk(contexts, timeout_ms):
+    return [solve_entailments(premises, conclusions, _worker_context, timeout_ms) for premises, conclusions in contexts]
+
+def _run_in_pool(chunk_function, items, workers, timeout_ms, chunk_size):
+    chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+    results = []
+    with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), initializer=_init_worker) as executor:
+        for chunk_results in executor.map(chunk_function, chunks, [timeout_ms] * len(chunks)):
+            results.extend(chunk_results)
+    return results
+
+def _use_pool(workers, num_items, chunk_size):
+    return workers > 1 and num_items > chunk_size
+
+def solve_consequences(formalization_dicts, workers=None, timeout_ms=DEFAULT_TIMEOUT_MS, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Resultados de `solve_consequence` para um lote, na mesma ordem.
+
+    Com `workers` > 1 (padrão: número de CPUs) e mais de um bloco de trabalho, as checagens
+    rodam em um `ProcessPoolExecutor`; caso contrário, no processo atual.
+    """
+    formalization_dicts = list(formalization_dicts)
+    workers = workers or os.cpu_count() or 1
+    if not _use_pool(workers, len(formalization_dicts), chunk_size):
+        return [solve_consequence(fd, timeout_ms=timeout_ms) for fd in formalization_dicts]
+    return _run_in_pool(_solve_chunk, formalization_dicts, workers, timeout_ms, chunk_size)
+
+def solve_entailment_batches(contexts, workers=None, timeout_ms=DEFAULT_TIMEOUT_MS, chunk_size=DEFAULT_CHUNK_SIZE):
+    """`solve_entailments` para vários contextos `(premissas, conclusões)`; um vetor de vereditos por contexto."""
+    contexts = [(list(premises), list(conclusions)) for premises, conclusions in contexts]
+    workers = workers or os.cpu_count() or 1
+    if not _use_pool(workers, len(contexts), chunk_size):
+        return [solve_entailments(premises, conclusions, timeout_ms=timeout_ms) for premises, conclusions in contexts]
+    return _run_in_pool(_solve_entailment_chunk, contexts, workers, timeout_ms, chunk_size)
+
+def add_z3_arguments(parser):
+    group = parser.add_argument_group("checagem no Z3")
+    group.add_argument("--z3-workers", type=int, default=None, help="Processos do pool do Z3 (padrão: número de CPUs).")
+    group.add_argument("--z3-timeout-ms", type=int, default=DEFAULT_TIMEOUT_MS,
+                       help=f"Tempo limite de cada checagem; ao estourar, o veredito é '{TIMEOUT_VERDICT}'.")
+    group.add_argument("--z3-chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Formalizações por tarefa enviada ao pool.")
+    return parser